@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, got_request_exception
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from flask_migrate import Migrate
@@ -6,6 +6,8 @@ from flask_wtf import CSRFProtect
 import os
 from datetime import datetime
 
+from config import Config
+
 db = SQLAlchemy()
 migrate = Migrate()
 csrf = CSRFProtect()
@@ -17,27 +19,86 @@ ADMIN_USERNAMES = ['jaydenokoeguale']
 def is_admin():
     return current_user.is_authenticated and current_user.username in ADMIN_USERNAMES
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'grades_new.db')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'grades_new.db')
 
     os.makedirs(os.path.join(app.instance_path), exist_ok=True)
 
+    # Leveled logging with per-module levels and request trace ids (see app/tracing.py)
+    from . import tracing
+    tracing.init_app(app)
+
+    # SQLite pragmas and pool settings for the configured SQLITE_PROFILE
+    from .sqlite_profile import configure_app, install_profile
+    profile = configure_app(app)
+
     # Initialize extensions
     db.init_app(app)
+    with app.app_context():
+        install_profile(db.engine, profile)
+
+    # Server-Timing header and per-endpoint timing/SQL aggregates (see app/timing.py)
+    from .timing import request_timing
+    request_timing.init_app(app)
+    with app.app_context():
+        request_timing.instrument(db.engine)
+
+    # Prometheus text-format /metrics, merged across workers via METRICS_DIR (see app/metrics.py)
+    from .metrics import collect_app_metrics, metrics, observe_exception, observe_request
+    metrics.init_app(app)
+    metrics.add_collector(collect_app_metrics)
+    request_timing.add_observer(observe_request)
+    got_request_exception.connect(observe_exception, app)
+
+    # Per-route SQL statement budgets, checked on live requests per QUERY_BUDGET (see app/query_budget.py)
+    from . import query_budget
+    query_budget.init_app(app)
+    request_timing.add_observer(query_budget.check_request)
+
     migrate.init_app(app, db)
     csrf.init_app(app)
 
+    # Buffered activity logging and presence (see app/activity.py, app/presence.py)
+    from .activity import activity_sink
+    from .presence import presence
+    activity_sink.init_app(app)
+    presence.init_app(app)
+    activity_sink.add_flush_hook(presence.flush)
+
+    # Cached admin dashboard totals (see app/counters.py)
+    from .counters import counters
+    counters.init_app(app)
+
+    # Rendered-fragment cache for the dashboard, trends and semesters pages (see app/fragments.py)
+    from .fragments import fragment_cache
+    fragment_cache.init_app(app)
+
     # Register Blueprints
     from .routes import main
     app.register_blueprint(main)
 
+    from .api import api
+    app.register_blueprint(api)
+
+    # Per-user data versions for the API's ETags (see app/versioning.py)
+    from . import versioning
+    versioning.install()
+
+    # CLI commands (flask gpa-report, flask bench-batch-gpa, ...)
+    from .commands import register_commands
+    register_commands(app)
+
     # Setup Flask-Login
     from app.models import User
     login_manager = LoginManager()
     login_manager.login_view = 'main.login'
+    # The JSON API answers 401 instead of redirecting to the login page
+    login_manager.blueprint_login_views['api'] = None
     login_manager.init_app(app)
 
     @login_manager.user_loader
@@ -0,0 +1,175 @@
+"""Buffered activity logging.
+
+track_activity used to insert a UserActivity row and commit on every
+authenticated request. ActivitySink queues the events in memory instead and a
+background thread writes them with one bulk insert per batch, flushing when
+ACTIVITY_BATCH_SIZE events are waiting or ACTIVITY_FLUSH_INTERVAL seconds have
+passed, and once more when the worker exits.
+
+The queue is bounded (ACTIVITY_QUEUE_SIZE). When it is full, ACTIVITY_OVERFLOW
+decides what happens: 'drop' discards the new event, 'block' waits up to
+ACTIVITY_BLOCK_TIMEOUT seconds for room before dropping it.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+
+class ActivitySink:
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = None
+        self.dropped = 0
+        self.written = 0
+        self.flush_hooks = []
+        self._thread = None
+        self._pid = None
+        self._registered = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ACTIVITY_ASYNC', True)
+        app.config.setdefault('ACTIVITY_BATCH_SIZE', 200)
+        app.config.setdefault('ACTIVITY_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('ACTIVITY_QUEUE_SIZE', 10000)
+        app.config.setdefault('ACTIVITY_OVERFLOW', 'drop')
+        app.config.setdefault('ACTIVITY_BLOCK_TIMEOUT', 0.05)
+
+        self.app = app
+        self.batch_size = app.config['ACTIVITY_BATCH_SIZE']
+        self.interval = app.config['ACTIVITY_FLUSH_INTERVAL']
+        self.overflow = app.config['ACTIVITY_OVERFLOW']
+        self.block_timeout = app.config['ACTIVITY_BLOCK_TIMEOUT']
+        self.asynchronous = app.config['ACTIVITY_ASYNC']
+        self.queue = queue.Queue(maxsize=app.config['ACTIVITY_QUEUE_SIZE'])
+        if not self._registered:
+            atexit.register(self.shutdown)
+            self._registered = True
+
+    def add_flush_hook(self, hook):
+        """Run hook() inside every flush, in the same transaction as the inserts."""
+        if hook not in self.flush_hooks:
+            self.flush_hooks.append(hook)
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def record(self, user_id, action, ip_address=None, user_agent=None, details=None):
+        """Queue one activity event; never touches the database on the caller's thread."""
+        event = {
+            'user_id': user_id,
+            'action': action,
+            'timestamp': datetime.utcnow(),
+            'ip_address': ip_address,
+            'user_agent': user_agent[:200] if user_agent else user_agent,
+            'details': details
+        }
+        try:
+            if self.overflow == 'block':
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        if not self.asynchronous:
+            self.flush()
+        else:
+            self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-sink', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.interval
+            while self.queue.qsize() < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, 0.1))
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Failed to write activity batch')
+
+    def _drain(self):
+        events = []
+        while len(events) < self.batch_size:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def flush(self):
+        """Write everything currently queued, one bulk insert per batch."""
+        from app import db
+        from app.counters import counters
+        from app.models import UserActivity
+
+        with self._flush_lock:
+            while True:
+                events = self._drain()
+                hooks_due = bool(self.flush_hooks)
+                if not events and not hooks_due:
+                    return
+                with self.app.app_context():
+                    if events:
+                        self._detach_deleted_users(events)
+                        db.session.execute(insert(UserActivity), events)
+                    for hook in self.flush_hooks:
+                        hook()
+                    db.session.commit()
+                if events:
+                    counters.record_activity([event['timestamp'] for event in events])
+                self.written += len(events)
+                if len(events) < self.batch_size:
+                    return
+
+    @staticmethod
+    def _detach_deleted_users(events):
+        # A user can be deleted while their events are still queued; keep the
+        # events without the user, as deleting a user does for stored activity
+        from app import db
+        from app.models import User
+
+        user_ids = {event['user_id'] for event in events if event['user_id'] is not None}
+        if not user_ids:
+            return
+        existing = set(db.session.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+        for event in events:
+            if event['user_id'] not in existing:
+                event['user_id'] = None
+
+    def shutdown(self):
+        """Stop the background thread and write whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        if self.queue is not None and not self.queue.empty():
+            self.flush()
+
+
+activity_sink = ActivitySink()
@@ -0,0 +1,89 @@
+"""The admin dashboard's user table.
+
+user_page() returns one page of users in a single SELECT: each user's grade
+count, semester count and last activity come from correlated subqueries that
+are answered from the (user_id, ...) indexes, so a page costs the same
+however many accounts or activity rows exist. Pages are keyset-paginated:
+the cursor is the (sort value, id) of the last row shown, and the next page
+starts strictly after it (see app/keyset.py).
+
+Every sort is on an indexed column, so only the page's own rows are read and
+their subqueries run. Users never seen (NULL last_seen) sort first ascending
+and last descending; a page that reaches them takes a second query. There is
+no sort on grade count: it is computed per row and cannot be indexed.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app import db
+from app.keyset import decode_cursor, encode_cursor, range_query, ranges
+from app.models import Grade, Semester, User, UserActivity
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SORTS = ('username', 'last_seen', 'id')
+
+UserRow = namedtuple('UserRow', 'id username is_admin is_online last_seen grade_count semester_count last_activity')
+UserPage = namedtuple('UserPage', 'rows next_cursor sort direction search')
+
+
+def _columns():
+    grade_count = select(func.count(Grade.id)).where(Grade.user_id == User.id).scalar_subquery()
+    semester_count = select(func.count(Semester.id)).where(Semester.user_id == User.id).scalar_subquery()
+    last_activity = select(func.max(UserActivity.timestamp)).where(UserActivity.user_id == User.id).scalar_subquery()
+    return grade_count, semester_count, last_activity
+
+
+def _datetime(value):
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def _sort_key(sort):
+    """(SQL expression, cursor value parser, nullable) for a sort name."""
+    if sort == 'username':
+        return User.username, str, False
+    if sort == 'last_seen':
+        return User.last_seen, _datetime, True
+    return User.id, int, False
+
+
+def page_statement(sort='username', direction='asc', search=None, position=None, never_seen=False,
+                   limit=PAGE_SIZE):
+    """The query for one range of a page: users after position, seen or (never_seen=True) not."""
+    key, _, nullable = _sort_key(sort)
+    stmt = select(User.id, User.username, User.is_admin, User.is_online, User.last_seen, *_columns(), key)
+
+    if search:
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        stmt = stmt.where(User.username.ilike(f'%{escaped}%', escape='\\'))
+
+    return range_query(stmt, key, User.id, direction, never_seen, position, nullable).limit(limit)
+
+
+def user_page(sort='username', direction='asc', search=None, cursor=None, limit=PAGE_SIZE):
+    if sort not in SORTS:
+        sort = 'username'
+    direction = 'desc' if direction == 'desc' else 'asc'
+    limit = max(1, min(int(limit or PAGE_SIZE), MAX_PAGE_SIZE))
+
+    _, parse, nullable = _sort_key(sort)
+    position = decode_cursor(cursor, parse)
+
+    # One extra row tells us whether there is a next page
+    results = []
+    for never_seen, start in ranges(direction, position, nullable):
+        results += db.session.execute(
+            page_statement(sort, direction, search, start, never_seen, limit + 1 - len(results))
+        ).all()
+        if len(results) > limit:
+            break
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor(last[-1], last.id)
+
+    rows = [UserRow(*result[:-1]) for result in results]
+    return UserPage(rows, next_cursor, sort, direction, search or '')
@@ -0,0 +1,238 @@
+"""Read-only JSON API (/api/v1) for grades, semesters, settings and GPA.
+
+Every response carries a strong ETag built from the user's data_version (see
+app/versioning.py), the resource and its query string. A request whose
+If-None-Match matches gets 304 Not Modified before any data is loaded or GPA
+computed; the only query is the login user load every request already makes.
+"""
+import hashlib
+from functools import wraps
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user, login_required
+
+from app import db, grade_list, summary, sync
+from app.gpa import GpaPolicy, get_letter_grade
+from app.models import Grade, Semester, SemesterGpaSummary, UserSettings
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+API_VERSION = 1
+
+
+def etag_for(resource, user=None):
+    user = user or current_user
+    args = hashlib.sha1(request.query_string).hexdigest()[:8]
+    return f'v{API_VERSION}-{resource}-{user.id}-{user.data_version}-{args}'
+
+
+def versioned(resource):
+    """Serve the view's JSON with a data_version ETag and answer matching revalidations with 304."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tag = etag_for(resource)
+            if request.if_none_match.contains(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = jsonify(view(*args, **kwargs))
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def grade_data(grade, grade_format):
+    data = grade.to_dict()
+    data['letter'] = get_letter_grade(grade.grade, grade_format)
+    data['semester'] = grade.semester.name if grade.semester else None
+    return data
+
+
+def semester_data(user):
+    """The user's semesters with their GPA totals, in start-date order."""
+    summary.get_summary(user)
+    stmt = (
+        db.select(Semester, SemesterGpaSummary)
+        .outerjoin(SemesterGpaSummary, SemesterGpaSummary.semester_id == Semester.id)
+        .where(Semester.user_id == user.id)
+        .order_by(Semester.start_date, Semester.id)
+    )
+    return [
+        {
+            'id': semester.id,
+            'name': semester.name,
+            'start_date': semester.start_date.strftime('%Y-%m-%d') if semester.start_date else None,
+            'grade_count': totals.grade_count if totals else 0,
+            'gpa': totals.gpa if totals and totals.grade_count else None,
+            'cumulative_gpa': totals.cumulative_gpa if totals else None
+        }
+        for semester, totals in db.session.execute(stmt).all()
+    ]
+
+
+def settings_data(user):
+    policy = GpaPolicy.from_user(user)
+    user_settings = UserSettings.query.filter_by(user_id=user.id).first()
+    return {
+        'gpa_scale': policy.gpa_scale,
+        'grade_format': policy.grade_format,
+        'use_credit_hours': policy.use_credit_hours,
+        'gpa_cap': policy.gpa_cap,
+        'letter_values': policy.letter_values,
+        'weights': policy.weights,
+        'default_course_type': user_settings.default_course_type if user_settings else 'Regular',
+        'default_grade_type': user_settings.default_grade_type if user_settings else 'number'
+    }
+
+
+def gpa_data(user):
+    user_summary = summary.get_summary(user)
+    return {
+        'gpa': user_summary.gpa if user_summary.grade_count else None,
+        'average': user_summary.average,
+        'grade_count': user_summary.grade_count,
+        'total_credits': user_summary.total_credits
+    }
+
+
+@api.errorhandler(400)
+def bad_request(error):
+    return jsonify({'error': 'Bad request'}), 400
+
+
+@api.errorhandler(401)
+def unauthorized(error):
+    return jsonify({'error': 'Authentication required'}), 401
+
+
+@api.errorhandler(404)
+def not_found(error):
+    return jsonify({'error': 'Not found'}), 404
+
+
+@api.errorhandler(410)
+def gone(error):
+    # The client's version predates the change journal; it has to fetch everything again
+    return jsonify({
+        'error': 'Changes since this version are no longer available',
+        'resync': True,
+        'data_version': current_user.data_version
+    }), 410
+
+
+@api.route('/version')
+@login_required
+def version():
+    """The current data_version, for clients that poll for changes."""
+    return jsonify({'data_version': current_user.data_version})
+
+
+@api.route('/grades')
+@login_required
+@versioned('grades')
+def grades():
+    page = grade_list.grade_page(
+        current_user,
+        sort=request.args.get('sort', 'date'),
+        direction=request.args.get('dir', 'desc'),
+        cursor=request.args.get('after'),
+        limit=request.args.get('limit', type=int)
+    )
+    grade_format = current_user.grade_format or 'plus_minus'
+    return {
+        'data_version': current_user.data_version,
+        'grades': [grade_data(grade, grade_format) for grade in page.grades],
+        'next_cursor': page.next_cursor,
+        'sort': page.sort,
+        'dir': page.direction
+    }
+
+
+@api.route('/grades/<int:grade_id>')
+@login_required
+@versioned('grade')
+def grade(grade_id):
+    grade = Grade.query.filter_by(id=grade_id, user_id=current_user.id).first_or_404()
+    return {
+        'data_version': current_user.data_version,
+        'grade': grade_data(grade, current_user.grade_format or 'plus_minus')
+    }
+
+
+@api.route('/semesters')
+@login_required
+@versioned('semesters')
+def semesters():
+    return {
+        'data_version': current_user.data_version,
+        'semesters': semester_data(current_user)
+    }
+
+
+@api.route('/settings')
+@login_required
+@versioned('settings')
+def settings():
+    return {
+        'data_version': current_user.data_version,
+        'settings': settings_data(current_user)
+    }
+
+
+@api.route('/gpa')
+@login_required
+@versioned('gpa')
+def gpa():
+    return {
+        'data_version': current_user.data_version,
+        **gpa_data(current_user)
+    }
+
+
+@api.route('/trends')
+@login_required
+@versioned('trends')
+def trends():
+    labels, values = summary.trend_series(current_user)
+    return {
+        'data_version': current_user.data_version,
+        'labels': labels,
+        'values': values
+    }
+
+
+@api.route('/changes')
+@login_required
+@versioned('changes')
+def changes():
+    """Records changed since the client's data_version, plus the recomputed GPA."""
+    since = request.args.get('since', type=int)
+    if since is None:
+        abort(400)
+    if not sync.can_sync(current_user, since):
+        abort(410)
+
+    changed = sync.changes_since(current_user, since)
+    grade_format = current_user.grade_format or 'plus_minus'
+    semesters = semester_data(current_user)
+    return {
+        'data_version': current_user.data_version,
+        'since': since,
+        'grades': {
+            'upserted': [grade_data(grade, grade_format) for grade in changed.grades],
+            'deleted': changed.deleted_grades
+        },
+        'semesters': {
+            'upserted': [semester for semester in semesters if semester['id'] in changed.semester_ids],
+            'deleted': changed.deleted_semesters
+        },
+        'settings': settings_data(current_user) if changed.settings else None,
+        # Any grade change can move every semester's GPA, so these are always sent in full
+        'gpa': gpa_data(current_user),
+        'semester_gpas': [
+            {key: semester[key] for key in ('id', 'grade_count', 'gpa', 'cumulative_gpa')}
+            for semester in semesters
+        ]
+    }
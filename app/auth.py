@@ -24,11 +24,19 @@ def login():
 
         login_user(user)
 
-        # Migrate guest grades from session into DB
+        # Migrate guest grades from session into DB, skipping ones the user already has
         guest_grades = session.pop('guest_grades', [])
+        existing = set()
+        if guest_grades:
+            existing = set(
+                db.session.query(Grade.subject, Grade.date)
+                .filter(Grade.user_id == user.id, Grade.subject.in_([g['subject'] for g in guest_grades]))
+                .all()
+            )
         for g in guest_grades:
-            existing = Grade.query.filter_by(user_id=user.id, subject=g['subject'], date=datetime.fromisoformat(g['date'])).first()
-            if not existing:
+            key = (g['subject'], datetime.fromisoformat(g['date']).date())
+            if key not in existing:
+                existing.add(key)
                 new_grade = Grade(
                     subject=g['subject'],
                     grade=g['grade'],
@@ -0,0 +1,291 @@
+"""Logical backup and restore of the whole database as gzipped NDJSON.
+
+`flask backup` writes every table the models define into one .ndjson.gz
+file, in foreign-key dependency order: users first, then their settings,
+semesters, grades, activity, journal and GPA summaries. The file holds:
+- a header line: format, version, creation time, alembic revision, tables
+- per table, a line naming the table and its columns
+- one JSON array per row, in primary-key order
+- a closing line with the row count, so a truncated file is detected on restore
+
+Rows are read with stream_results/yield_per and written one partition at a
+time, so tables of millions of activity rows never sit in memory. On SQLite
+every table is read inside one read transaction, so the tables agree with
+each other even while the app keeps writing.
+
+`flask restore` loads a backup into the configured database in the same
+order, with executemany batches of --chunk-size rows, all in one
+transaction. The target must be empty unless --replace is given, which
+deletes the existing rows first. On SQLite the secondary indexes are
+dropped before loading and created again once all rows are in, which is
+much cheaper than updating them row by row. If anything fails, the
+rollback restores both the data and the indexes.
+
+Rows are written with Core, so the versioning hooks do not run; restore
+calls versioning.bump() and sync.journal() itself. Every restored user gets
+a new data_version, above the version they had before the restore. Their
+journal_floor is raised to it, so a syncing client resyncs in full instead
+of applying deltas against data that was replaced.
+"""
+import gzip
+import json
+import time
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from app import db, sync, versioning
+from app.models import User
+
+FORMAT = 'gradepilot-backup'
+FORMAT_VERSION = 1
+CHUNK_SIZE = 5000
+# Users per data_version bump; keeps the IN list well below SQLite's parameter limit
+USER_CHUNK = 500
+
+
+class BackupError(ValueError):
+    """The backup file cannot be restored into this database."""
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot back up {type(value).__name__} values")
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=_encode)
+
+
+def _decoder(column):
+    """A function turning a column's backed-up JSON value back into a Python value, or None if none is needed."""
+    python_type = None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        pass
+    if python_type is datetime:
+        return datetime.fromisoformat
+    if python_type is date:
+        return date.fromisoformat
+    return None
+
+
+def tables():
+    """The models' tables in foreign-key dependency order."""
+    return db.metadata.sorted_tables
+
+
+def _revision(conn):
+    if not inspect(conn).has_table('alembic_version'):
+        return None
+    return conn.execute(text('SELECT version_num FROM alembic_version')).scalar()
+
+
+def _timed(progress, name, rows, started):
+    if progress is not None:
+        progress(name, rows, time.perf_counter() - started)
+
+
+def backup_database(path, chunk_size=CHUNK_SIZE, progress=None):
+    """Write every table to a gzipped NDJSON file; returns {table: rows}.
+
+    progress(table, rows, seconds) is called after each table.
+    """
+    counts = {}
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # pysqlite opens no transaction for SELECTs; without one each table is a different snapshot
+            conn.exec_driver_sql('BEGIN')
+        with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as out:
+            out.write(_encoder.encode({
+                'format': FORMAT,
+                'version': FORMAT_VERSION,
+                'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                'revision': _revision(conn),
+                'tables': [table.name for table in tables()],
+            }) + '\n')
+            for table in tables():
+                started = time.perf_counter()
+                columns = [column.name for column in table.columns]
+                out.write(_encoder.encode({'table': table.name, 'columns': columns}) + '\n')
+                result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                    select(table).order_by(*table.primary_key.columns)
+                )
+                rows = 0
+                for partition in result.partitions():
+                    out.write('\n'.join(_encoder.encode(list(row)) for row in partition) + '\n')
+                    rows += len(partition)
+                out.write(_encoder.encode({'end': table.name, 'rows': rows}) + '\n')
+                counts[table.name] = rows
+                _timed(progress, table.name, rows, started)
+        conn.rollback()
+    return counts
+
+
+def read_header(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return _header(f)
+
+
+def _header(lines):
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, ValueError, OSError, EOFError):
+        raise BackupError("Not a backup file.")
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise BackupError("Not a backup file.")
+    if header.get('version') != FORMAT_VERSION:
+        raise BackupError(f"Backup format version {header.get('version')} is not supported.")
+    return header
+
+
+def _sections(lines):
+    """(table name, columns, iterator of row lists) for each table section of a backup."""
+    for line in lines:
+        marker = json.loads(line)
+        if not isinstance(marker, dict) or 'table' not in marker:
+            raise BackupError("Malformed backup: expected a table header.")
+        end = {}
+
+        def rows(name=marker['table']):
+            count = 0
+            for line in lines:
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    if row.get('end') != name or row.get('rows') != count:
+                        raise BackupError(f"Malformed backup: table {name} does not end after {count} rows.")
+                    end['seen'] = True
+                    return
+                count += 1
+                yield row
+            raise BackupError(f"Backup is truncated inside table {name}.")
+
+        yield marker['table'], marker['columns'], rows()
+        if not end:
+            raise BackupError(f"Table {marker['table']} was not read to its end.")
+
+
+def _deferred_indexes(conn, table_names):
+    """Drop the secondary indexes of the given tables; returns the SQL that recreates them."""
+    if conn.dialect.name != 'sqlite':
+        return []
+    indexes = conn.execute(
+        text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+             "AND tbl_name IN :tables").bindparams(bindparam('tables', expanding=True)),
+        {'tables': list(table_names)}
+    ).all()
+    for name, _ in indexes:
+        conn.exec_driver_sql(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def _bump_restored(session, user_ids, previous_versions):
+    """Give every restored user a data_version above any they had and force a full resync."""
+    users = User.__table__
+    if previous_versions:
+        session.execute(
+            update(users)
+            .where(users.c.id == bindparam('user_id'), users.c.data_version < bindparam('previous'))
+            .values(data_version=bindparam('previous')),
+            [{'user_id': user_id, 'previous': version} for user_id, version in previous_versions.items()]
+        )
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = user_ids[start:start + USER_CHUNK]
+        versions = versioning.bump(*chunk, session=session)
+        sync.journal([(user_id, 'settings', user_id, 'upsert') for user_id in chunk], versions, session=session)
+        session.execute(
+            update(users).where(users.c.id.in_(chunk)).values(journal_floor=users.c.data_version)
+        )
+
+
+def restore_database(path, chunk_size=CHUNK_SIZE, replace=False, progress=None):
+    """Load a backup into the configured database; returns {table: rows}.
+
+    Raises BackupError if the file is not a complete backup for these tables,
+    or the database is not empty and replace is False. progress(table, rows,
+    seconds) is called after each table, and with 'indexes' once they are rebuilt.
+    """
+    with db.engine.connect() as conn:
+        sqlite = conn.dialect.name == 'sqlite'
+        if sqlite:
+            # Rebuilding an index sorts all its rows; let the sort spill to disk rather than
+            # hold it in memory (the pragma cannot change inside the transaction)
+            temp_store = conn.exec_driver_sql('PRAGMA temp_store').scalar()
+            conn.exec_driver_sql('PRAGMA temp_store = FILE')
+            conn.commit()
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as lines:
+                with conn.begin():
+                    return _restore(conn, lines, chunk_size, replace, progress)
+        except BackupError:
+            raise
+        except (ValueError, EOFError, OSError) as exc:
+            raise BackupError(f"Cannot read backup: {exc}") from exc
+        finally:
+            if sqlite:
+                conn.exec_driver_sql(f'PRAGMA temp_store = {int(temp_store)}')
+                conn.commit()
+
+
+def _restore(conn, lines, chunk_size, replace, progress):
+    header = _header(lines)
+    by_name = {table.name: table for table in tables()}
+    unknown = [name for name in header['tables'] if name not in by_name]
+    if unknown:
+        raise BackupError(f"Backup has tables this database does not: {', '.join(unknown)}.")
+    revision = _revision(conn)
+    if revision and header.get('revision') and revision != header['revision']:
+        raise BackupError(f"Backup was made at revision {header['revision']}, "
+                          f"the database is at {revision}; upgrade or downgrade first.")
+
+    previous_versions = {}
+    if any(conn.execute(select(table).limit(1)).first() is not None for table in tables()):
+        if not replace:
+            raise BackupError("The database is not empty; use --replace to overwrite it.")
+        previous_versions = dict(conn.execute(select(User.id, User.data_version)).all())
+        for table in reversed(tables()):
+            conn.execute(table.delete())
+
+    recreate = _deferred_indexes(conn, header['tables'])
+    counts = {}
+    user_ids = []
+    for name, columns, rows in _sections(lines):
+        table = by_name.get(name)
+        if table is None:
+            raise BackupError(f"Backup has a table this database does not: {name}.")
+        missing = [column for column in columns if column not in table.c]
+        if missing:
+            raise BackupError(f"Table {name} has no columns {', '.join(missing)}.")
+        decoders = [(i, decoder) for i, decoder in
+                    ((i, _decoder(table.c[column])) for i, column in enumerate(columns)) if decoder]
+        started = time.perf_counter()
+        insert = table.insert()
+        batch = []
+        count = 0
+        for row in rows:
+            for i, decode in decoders:
+                if row[i] is not None:
+                    row[i] = decode(row[i])
+            batch.append(dict(zip(columns, row)))
+            if len(batch) >= chunk_size:
+                conn.execute(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.execute(insert, batch)
+            count += len(batch)
+        if table is User.__table__:
+            user_ids = list(conn.execute(select(table.c.id).order_by(table.c.id)).scalars())
+        counts[name] = count
+        _timed(progress, name, count, started)
+
+    started = time.perf_counter()
+    for sql in recreate:
+        conn.exec_driver_sql(sql)
+    _timed(progress, 'indexes', len(recreate), started)
+
+    with Session(bind=conn) as session:
+        _bump_restored(session, user_ids, previous_versions)
+    return counts
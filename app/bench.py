@@ -0,0 +1,188 @@
+"""Benchmarks for the hot routes and the GPA functions.
+
+run_benchmarks() seeds a throwaway database (app/seed.py) and measures:
+- the dashboard, semesters, trends, grade-page and admin dashboard routes.
+  Requests go through the Flask test client, logged in as a sample of the
+  seeded users in turn.
+- calculate_gpa, calculate_cumulative_gpa and get_letter_grade, called
+  directly on each sampled user's grades inside a request context.
+
+For each it reports p50/p95/mean/max wall time. For routes it also reports
+the SQL statements per request, counted as app/query_budget.py does.
+`flask bench` prints the results. It can save them as JSON and compare
+them with a run saved earlier, e.g. on the previous commit.
+
+Route numbers include the rendered-fragment cache (app/fragments.py) as
+configured. Most repeat requests are hits; with --no-fragment-cache every
+request renders in full.
+"""
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+
+from app import db
+
+ROUTES = (
+    ('main.index', '/'),
+    ('main.semesters', '/semesters'),
+    ('main.trends', '/trends'),
+    ('main.grades_page', '/grades/page'),
+    ('main.admin_dashboard', '/admin'),
+)
+FUNCTIONS = ('calculate_gpa', 'calculate_cumulative_gpa', 'get_letter_grade')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(seconds, statements=None):
+    times = [s * 1000 for s in seconds]
+    result = {
+        'samples': len(times),
+        'p50_ms': round(percentile(times, 50), 4),
+        'p95_ms': round(percentile(times, 95), 4),
+        'mean_ms': round(sum(times) / len(times), 4) if times else 0.0,
+        'max_ms': round(max(times), 4) if times else 0.0,
+    }
+    if statements is not None:
+        result['statements_mean'] = round(sum(statements) / len(statements), 2) if statements else 0.0
+        result['statements_max'] = max(statements) if statements else 0
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _login(app, username, password):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username} ({response.status_code})")
+    return client
+
+
+def bench_routes(app, clients, admin_client, requests):
+    """{endpoint: summary} over `requests` requests per route, rotating through clients."""
+    from app.query_budget import measure
+
+    results = {}
+    for endpoint, path in ROUTES:
+        pool = [admin_client] if endpoint == 'main.admin_dashboard' else clients
+        seconds, statements = [], []
+        for i in range(requests):
+            started = time.perf_counter()
+            response, _, executed = measure(pool[i % len(pool)], 'GET', path)
+            seconds.append(time.perf_counter() - started)
+            statements.append(len(executed))
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} answered {response.status_code}")
+        results[endpoint] = summarize(seconds, statements)
+    return results
+
+
+def bench_functions(app, user_ids, repeat):
+    """{function: summary}; one sample is one call on one user's grades."""
+    from flask_login import login_user
+
+    from app.gpa import current_policy, get_letter_grade
+    from app.models import Grade, Semester, User
+    from app.routes import calculate_cumulative_gpa, calculate_gpa
+
+    seconds = {name: [] for name in FUNCTIONS}
+    for user_id in user_ids:
+        with app.test_request_context():
+            user = db.session.get(User, user_id)
+            login_user(user)
+            grades = Grade.query.filter_by(user_id=user_id).all()
+            semesters = Semester.query.filter_by(user_id=user_id).order_by(Semester.start_date).all()
+            scores = [grade.grade for grade in grades]
+            grade_format = current_policy().grade_format
+            for _ in range(repeat):
+                started = time.perf_counter()
+                calculate_gpa(grades)
+                seconds['calculate_gpa'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                calculate_cumulative_gpa(semesters, grades)
+                seconds['calculate_cumulative_gpa'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                for score in scores:
+                    get_letter_grade(score, grade_format)
+                seconds['get_letter_grade'].append(time.perf_counter() - started)
+    return {name: summarize(values) for name, values in seconds.items()}
+
+
+def run_benchmarks(users=200, semesters=6, grades=30, requests=50, sample=10, repeat=20,
+                   seed=0, fragment_cache=True):
+    """Seed a throwaway database and benchmark it; returns the JSON-ready results."""
+    from app.models import User
+    from app.seed import ADMIN_USERNAME, seed_database, temporary_app
+
+    config = {} if fragment_cache else {'FRAGMENT_CACHE_BACKEND': 'null'}
+    password = 'bench-password'
+    with temporary_app(config) as app:
+        started = time.perf_counter()
+        with app.app_context():
+            counts = seed_database(users, semesters, grades, seed=seed, prefix='bench',
+                                   password=password, admin=True)
+            rows = User.query.filter(User.username != ADMIN_USERNAME).with_entities(User.id, User.username).all()
+        seed_seconds = time.perf_counter() - started
+
+        sampled = random.Random(seed).sample(rows, min(sample, len(rows)))
+        clients = [_login(app, username, password) for _, username in sampled]
+        admin_client = _login(app, ADMIN_USERNAME, password)
+        route_results = bench_routes(app, clients, admin_client, requests)
+        function_results = bench_functions(app, [user_id for user_id, _ in sampled], repeat)
+
+    return {
+        'created': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'params': {
+            'users': users, 'semesters': semesters, 'grades': grades, 'requests': requests,
+            'sample': sample, 'repeat': repeat, 'seed': seed, 'fragment_cache': fragment_cache,
+        },
+        'seeded': dict(counts, seconds=round(seed_seconds, 3)),
+        'routes': route_results,
+        'functions': function_results,
+    }
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(previous, current):
+    """(section, name, metric, before, after, change %) for every p50/p95 and statement count."""
+    for section in ('routes', 'functions'):
+        for name, after in current.get(section, {}).items():
+            before = previous.get(section, {}).get(name)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'statements_max'):
+                if metric not in after or metric not in before:
+                    continue
+                old, new = before[metric], after[metric]
+                change = (new - old) / old * 100 if old else 0.0
+                yield section, name, metric, old, new, change
@@ -0,0 +1,478 @@
+import os
+import random
+import time
+
+import click
+from flask.cli import with_appcontext
+
+
+class SyntheticGrade:
+    """Stand-in for a Grade row when benchmarking without a database."""
+    __slots__ = ('grade', 'course_type', 'credit_hours', 'semester_id')
+
+    def __init__(self, grade, course_type, credit_hours):
+        self.grade = grade
+        self.course_type = course_type
+        self.credit_hours = credit_hours
+        self.semester_id = None
+
+
+def random_policy(rng):
+    from app.gpa import GpaPolicy, LETTER_FIELDS, PLUS_MINUS_POINTS
+
+    return GpaPolicy(
+        gpa_scale=rng.choice(['standard', 'weighted_5', 'weighted_6', 'college_plus_minus', 'custom']),
+        grade_format=rng.choice(['plus_minus', 'simple']),
+        letter_values={letter: PLUS_MINUS_POINTS[letter] for letter, _ in LETTER_FIELDS},
+        weights={'Regular': 0.0, 'Honors': 0.5, 'AP': 1.0, 'IB': 1.0, 'DE': 1.0},
+        gpa_cap=rng.choice([None, 4.0, 5.0, 6.0]),
+        use_credit_hours=rng.random() < 0.5
+    )
+
+
+@click.command('gpa-report')
+@click.option('--limit', default=20, show_default=True, help='Number of users to print.')
+@with_appcontext
+def gpa_report_command(limit):
+    """Print weighted/unweighted GPA for every user using the batch evaluator."""
+    from app.gpa_batch import batch_gpa_for_users
+    from app.models import User
+
+    started = time.perf_counter()
+    gpas = batch_gpa_for_users()
+    elapsed = time.perf_counter() - started
+
+    usernames = dict(User.query.with_entities(User.id, User.username).all())
+    for user_id, (weighted, unweighted) in list(gpas.items())[:limit]:
+        click.echo(f"{usernames.get(user_id, user_id)}: weighted {weighted:.2f}, unweighted {unweighted:.2f}")
+    if gpas:
+        mean = sum(w for w, _ in gpas.values()) / len(gpas)
+        click.echo(f"{len(gpas)} users, mean weighted GPA {mean:.2f} ({elapsed:.3f}s)")
+
+
+@click.command('bench-batch-gpa')
+@click.option('--users', default=10000, show_default=True)
+@click.option('--grades', default=40, show_default=True, help='Grades per user.')
+@click.option('--seed', default=0, show_default=True)
+def bench_batch_gpa_command(users, grades, seed):
+    """Compare per-user GpaPolicy.evaluate() with the NumPy batch evaluator."""
+    import numpy as np
+    from app.gpa import COURSE_TYPES
+    from app.gpa_batch import GradeColumns, batch_gpa
+
+    rng = random.Random(seed)
+    policies = [random_policy(rng) for _ in range(users)]
+    course_types = list(COURSE_TYPES) + ['Other']
+    per_user = [
+        [SyntheticGrade(round(rng.uniform(40, 100), 1), rng.choice(course_types), rng.choice([0.5, 1.0, 3.0, 4.0]))
+         for _ in range(grades)]
+        for _ in range(users)
+    ]
+
+    started = time.perf_counter()
+    expected = {}
+    for user_id, (policy, user_grades) in enumerate(zip(policies, per_user)):
+        expected[user_id] = (policy.evaluate(user_grades).gpa,
+                             policy.without_weights().evaluate(user_grades).gpa)
+    loop_time = time.perf_counter() - started
+
+    codes = {ctype: code for code, ctype in enumerate(COURSE_TYPES)}
+    flat = [g for user_grades in per_user for g in user_grades]
+    columns = GradeColumns(
+        user_ids=np.arange(users),
+        user_index=np.repeat(np.arange(users), grades),
+        grade=np.array([g.grade for g in flat], dtype=np.float64),
+        course_type_code=np.array([codes.get(g.course_type, len(COURSE_TYPES)) for g in flat], dtype=np.int64),
+        credit_hours=np.array([g.credit_hours for g in flat], dtype=np.float64)
+    )
+
+    started = time.perf_counter()
+    actual = batch_gpa(policies, columns)
+    batch_time = time.perf_counter() - started
+
+    mismatches = sum(1 for user_id in expected if expected[user_id] != actual[user_id])
+    click.echo(f"{users} users x {grades} grades")
+    click.echo(f"per-user loop: {loop_time:.3f}s")
+    click.echo(f"numpy batch:   {batch_time:.3f}s ({loop_time / batch_time:.1f}x)")
+    click.echo(f"mismatches:    {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def users_for(username):
+    from app.models import User
+
+    query = User.query.order_by(User.id)
+    if username:
+        query = query.filter_by(username=username)
+    return query.all()
+
+
+@click.command('rebuild-gpa-summaries')
+@click.option('--user', 'username', default=None, help='Only rebuild this user.')
+@with_appcontext
+def rebuild_gpa_summaries_command(username):
+    """Recompute every user's materialized GPA summary from their grades."""
+    from app import db, summary
+
+    count = 0
+    for user in users_for(username):
+        summary.rebuild_summary(user)
+        count += 1
+    db.session.commit()
+    click.echo(f"Rebuilt GPA summaries for {count} users.")
+
+
+@click.command('check-gpa-summaries')
+@click.option('--user', 'username', default=None, help='Only check this user.')
+@click.option('--fix', is_flag=True, help='Rebuild summaries that do not match.')
+@with_appcontext
+def check_gpa_summaries_command(username, fix):
+    """Diff each stored GPA summary against a full recompute."""
+    from app import db, summary
+
+    bad = 0
+    for user in users_for(username):
+        problems = summary.check_summary(user)
+        if not problems:
+            continue
+        bad += 1
+        for problem in problems:
+            click.echo(f"{user.username}: {problem}")
+        if fix:
+            summary.rebuild_summary(user)
+    if fix:
+        db.session.commit()
+    click.echo(f"{bad} users with inconsistent summaries.")
+    if bad and not fix:
+        raise SystemExit(1)
+
+
+@click.command('compact-activity')
+@click.option('--days', type=int, default=None, help='Keep this many days of raw activity (default ACTIVITY_RETENTION_DAYS).')
+@click.option('--chunk-size', type=int, default=None, help='Rows per delete/commit (default ACTIVITY_COMPACT_CHUNK).')
+@with_appcontext
+def compact_activity_command(days, chunk_size):
+    """Roll old UserActivity rows into daily counts and delete them."""
+    from app.retention import compact_activity, retention_cutoff
+
+    started = time.perf_counter()
+    rows, chunks = compact_activity(days, chunk_size)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Compacted {rows} activity rows older than {retention_cutoff(days):%Y-%m-%d} "
+               f"in {chunks} chunks ({elapsed:.2f}s).")
+
+
+@click.command('compact-journal')
+@click.option('--days', type=int, default=None, help='Keep this many days of change journal (default JOURNAL_RETENTION_DAYS).')
+@with_appcontext
+def compact_journal_command(days):
+    """Drop superseded and expired delta-sync journal entries."""
+    from app.sync import compact_journal
+
+    started = time.perf_counter()
+    superseded, expired, users = compact_journal(days)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Dropped {superseded} superseded and {expired} expired journal entries; "
+               f"raised the sync floor for {users} users ({elapsed:.2f}s).")
+
+
+def _bench_writer(path, profile_name, writes, start, results):
+    """One writer process for bench-sqlite-writers: small insert+commit transactions."""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from app.sqlite_profile import engine_options, get_profile, install_profile
+
+    profile = get_profile(profile_name)
+    engine = create_engine(f"sqlite:///{path}", **engine_options(profile))
+    install_profile(engine, profile)
+    latencies = []
+    errors = 0
+    start.wait()
+    for i in range(writes):
+        began = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO bench (worker, payload) VALUES (:w, :p)"),
+                             {'w': os.getpid(), 'p': 'x' * 200})
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - began)
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+@click.command('bench-sqlite-writers')
+@click.option('--profile', 'profiles', multiple=True, default=['default', 'wal'], show_default=True)
+@click.option('--workers', default=4, show_default=True, help='Concurrent writer processes.')
+@click.option('--writes', default=250, show_default=True, help='Transactions per writer.')
+def bench_sqlite_writers_command(profiles, workers, writes):
+    """Benchmark concurrent committing writers under each SQLite engine profile."""
+    import multiprocessing
+    import tempfile
+    from sqlalchemy import create_engine, text
+
+    ctx = multiprocessing.get_context('spawn')
+    for profile_name in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            engine = create_engine(f"sqlite:///{path}")
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE bench (id INTEGER PRIMARY KEY, worker INTEGER, payload TEXT)"))
+            engine.dispose()
+
+            start = ctx.Event()
+            results = ctx.Queue()
+            procs = [ctx.Process(target=_bench_writer, args=(path, profile_name, writes, start, results))
+                     for _ in range(workers)]
+            for proc in procs:
+                proc.start()
+            time.sleep(1.0)  # let every writer import and connect before starting the clock
+            began = time.perf_counter()
+            start.set()
+            collected = [results.get() for _ in procs]
+            elapsed = time.perf_counter() - began
+            for proc in procs:
+                proc.join()
+
+            latencies = sorted(l for lats, _ in collected for l in lats)
+            errors = sum(e for _, e in collected)
+            if latencies:
+                p50 = latencies[len(latencies) // 2] * 1000
+                p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            else:
+                p50 = p95 = float('nan')
+            click.echo(f"{profile_name:>8}: {len(latencies) / elapsed:8.0f} commits/s, "
+                       f"p50 {p50:.2f}ms, p95 {p95:.2f}ms, {errors} locked errors "
+                       f"({workers} writers x {writes})")
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print every plan, not just regressions.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if any hot query's EXPLAIN QUERY PLAN shows a full table scan, or a paginated one sorts."""
+    from app.query_plans import check_query_plans
+
+    failed = 0
+    for name, plan, problems in check_query_plans():
+        if problems:
+            failed += 1
+        if problems or verbose:
+            label = 'ok'
+            if problems:
+                label = 'FULL SCAN' if problems[0].startswith('SCAN ') else 'TEMP SORT'
+            click.echo(f"{label:>9}  {name}")
+            for line in plan:
+                click.echo(f"           {line}")
+    click.echo(f"{failed} hot queries with full table scans or paginated sorts.")
+    if failed:
+        raise SystemExit(1)
+
+
+@click.command('check-query-budgets')
+@click.option('--grades', 'sizes', multiple=True, type=int, default=(5, 200), show_default=True,
+              help='Grades to seed per run; repeat for several runs.')
+@click.option('--verbose', is_flag=True, help='Print every request, not just violations.')
+def check_query_budgets_command(sizes, verbose):
+    """Fail if any route runs more SQL statements than its @query_budget."""
+    from app.query_budget import check_query_budgets
+
+    failed = 0
+    for size, method, path, endpoint, status, statements, budget in check_query_budgets(sizes):
+        if size is None:
+            click.echo(f"  missing  {endpoint}: budget {budget}, not exercised by the check")
+            failed += 1
+            continue
+        if budget is None:
+            result = 'NO BUDGET'
+        elif statements > budget:
+            result = 'OVER'
+        else:
+            result = 'ok'
+        if result != 'ok':
+            failed += 1
+        if result != 'ok' or verbose:
+            click.echo(f"{result:>9}  {size:>4} grades  {method:<4} {path} ({endpoint}, {status}): "
+                       f"{statements} statements, budget {budget}")
+    click.echo(f"{failed} query budget violations.")
+    if failed:
+        raise SystemExit(1)
+
+
+@click.command('seed')
+@click.option('--users', default=100, show_default=True)
+@click.option('--semesters', default=6, show_default=True, help='Semesters per user.')
+@click.option('--grades', default=30, show_default=True, help='Grades per user.')
+@click.option('--seed', default=0, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--prefix', default='seed', show_default=True, help='Usernames are <prefix>0, <prefix>1, ...')
+@click.option('--password', default='password', show_default=True, help='Password of every seeded user.')
+@click.option('--admin', is_flag=True, help='Also create the admin account, if missing.')
+@click.option('--no-summaries', is_flag=True, help='Leave GPA summaries to be rebuilt on first view.')
+@with_appcontext
+def seed_command(users, semesters, grades, seed, prefix, password, admin, no_summaries):
+    """Fill the configured database with synthetic users, semesters and grades."""
+    from app.models import User
+    from app.seed import seed_database
+
+    if User.query.filter(User.username.like(f'{prefix}%')).count():
+        raise click.UsageError(f"Users named {prefix}... already exist; pass another --prefix.")
+    started = time.perf_counter()
+    counts = seed_database(users, semesters, grades, seed=seed, prefix=prefix, password=password,
+                           admin=admin, summaries=not no_summaries)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Seeded {counts['users']} users, {counts['semesters']} semesters and "
+               f"{counts['grades']} grades ({elapsed:.2f}s).")
+
+
+@click.command('bench')
+@click.option('--users', default=200, show_default=True)
+@click.option('--semesters', default=6, show_default=True, help='Semesters per user.')
+@click.option('--grades', default=30, show_default=True, help='Grades per user.')
+@click.option('--requests', default=50, show_default=True, help='Requests per route.')
+@click.option('--sample', default=10, show_default=True, help='Users the requests rotate through.')
+@click.option('--repeat', default=20, show_default=True, help='Calls per sampled user for each GPA function.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--no-fragment-cache', is_flag=True, help='Render every request in full.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Save the results as JSON.')
+@click.option('--compare', 'baseline', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSON results of an earlier run to compare against.')
+def bench_command(users, semesters, grades, requests, sample, repeat, seed, no_fragment_cache, output, baseline):
+    """Benchmark the hot routes and GPA functions on a throwaway seeded database."""
+    from app.bench import compare, load_results, run_benchmarks, save_results
+
+    results = run_benchmarks(users, semesters, grades, requests, sample, repeat, seed,
+                             fragment_cache=not no_fragment_cache)
+    seeded = results['seeded']
+    click.echo(f"Seeded {seeded['users']} users, {seeded['grades']} grades ({seeded['seconds']:.2f}s)")
+    click.echo(f"{'':<28}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'SQL':>6}")
+    for section in ('routes', 'functions'):
+        for name, row in results[section].items():
+            sql = row.get('statements_max', '')
+            click.echo(f"{name:<28}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['max_ms']:>10.3f}{sql:>6}")
+
+    if baseline:
+        previous = load_results(baseline)
+        click.echo(f"Compared with {baseline} (commit {previous.get('commit') or 'unknown'}):")
+        for section, name, metric, old, new, change in compare(previous, results):
+            click.echo(f"  {name:<28}{metric:<16}{old:>10.3f} -> {new:>10.3f}  {change:+6.1f}%")
+    if output:
+        save_results(results, output)
+        click.echo(f"Saved results to {output}")
+
+
+@click.command('loadtest')
+@click.option('--url', default=None, help='Server to load, e.g. http://127.0.0.1:8000 (default: this app in-process).')
+@click.option('--users', default=20, show_default=True, help='Concurrent virtual users.')
+@click.option('--admins', default=0, show_default=True, help='How many of them browse the admin pages.')
+@click.option('--duration', default=30.0, show_default=True, help='Seconds to run.')
+@click.option('--think', default=1.0, show_default=True, help='Mean think time between actions (seconds; 0 for none).')
+@click.option('--accounts', default=100, show_default=True, help='Seeded accounts to spread the users over.')
+@click.option('--prefix', default='seed', show_default=True, help='Username prefix used by `flask seed`.')
+@click.option('--password', default='password', show_default=True)
+@click.option('--mix', default=None, help='Student action weights, e.g. "dashboard=50,add_grade=20".')
+@click.option('--admin-mix', default=None, help='Admin action weights, e.g. "admin_dashboard=70,admin_user=30".')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Save the report as JSON.')
+@with_appcontext
+def loadtest_command(url, users, admins, duration, think, accounts, prefix, password, mix, admin_mix, seed, output):
+    """Replay weighted student/admin sessions against a server and report per-endpoint latency."""
+    from flask import current_app
+
+    from app.bench import save_results
+    from app.loadgen import LocalServer, run_load
+
+    def run(base_url):
+        click.echo(f"{users} virtual users against {base_url} for {duration:.0f}s ...")
+        return run_load(base_url, users, duration, think, accounts, prefix, password, admins, mix, admin_mix, seed)
+
+    try:
+        if url:
+            report = run(url)
+        else:
+            with LocalServer(current_app._get_current_object()) as server:
+                report = run(server.url)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+
+    locked = report['locked'] or {}
+    click.echo(f"{'':<34}{'reqs':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'locked':>8}")
+    for key, row in report['endpoints'].items():
+        endpoint_locked = locked.get(key.split(' ', 1)[1], '') if key.startswith('POST ') else ''
+        click.echo(f"{key:<34}{row['requests']:>7}{row['rps']:>8.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                   f"{row['p99_ms']:>9.1f}{row['errors']:>8}{endpoint_locked:>8}")
+    total = report['total']
+    click.echo(f"{'total':<34}{total['requests']:>7}{total['rps']:>8.1f}{total['p50_ms']:>9.1f}"
+               f"{total['p95_ms']:>9.1f}{total['p99_ms']:>9.1f}{total['errors']:>8}"
+               f"{total['locked'] if total['locked'] is not None else 'n/a':>8}")
+    click.echo(f"Error rate {total['error_rate']:.2%}; 'database is locked' "
+               + (f"{total['locked']} requests" if total['locked'] is not None else "not available (no /metrics)"))
+    if output:
+        save_results(report, output)
+        click.echo(f"Saved report to {output}")
+
+
+def _rate(rows, seconds):
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a"
+
+
+def _print_table_progress(name, rows, seconds):
+    if name == 'indexes':
+        click.echo(f"  {'(indexes)':<22} {rows:>12,} rebuilt  {seconds:8.2f}s")
+    else:
+        click.echo(f"  {name:<22} {rows:>12,} rows  {seconds:8.2f}s  {_rate(rows, seconds)}")
+
+
+@click.command('backup')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows fetched and written per chunk.')
+@with_appcontext
+def backup_command(path, chunk_size):
+    """Stream every table to a gzipped NDJSON backup file."""
+    from app.backup import backup_database
+
+    started = time.perf_counter()
+    counts = backup_database(path, chunk_size, progress=_print_table_progress)
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    click.echo(f"Backed up {rows:,} rows from {len(counts)} tables to {path} "
+               f"({os.path.getsize(path) / 1024 / 1024:.1f} MiB, {elapsed:.2f}s, {_rate(rows, elapsed)}).")
+
+
+@click.command('restore')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per executemany batch.')
+@click.option('--replace', is_flag=True, help='Delete all existing data first (otherwise the database must be empty).')
+@with_appcontext
+def restore_command(path, chunk_size, replace):
+    """Load a backup made by `flask backup` into the configured database."""
+    from app.backup import BackupError, read_header, restore_database
+
+    try:
+        header = read_header(path)
+        click.echo(f"Restoring backup of {header['created']} (revision {header.get('revision') or 'unknown'}) ...")
+        started = time.perf_counter()
+        counts = restore_database(path, chunk_size, replace, progress=_print_table_progress)
+    except BackupError as exc:
+        raise click.ClickException(str(exc))
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    click.echo(f"Restored {rows:,} rows into {len(counts)} tables ({elapsed:.2f}s, {_rate(rows, elapsed)}).")
+
+
+def register_commands(app):
+    app.cli.add_command(gpa_report_command)
+    app.cli.add_command(bench_batch_gpa_command)
+    app.cli.add_command(rebuild_gpa_summaries_command)
+    app.cli.add_command(check_gpa_summaries_command)
+    app.cli.add_command(compact_activity_command)
+    app.cli.add_command(compact_journal_command)
+    app.cli.add_command(bench_sqlite_writers_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(check_query_budgets_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(bench_command)
+    app.cli.add_command(loadtest_command)
+    app.cli.add_command(backup_command)
+    app.cli.add_command(restore_command)
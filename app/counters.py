@@ -0,0 +1,152 @@
+"""Cached admin dashboard counters.
+
+The dashboard's totals (users, grades, semesters, recorded actions and
+actions per day) are computed once and then kept in an in-process cache.
+Writes keep them current without re-counting. User, Grade and Semester rows
+added or deleted through the ORM are tallied in after_flush and applied once
+the transaction commits (and dropped on rollback). The activity sink reports
+each batch it writes.
+
+Other workers' writes are not seen, so every value is also re-counted after
+ADMIN_COUNTERS_TTL seconds. The admin "Refresh" button (refresh()) re-counts
+right away.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# ORM classes whose row counts are cached, by counter name
+COUNTED_MODELS = {
+    'User': 'users',
+    'Grade': 'grades',
+    'Semester': 'semesters',
+}
+
+
+def _count_users():
+    from app.models import User
+    return User.query.count()
+
+
+def _count_grades():
+    from app.models import Grade
+    return Grade.query.count()
+
+
+def _count_semesters():
+    from app.models import Semester
+    return Semester.query.count()
+
+
+def _count_actions():
+    from app.retention import activity_total
+    return activity_total()
+
+
+def _actions_by_day():
+    from app.retention import daily_activity
+    return dict(daily_activity(14))
+
+
+COUNTERS = {
+    'users': _count_users,
+    'grades': _count_grades,
+    'semesters': _count_semesters,
+    'actions': _count_actions,
+    'actions_by_day': _actions_by_day,
+}
+
+
+class CounterCache:
+    def __init__(self, app=None):
+        self.ttl = 60
+        self._values = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMIN_COUNTERS_TTL', 60)
+        self.ttl = app.config['ADMIN_COUNTERS_TTL']
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_soft_rollback', self._after_rollback)
+            self._listening = True
+
+    def get(self, name):
+        """A counter's value, re-counted if it is missing or older than the TTL."""
+        now = time.monotonic()
+        with self._lock:
+            if name in self._values and now - self._loaded_at[name] < self.ttl:
+                return self._values[name]
+        value = COUNTERS[name]()
+        with self._lock:
+            self._values[name] = value
+            self._loaded_at[name] = now
+        return value
+
+    def snapshot(self):
+        return {name: self.get(name) for name in COUNTERS}
+
+    @property
+    def loaded_at(self):
+        """When the oldest cached value was counted (UTC), for display."""
+        if not self._loaded_at:
+            return None
+        age = time.monotonic() - min(self._loaded_at.values())
+        return datetime.utcnow() - timedelta(seconds=age)
+
+    def invalidate(self, *names):
+        """Forget the given counters (all if none), so the next get() re-counts."""
+        with self._lock:
+            for name in names or list(self._values):
+                self._values.pop(name, None)
+                self._loaded_at.pop(name, None)
+
+    def refresh(self):
+        self.invalidate()
+        return self.snapshot()
+
+    def adjust(self, name, delta):
+        """Add delta to a cached counter; a counter not cached yet is left to the next count."""
+        with self._lock:
+            if name in self._values:
+                self._values[name] += delta
+
+    def record_activity(self, timestamps):
+        """Count a batch of activity events written by the activity sink."""
+        with self._lock:
+            if 'actions' in self._values:
+                self._values['actions'] += len(timestamps)
+            by_day = self._values.get('actions_by_day')
+            if by_day is not None:
+                for timestamp in timestamps:
+                    day = timestamp.date()
+                    by_day[day] = by_day.get(day, 0) + 1
+
+    def _after_flush(self, session, flush_context):
+        deltas = session.info.setdefault('counter_deltas', {})
+        for objects, sign in ((session.new, 1), (session.deleted, -1)):
+            for obj in objects:
+                name = COUNTED_MODELS.get(type(obj).__name__)
+                if name is not None:
+                    deltas[name] = deltas.get(name, 0) + sign
+
+    def _after_commit(self, session):
+        deltas = session.info.pop('counter_deltas', None)
+        if deltas:
+            for name, delta in deltas.items():
+                self.adjust(name, delta)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop('counter_deltas', None)
+
+
+counters = CounterCache()
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, DecimalField, SelectField, DateField, FloatField, IntegerField, BooleanField
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, NumberRange, Optional
 from app.models import User
@@ -41,6 +42,15 @@ class GradeForm(FlaskForm):
         
         return True
 
+class ImportForm(FlaskForm):
+    file = FileField('Grades File', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'json', 'ndjson', 'jsonl'], 'Upload a CSV, JSON or NDJSON file.')
+    ])
+    dry_run = BooleanField('Dry run (check the file without importing)')
+    skip_invalid = BooleanField('Import the valid rows even if some rows are invalid')
+    submit = SubmitField('Import')
+
 class DeleteForm(FlaskForm):
     submit = SubmitField('Delete')
 
@@ -0,0 +1,144 @@
+"""Rendered-fragment cache for the dashboard, trends and semesters pages.
+
+The grade table, the GPA header, the trend chart data and the semester cards
+are rendered from their own templates (app/templates/fragments/) and the HTML
+is cached. A repeat view of an unchanged page skips both the queries behind a
+fragment and its Jinja render.
+
+Keys hold the user id, their data_version (app/versioning.py), the hash of
+their GPA settings (GpaPolicy.key) and the fragment's variant (sort order,
+cursor). Every write route bumps data_version, so a write makes the user's
+old entries unreachable without any explicit invalidation; they then age out
+of the LRU.
+
+Fragments contain forms, and a form's CSRF token is signed with the session's
+own secret, so keys also hold a digest of that secret: one session is never
+served another session's token. Entries expire after FRAGMENT_CACHE_TTL
+seconds, well inside the token's WTF_CSRF_TIME_LIMIT.
+
+The backend is pluggable: FRAGMENT_CACHE_BACKEND is 'lru' (in-process, bounded
+by entry count and total size), 'null' (caching off), or any object with
+get(key), set(key, html, ttl) and clear() - for a cache shared by workers.
+Guests are never cached; their grades live in their session.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, render_template, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+
+
+class LRUBackend:
+    """In-process LRU bounded by entry count and total HTML size."""
+
+    def __init__(self, max_entries=2000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            html, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return html
+
+    def set(self, key, html, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (html, time.monotonic() + ttl)
+            self.size += len(html)
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        html, _ = self._entries.pop(key)
+        self.size -= len(html)
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, html, ttl):
+        pass
+
+    def clear(self):
+        pass
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = 600
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_BACKEND', 'lru')
+        app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 2000)
+        app.config.setdefault('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 600)
+        self.ttl = app.config['FRAGMENT_CACHE_TTL']
+
+        backend = app.config['FRAGMENT_CACHE_BACKEND']
+        if backend == 'lru':
+            backend = LRUBackend(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_MAX_BYTES'])
+        elif backend == 'null' or backend is None:
+            backend = NullBackend()
+        elif isinstance(backend, str):
+            raise ValueError(f"Unknown FRAGMENT_CACHE_BACKEND {backend!r}")
+        self.backend = backend
+
+    def key(self, name, user, variant=()):
+        from app.gpa import GpaPolicy
+
+        # Make sure the session has its CSRF secret before it goes into the key
+        generate_csrf()
+        secret = session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'), '')
+        parts = [secret, GpaPolicy.from_user(user).key] + [str(part) for part in variant]
+        digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+        return f'{name}:{user.id}:{user.data_version}:{digest}'
+
+    def render(self, name, template, context, variant=()):
+        """The fragment's HTML; context() supplies the template variables on a miss."""
+        if not current_user.is_authenticated:
+            return Markup(render_template(template, **context()))
+
+        key = self.key(name, current_user, variant)
+        html = self.backend.get(key)
+        if html is not None:
+            self.hits += 1
+            return Markup(html)
+        self.misses += 1
+        html = render_template(template, **context())
+        self.backend.set(key, html, self.ttl)
+        return Markup(html)
+
+    def clear(self):
+        self.backend.clear()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,381 @@
+import hashlib
+from bisect import bisect_right
+
+from app.timing import span
+from app.tracing import get_logger
+
+log = get_logger(__name__)
+
+LETTER_TO_NUM = {
+    'A+': 98, 'A': 95, 'A-': 91,
+    'B+': 88, 'B': 85, 'B-': 81,
+    'C+': 78, 'C': 75, 'C-': 71,
+    'D': 65, 'F': 50
+}
+
+# GPA scales mapping with numeric cutoff and GPA points for unweighted and weighted (Honors/AP)
+GPA_SCALES = {
+    'standard': {  # 4.0 unweighted, no weighting here (weighting is done separately)
+        'cutoffs': [(90, 4.0), (80, 3.0), (70, 2.0), (60, 1.0)],
+        'weight': {'Regular': 0.0, 'Honors': 0.5, 'AP': 1.0},
+        'max': 5.0
+    },
+    'weighted_5': {
+        'cutoffs': [(90, 5.0), (80, 4.0), (70, 3.0), (60, 2.0)],
+        'weight': {'Regular': 0.0, 'Honors': 0.0, 'AP': 0.0},  # weights incorporated in scale directly
+        'max': 5.0
+    },
+    'weighted_4.5': {
+        'cutoffs': [(90, 4.5), (80, 3.5), (70, 2.5), (60, 1.5)],
+        'weight': {'Regular': 0.0, 'Honors': 0.25, 'AP': 0.5},
+        'max': 5.0
+    },
+    'college_plus_minus': {  # Similar to precise 4.33 scale with +/- plus no weighting
+        'cutoffs': [
+            (93, 4.0), (90, 3.7), (87, 3.3), (83, 3.0),
+            (80, 2.7), (77, 2.3), (73, 2.0), (70, 1.7),
+            (67, 1.3), (65, 1.0)
+        ],
+        'weight': {'Regular': 0.0, 'Honors': 0.0, 'AP': 0.0},
+        'max': 4.0
+    }
+}
+
+PLUS_MINUS_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'D-': 0.7,
+    'F': 0.0
+}
+
+SIMPLE_POINTS = {'A': 4.0, 'B': 3.0, 'C': 2.0, 'D': 1.0, 'F': 0.0}
+
+# Letter grades paired with the User/CustomGPA column that stores their custom value
+LETTER_FIELDS = (
+    ('A+', 'a_plus'), ('A', 'a'), ('A-', 'a_minus'),
+    ('B+', 'b_plus'), ('B', 'b'), ('B-', 'b_minus'),
+    ('C+', 'c_plus'), ('C', 'c'), ('C-', 'c_minus'),
+    ('D+', 'd_plus'), ('D', 'd'), ('D-', 'd_minus'),
+    ('F', 'f')
+)
+
+COURSE_TYPES = ('Regular', 'Honors', 'AP', 'IB', 'DE')
+WEIGHT_FIELDS = (
+    ('Regular', 'weight_regular'), ('Honors', 'weight_honors'), ('AP', 'weight_ap'),
+    ('IB', 'weight_ib'), ('DE', 'weight_de')
+)
+DEFAULT_WEIGHTS = {'Regular': 0.0, 'Honors': 0.5, 'AP': 1.0, 'IB': 1.0, 'DE': 1.0}
+
+# Numeric cutoffs for the plus/minus letters, lowest first. A numeric grade falls into
+# bucket bisect_right(BUCKET_CUTOFFS, grade), and BUCKET_LETTERS[bucket] is its letter.
+# The simple A-F cutoffs (90/80/70/60) line up with these buckets as well.
+BUCKET_CUTOFFS = (60, 63, 67, 70, 73, 77, 80, 83, 87, 90, 93, 97)
+BUCKET_LETTERS = ('F', 'D-', 'D', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+')
+SIMPLE_BUCKET_LETTERS = ('F', 'D', 'D', 'D', 'C', 'C', 'C', 'B', 'B', 'B', 'A', 'A', 'A')
+
+
+def grade_to_gpa_points(grade_numeric, course_type, scale_key):
+    # Ensure grade_numeric is a float
+    try:
+        grade_numeric = float(grade_numeric)
+    except (ValueError, TypeError):
+        # Could not convert; return None or 0 GPA points
+        return 0.0
+
+    scale = GPA_SCALES.get(scale_key, GPA_SCALES['standard'])
+    cutoffs = scale['cutoffs']
+    weight_map = scale['weight']
+    max_gpa = scale['max']
+
+    # Find base GPA points based on cutoffs
+    points = 0.0
+    for cutoff, gpa_value in cutoffs:
+        if grade_numeric >= cutoff:
+            points = gpa_value
+            break
+
+    # Add weighting if scale supports it
+    weight = weight_map.get(course_type, 0.0)
+    weighted_points = points + weight
+
+    # Cap GPA at max scale value
+    return min(weighted_points, max_gpa)
+
+
+def get_letter_grade(grade_numeric, grade_format='plus_minus'):
+    if grade_numeric is None:
+        return ''
+
+    try:
+        grade_numeric = float(grade_numeric)
+    except (ValueError, TypeError):
+        return ''
+
+    if grade_format == 'simple':
+        return SIMPLE_BUCKET_LETTERS[bisect_right(BUCKET_CUTOFFS, grade_numeric)]
+    return BUCKET_LETTERS[bisect_right(BUCKET_CUTOFFS, grade_numeric)]
+
+
+def as_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class SemesterTotals:
+    """Weighted points, credits and grade count for one semester."""
+    __slots__ = ('points', 'credits', 'count')
+
+    def __init__(self, points=0.0, credits=0.0, count=0):
+        self.points = points
+        self.credits = credits
+        self.count = count
+
+    @property
+    def gpa(self):
+        return round(self.points / self.credits, 2) if self.credits else 0.0
+
+
+class GpaResult:
+    """Totals produced by a single GpaPolicy.evaluate() pass over a list of grades."""
+    __slots__ = ('points', 'credits', 'count', 'numeric_sum', 'skipped', 'semesters')
+
+    def __init__(self):
+        self.points = 0.0
+        self.credits = 0.0
+        self.count = 0
+        self.numeric_sum = 0.0
+        self.skipped = 0
+        self.semesters = {}
+
+    @property
+    def gpa(self):
+        return round(self.points / self.credits, 2) if self.credits else 0.0
+
+    @property
+    def average(self):
+        return round(self.numeric_sum / self.count, 2) if self.count else None
+
+
+class GpaPolicy:
+    """A user's GPA settings compiled into flat lookup tables.
+
+    Building a policy resolves the scale, grade format, custom letter values,
+    course weights and cap once. Afterwards the points for a grade are a bucket
+    lookup into a per-course-type row, so evaluating hundreds of grades does not
+    touch the user object or rebuild any dicts.
+    """
+
+    def __init__(self, gpa_scale='standard', grade_format='plus_minus', letter_values=None,
+                 weights=None, gpa_cap=None, use_credit_hours=False):
+        self.gpa_scale = gpa_scale or 'standard'
+        self.grade_format = grade_format or 'plus_minus'
+        self.letter_values = dict(letter_values or {})
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.gpa_cap = gpa_cap
+        self.use_credit_hours = bool(use_credit_hours)
+
+        self.bucket_letters = SIMPLE_BUCKET_LETTERS if self.grade_format == 'simple' else BUCKET_LETTERS
+        self.base_row = None
+        if self.gpa_scale == 'custom' or self.grade_format in ('plus_minus', 'simple'):
+            # Base points only depend on the letter, not the course type
+            self.base_row = [self._base_points(letter, None) for letter in self.bucket_letters]
+        self.rows = {ctype: self._compile_row(ctype) for ctype in COURSE_TYPES}
+        self.default_row = self._compile_row(None)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            gpa_scale=user.gpa_scale,
+            grade_format=user.grade_format,
+            letter_values={letter: getattr(user, field) for letter, field in LETTER_FIELDS},
+            weights={ctype: getattr(user, field) for ctype, field in WEIGHT_FIELDS},
+            gpa_cap=user.get_gpa_cap(),
+            use_credit_hours=user.use_credit_hours
+        )
+
+    @classmethod
+    def from_session(cls, session):
+        custom = session.get('custom_gpa_values', {})
+        return cls(
+            gpa_scale=session.get('gpa_scale', 'standard'),
+            grade_format=session.get('grade_format', 'plus_minus'),
+            letter_values={letter: custom.get(letter) for letter, _ in LETTER_FIELDS},
+            weights=session.get('weights', DEFAULT_WEIGHTS),
+            gpa_cap=session.get('gpa_cap', None)
+        )
+
+    @property
+    def key(self):
+        """A short hash that changes whenever any setting affecting GPA results changes."""
+        parts = [self.gpa_scale, self.grade_format, self.gpa_cap, self.use_credit_hours]
+        parts += [self.letter_values.get(letter) for letter, _ in LETTER_FIELDS]
+        parts += [self.weights.get(ctype) for ctype in COURSE_TYPES]
+        return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+    def without_weights(self):
+        """The same policy with every course weight set to zero (unweighted GPA)."""
+        return GpaPolicy(self.gpa_scale, self.grade_format, self.letter_values,
+                         {ctype: 0.0 for ctype in COURSE_TYPES}, self.gpa_cap, self.use_credit_hours)
+
+    def _base_points(self, letter, ctype):
+        if self.gpa_scale == 'custom':
+            return as_float(self.letter_values.get(letter))
+        if self.grade_format == 'plus_minus':
+            return PLUS_MINUS_POINTS.get(letter)
+        if self.grade_format == 'simple':
+            return SIMPLE_POINTS.get(letter[0], 0.0)
+        # fallback to numeric
+        grade_numeric = LETTER_TO_NUM.get(letter)
+        if grade_numeric is None:
+            return None
+        return grade_to_gpa_points(grade_numeric, ctype, self.gpa_scale)
+
+    def _compile_row(self, ctype):
+        weight = as_float(self.weights.get(ctype, 0.0)) or 0.0
+        base_row = self.base_row
+        if base_row is None:
+            base_row = [self._base_points(letter, ctype) for letter in self.bucket_letters]
+        cap = self.gpa_cap
+        row = []
+        for points in base_row:
+            if points is not None:
+                points = points + weight
+                if cap is not None:
+                    points = min(points, cap)
+            row.append(points)
+        return tuple(row)
+
+    def letter_for(self, grade_numeric):
+        return get_letter_grade(grade_numeric, self.grade_format)
+
+    def points_for(self, grade_numeric, course_type='Regular'):
+        """Final (weighted and capped) points for one numeric grade, or None if it does not count."""
+        grade_numeric = as_float(grade_numeric)
+        if grade_numeric is None:
+            return None
+        row = self.rows.get(course_type or 'Regular', self.default_row)
+        return row[bisect_right(BUCKET_CUTOFFS, grade_numeric)]
+
+    def credits_for(self, credit_hours):
+        if not self.use_credit_hours:
+            return 1.0
+        return as_float(credit_hours) or 1.0
+
+    def evaluate(self, grades):
+        """Overall and per-semester totals for a list of grades in one pass.
+
+        Letters are resolved from each grade's numeric value under the policy's
+        grade format, which is also what the dashboard displays.
+        """
+        with span('gpa'):
+            return self._evaluate(grades)
+
+    def _evaluate(self, grades):
+        result = GpaResult()
+        rows = self.rows
+        default_row = self.default_row
+        semesters = result.semesters
+        use_credit_hours = self.use_credit_hours
+        total_points = 0.0
+        total_credits = 0.0
+        numeric_sum = 0.0
+        count = 0
+        skipped = 0
+        # Checked once: with tracing off the loop never builds a message
+        tracing = log.enabled()
+
+        for grade in grades:
+            numeric = grade.grade
+            count += 1
+            semester_id = getattr(grade, 'semester_id', None)
+            totals = None
+            if semester_id is not None:
+                totals = semesters.get(semester_id)
+                if totals is None:
+                    totals = semesters[semester_id] = SemesterTotals()
+                totals.count += 1
+
+            try:
+                numeric = float(numeric)
+            except (ValueError, TypeError):
+                skipped += 1
+                continue
+            numeric_sum += numeric
+
+            row = rows.get(getattr(grade, 'course_type', 'Regular') or 'Regular', default_row)
+            points = row[bisect_right(BUCKET_CUTOFFS, numeric)]
+            if points is None:
+                skipped += 1
+                if tracing:
+                    log.trace("Grade %s (%s) has no GPA points", getattr(grade, 'id', None), numeric)
+                continue
+
+            credits = 1.0
+            if use_credit_hours:
+                credits = as_float(getattr(grade, 'credit_hours', 1.0)) or 1.0
+            if tracing:
+                log.trace("Grade %s: %s %s -> %s points x %s credits", getattr(grade, 'id', None),
+                          numeric, getattr(grade, 'course_type', None), points, credits)
+
+            weighted = points * credits
+            total_points += weighted
+            total_credits += credits
+            if totals is not None:
+                totals.points += weighted
+                totals.credits += credits
+
+        result.points = total_points
+        result.credits = total_credits
+        result.numeric_sum = numeric_sum
+        result.count = count
+        result.skipped = skipped
+        return result
+
+    def cumulative(self, semesters, result):
+        """Cumulative GPA after each semester (ordered by start date) from evaluate() totals."""
+        values = []
+        points = 0.0
+        credits = 0.0
+        for semester in sorted(semesters, key=lambda s: s.start_date):
+            totals = result.semesters.get(semester.id)
+            if totals is not None:
+                points += totals.points
+                credits += totals.credits
+            values.append(round(points / credits, 2) if credits else 0.0)
+        return values
+
+    def running(self, grades):
+        """Running GPA after each grade in date order, with the grades in that order."""
+        ordered = sorted(grades, key=lambda g: g.date)
+        values = []
+        points = 0.0
+        credits = 0.0
+        for grade in ordered:
+            grade_points = self.points_for(grade.grade, getattr(grade, 'course_type', 'Regular'))
+            if grade_points is not None:
+                grade_credits = self.credits_for(getattr(grade, 'credit_hours', 1.0))
+                points += grade_points * grade_credits
+                credits += grade_credits
+            values.append(round(points / credits, 2) if credits else 0.0)
+        return values, ordered
+
+
+def current_policy():
+    """The GpaPolicy for the current user (or guest session), compiled once per request."""
+    from flask import g, session
+    from flask_login import current_user
+
+    owner = current_user._get_current_object() if current_user.is_authenticated else None
+    cached = g.get('gpa_policy')
+    if cached is not None and cached[0] is owner:
+        return cached[1]
+
+    if owner is not None:
+        policy = GpaPolicy.from_user(owner)
+    else:
+        policy = GpaPolicy.from_session(session)
+    g.gpa_policy = (owner, policy)
+    return policy
@@ -0,0 +1,139 @@
+"""Vectorized GPA evaluation for many users at once (admin reports, school-wide stats).
+
+Grades are loaded as parallel NumPy columns and every user's policy is compiled
+into one row of a points table, so the per-grade work is a single fancy-index
+lookup and the per-user totals are two grouped sums. Results match
+GpaPolicy.evaluate() exactly: points are multiplied and summed in the same order.
+"""
+import numpy as np
+from sqlalchemy import case, select
+
+from app import db
+from app.gpa import BUCKET_CUTOFFS, COURSE_TYPES, GpaPolicy
+from app.models import Grade, User
+
+CUTOFFS = np.array(BUCKET_CUTOFFS, dtype=np.float64)
+# Course types outside COURSE_TYPES use the policy's default row, stored last
+OTHER_COURSE_TYPE = len(COURSE_TYPES)
+
+
+class GradeColumns:
+    """Grades for many users as parallel arrays, grouped by user."""
+
+    def __init__(self, user_ids, user_index, grade, course_type_code, credit_hours):
+        self.user_ids = user_ids
+        self.user_index = user_index
+        self.grade = grade
+        self.course_type_code = course_type_code
+        self.credit_hours = credit_hours
+
+    def __len__(self):
+        return len(self.grade)
+
+
+def course_type_code_expr():
+    return case(
+        {ctype: code for code, ctype in enumerate(COURSE_TYPES)},
+        value=db.func.coalesce(db.func.nullif(Grade.course_type, ''), 'Regular'),
+        else_=OTHER_COURSE_TYPE
+    )
+
+
+def load_grade_columns(user_ids=None):
+    """Pull the Grade rows for the given users (default: everyone) as a GradeColumns."""
+    stmt = select(Grade.user_id, Grade.grade, course_type_code_expr(), Grade.credit_hours)
+    if user_ids is not None:
+        stmt = stmt.where(Grade.user_id.in_(list(user_ids)))
+    stmt = stmt.order_by(Grade.user_id, Grade.id)
+
+    rows = db.session.execute(stmt).all()
+    if rows:
+        uid, grade, ctype, credits = zip(*rows)
+    else:
+        uid = grade = ctype = credits = ()
+
+    uid = np.array(uid, dtype=np.int64)
+    if user_ids is None:
+        ids = np.unique(uid)
+    else:
+        ids = np.unique(np.array(list(user_ids), dtype=np.int64))
+    return GradeColumns(
+        user_ids=ids,
+        user_index=np.searchsorted(ids, uid),
+        grade=np.array(grade, dtype=np.float64),
+        course_type_code=np.array(ctype, dtype=np.int64),
+        credit_hours=np.array(credits, dtype=np.float64)
+    )
+
+
+def policy_table(policies, weighted=True):
+    """Stack compiled policies into a (users, course types + 1, buckets) points array.
+
+    Grades that do not count under a policy are NaN. The unweighted table is
+    built from each policy's base row and cap rather than recompiling a
+    weightless copy of every policy.
+    """
+    if weighted:
+        rows = [[policy.rows[ctype] for ctype in COURSE_TYPES] + [policy.default_row] for policy in policies]
+        return np.array(rows, dtype=np.float64)
+
+    rows = []
+    for policy in policies:
+        if policy.base_row is None:
+            unweighted = policy.without_weights()
+            rows.append([unweighted.rows[ctype] for ctype in COURSE_TYPES] + [unweighted.default_row])
+        else:
+            rows.append([policy.base_row] * (OTHER_COURSE_TYPE + 1))
+    caps = np.array([np.inf if policy.gpa_cap is None else policy.gpa_cap for policy in policies],
+                    dtype=np.float64)
+    return np.minimum(np.array(rows, dtype=np.float64), caps[:, None, None])
+
+
+def evaluate_columns(policies, columns, weighted=True):
+    """Return (points, credits) totals per user, in the order of columns.user_ids."""
+    table = policy_table(policies, weighted)
+    use_credit_hours = np.array([policy.use_credit_hours for policy in policies], dtype=bool)
+    n_users = len(policies)
+    if not len(columns):
+        return np.zeros(n_users), np.zeros(n_users)
+
+    # Letter bucket of each grade (index into gpa.BUCKET_LETTERS)
+    valid = ~np.isnan(columns.grade)
+    bucket = np.searchsorted(CUTOFFS, np.where(valid, columns.grade, 0.0), side='right')
+    points = table[columns.user_index, columns.course_type_code, bucket]
+    counted = valid & ~np.isnan(points)
+
+    credits = columns.credit_hours
+    credits = np.where(np.isnan(credits) | (credits == 0), 1.0, credits)
+    credits = np.where(use_credit_hours[columns.user_index], credits, 1.0)
+
+    total_points = np.bincount(columns.user_index, weights=np.where(counted, points * credits, 0.0),
+                               minlength=n_users)
+    total_credits = np.bincount(columns.user_index, weights=np.where(counted, credits, 0.0),
+                                minlength=n_users)
+    return total_points, total_credits
+
+
+def gpas_from_totals(points, credits):
+    # Python's round() on each value so the result matches GpaResult.gpa exactly
+    return [round(p / c, 2) if c else 0.0 for p, c in zip(points.tolist(), credits.tolist())]
+
+
+def batch_gpa(policies, columns):
+    """Weighted and unweighted GPA for every user in columns.user_ids.
+
+    Returns {user_id: (weighted_gpa, unweighted_gpa)}.
+    """
+    weighted = gpas_from_totals(*evaluate_columns(policies, columns))
+    unweighted = gpas_from_totals(*evaluate_columns(policies, columns, weighted=False))
+    return dict(zip(columns.user_ids.tolist(), zip(weighted, unweighted)))
+
+
+def batch_gpa_for_users(user_ids=None):
+    """Weighted and unweighted GPA for the given users (default: every user with grades)."""
+    columns = load_grade_columns(user_ids)
+    query = User.query if user_ids is None else User.query.filter(User.id.in_(columns.user_ids.tolist()))
+    users = {u.id: u for u in query.all()}
+    policies = [GpaPolicy.from_user(users[uid]) if uid in users else GpaPolicy()
+                for uid in columns.user_ids.tolist()]
+    return batch_gpa(policies, columns)
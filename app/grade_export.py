@@ -0,0 +1,248 @@
+"""Streaming export of a user's grades, semesters, settings and GPA history.
+
+Formats:
+- JSON: one array of records
+- NDJSON: one record per line
+- CSV: one table per file (grades, semesters, gpa or settings)
+
+Every JSON and NDJSON record has a "type" and comes in this order:
+- settings
+- summary: the overall GPA
+- semester: one per semester
+- semester_gpa: one per semester
+- grade: one per grade
+
+Semesters are ordered by (start date, id) and grades by id, so exporting
+the same data twice gives the same bytes (apart from exported_at).
+
+Rows are read with yield_per, and the response is a generator, so memory
+stays flat however long the history is. Output goes out in chunks of
+EXPORT_CHUNK_SIZE records.
+
+Grade records use the import's columns (app/grade_import.py), and the
+importer reads semester records and skips the other types. So a grades CSV,
+or a whole JSON or NDJSON export, imports back as the same grades and
+semesters, credit hours included. grade_type is 'letter' for grades entered
+as letters, so they are stored again with their letter. The one exception is
+a grade whose letter was edited to something the form would not derive: it
+comes back with the derived letter. Settings are exported but not imported.
+
+Per-semester GPA comes from the stored summaries (app/summary.py). Call
+summary.get_summary() before streaming, so a stale summary is rebuilt and
+committed inside the request, not halfway through the response.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select
+
+from app import db
+from app.grade_import import stored_grade
+from app.models import Grade, GpaSummary, Semester, SemesterGpaSummary, UserSettings
+
+EXPORT_FORMATS = ('csv', 'json', 'ndjson')
+CSV_TABLES = ('grades', 'semesters', 'gpa', 'settings')
+
+GRADE_COLUMNS = ('subject', 'grade_type', 'grade', 'letter', 'course_type', 'date', 'credit_hours',
+                 'semester', 'semester_start')
+SEMESTER_COLUMNS = ('name', 'start_date')
+GPA_COLUMNS = ('semester', 'start_date', 'grade_count', 'credits', 'gpa', 'cumulative_gpa')
+USER_SETTINGS = ('gpa_scale', 'grade_format', 'use_credit_hours', 'gpa_cap',
+                 'a_plus', 'a', 'a_minus', 'b_plus', 'b', 'b_minus', 'c_plus', 'c', 'c_minus',
+                 'd_plus', 'd', 'd_minus', 'f',
+                 'weight_regular', 'weight_honors', 'weight_ap', 'weight_ib', 'weight_de')
+SETTINGS_COLUMNS = USER_SETTINGS + ('default_course_type', 'default_grade_type')
+
+MIMETYPES = {'csv': 'text/csv', 'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def export_grade_type(grade, letter):
+    """'number' or 'letter': how the grade must be entered for the form to store it unchanged."""
+    if grade is not None and stored_grade('number', grade, None) == (grade, letter):
+        return 'number'
+    if letter and stored_grade('letter', None, letter) == (grade, letter):
+        return 'letter'
+    return 'number'
+
+
+def settings_records(user):
+    settings = UserSettings.query.filter_by(user_id=user.id).first()
+    record = {name: getattr(user, name) for name in USER_SETTINGS}
+    record['default_course_type'] = settings.default_course_type if settings else None
+    record['default_grade_type'] = settings.default_grade_type if settings else None
+    yield record
+
+
+def summary_records(user):
+    summary = db.session.get(GpaSummary, user.id)
+    yield {
+        'exported_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'data_version': user.data_version,
+        'grade_count': summary.grade_count if summary else 0,
+        'credits': summary.total_credits if summary else 0.0,
+        'gpa': summary.gpa if summary else 0.0,
+        'average': summary.average if summary else 0.0,
+    }
+
+
+def semester_records(user, chunk_size):
+    rows = db.session.execute(
+        select(Semester.name, Semester.start_date)
+        .where(Semester.user_id == user.id)
+        .order_by(Semester.start_date, Semester.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for name, start_date in rows:
+        yield {'name': name, 'start_date': _iso(start_date)}
+
+
+def gpa_records(user, chunk_size):
+    rows = db.session.execute(
+        select(Semester.name, SemesterGpaSummary)
+        .join(Semester, Semester.id == SemesterGpaSummary.semester_id)
+        .where(SemesterGpaSummary.user_id == user.id)
+        .order_by(SemesterGpaSummary.start_date, SemesterGpaSummary.semester_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for name, partial in rows:
+        yield {
+            'semester': name,
+            'start_date': _iso(partial.start_date),
+            'grade_count': partial.grade_count,
+            'credits': partial.total_credits,
+            'gpa': partial.gpa,
+            'cumulative_gpa': partial.cumulative_gpa,
+        }
+
+
+def grade_records(user, chunk_size):
+    rows = db.session.execute(
+        select(Grade.subject, Grade.grade, Grade.letter, Grade.course_type, Grade.date,
+               Grade.credit_hours, Semester.name, Semester.start_date)
+        .outerjoin(Semester, Semester.id == Grade.semester_id)
+        .where(Grade.user_id == user.id)
+        .order_by(Grade.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for subject, grade, letter, course_type, date, credit_hours, semester, semester_start in rows:
+        grade_type = export_grade_type(grade, letter)
+        yield {
+            'subject': subject,
+            'grade_type': grade_type,
+            'grade': grade if grade_type == 'number' else None,
+            'letter': letter,
+            'course_type': course_type,
+            'date': _iso(date),
+            'credit_hours': credit_hours,
+            'semester': semester,
+            'semester_start': _iso(semester_start),
+        }
+
+
+def records(user, chunk_size):
+    """(type, record) for everything exported, in export order."""
+    sources = (
+        ('settings', settings_records(user)),
+        ('summary', summary_records(user)),
+        ('semester', semester_records(user, chunk_size)),
+        ('semester_gpa', gpa_records(user, chunk_size)),
+        ('grade', grade_records(user, chunk_size)),
+    )
+    for kind, source in sources:
+        for record in source:
+            yield kind, record
+
+
+def _csv_source(user, table, chunk_size):
+    if table == 'grades':
+        return GRADE_COLUMNS, grade_records(user, chunk_size)
+    if table == 'semesters':
+        return SEMESTER_COLUMNS, semester_records(user, chunk_size)
+    if table == 'gpa':
+        return GPA_COLUMNS, gpa_records(user, chunk_size)
+    if table == 'settings':
+        return SETTINGS_COLUMNS, settings_records(user)
+    raise ValueError(f"Unknown export table {table!r}")
+
+
+def _json_line(kind, record):
+    return json.dumps(dict(type=kind, **record), separators=(',', ':'))
+
+
+def export_csv(user, table='grades', chunk_size=500):
+    """Text chunks of one table as CSV with a header row."""
+    columns, source = _csv_source(user, table, chunk_size)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator='\n')
+    writer.writeheader()
+    for count, record in enumerate(source, 1):
+        writer.writerow(record)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(user, chunk_size=500):
+    """Text chunks of every record, one JSON object per line."""
+    lines = []
+    for kind, record in records(user, chunk_size):
+        lines.append(_json_line(kind, record))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_json(user, chunk_size=500):
+    """Text chunks of every record as one JSON array."""
+    lines = []
+    separator = '[\n'
+    for kind, record in records(user, chunk_size):
+        lines.append(separator + _json_line(kind, record))
+        separator = ',\n'
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if separator == '[\n':
+        lines.append('[')
+    lines.append('\n]\n')
+    yield ''.join(lines)
+
+
+def export_response(user, fmt, table='grades'):
+    """A streamed download of the user's data; raises ValueError for an unknown format or table."""
+    chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 500)
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+    if fmt == 'csv':
+        chunks = export_csv(user, table, chunk_size)
+        filename = f'gradepilot-{table}-{stamp}.csv'
+    elif fmt == 'json':
+        chunks = export_json(user, chunk_size)
+        filename = f'gradepilot-{stamp}.json'
+    elif fmt == 'ndjson':
+        chunks = export_ndjson(user, chunk_size)
+        filename = f'gradepilot-{stamp}.ndjson'
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    # Run the first chunk inside the request, so a failing query is an error page, not a cut-off download
+    first = next(chunks)
+
+    def body():
+        yield first
+        yield from chunks
+
+    return Response(
+        stream_with_context(body()),
+        mimetype=MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,411 @@
+"""Bulk grade import from CSV, JSON and NDJSON files.
+
+An uploaded file is read one row at a time:
+- CSV: a header row naming the columns
+- JSON: an array of objects
+- NDJSON: one object per line
+
+Only the current row and the pending batch are held in memory, never the
+whole file. Uploads are capped by MAX_CONTENT_LENGTH, and a single JSON item
+by MAX_JSON_ITEM.
+
+Columns are the add-grade form's fields:
+- subject
+- grade_type: number or letter; inferred when missing
+- grade, letter, course_type
+- date: YYYY-MM-DD
+- credit_hours: stored as given, 1.0 when missing
+- semester: a semester name
+
+Exports (app/grade_export.py) import back: in a JSON or NDJSON file,
+records typed "semester" create their semesters, and records of any other
+type but "grade" are skipped.
+
+Each row is checked by GradeForm itself, so an import accepts exactly what
+the form accepts, and stored grade and letter are derived the same way
+(stored_grade()). Semesters are matched by name, case-insensitively. A
+missing one is created, starting on the row's semester_start, or its date,
+or today.
+
+Valid rows are inserted with Core executemany batches of IMPORT_CHUNK_SIZE
+inside a single transaction. The user's data_version is bumped once, before
+the first insert. Every created semester and every batch's new grade ids go
+to the change journal (app/sync.py) at that version, and the GPA
+summary is rebuilt once at the end. The admin counters (app/counters.py)
+are adjusted after the commit. Rows that fail validation are reported
+with their line number. By default any invalid row rolls the whole import
+back; skip_invalid imports the rest. A dry run validates and resolves
+semesters the same way, then rolls back.
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import insert
+from werkzeug.datastructures import MultiDict
+
+from app import db, summary, sync, versioning
+from app.counters import counters
+from app.forms import GradeForm
+from app.gpa import LETTER_TO_NUM
+from app.models import Grade, Semester
+
+FORMATS = ('csv', 'json', 'ndjson')
+MAX_REPORTED_ERRORS = 200
+# A grade record is a few hundred characters; anything far larger is refused, not buffered
+MAX_JSON_ITEM = 16 * 1024
+SEMESTER_NAME_LENGTH = Semester.__table__.c.name.type.length
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be read (bad format, encoding or structure)."""
+
+
+class RowError:
+    __slots__ = ('line', 'field', 'message')
+
+    def __init__(self, line, field, message):
+        self.line = line
+        self.field = field
+        self.message = message
+
+    def to_dict(self):
+        return {'line': self.line, 'field': self.field, 'message': self.message}
+
+
+class ImportResult:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.valid = 0
+        self.imported = 0
+        self.invalid = 0
+        self.semesters_created = []
+        self.errors = []
+        self.committed = False
+
+    def error(self, line, field, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, field, message))
+
+    @property
+    def errors_truncated(self):
+        return self.invalid > 0 and len(self.errors) >= MAX_REPORTED_ERRORS
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'valid': self.valid,
+            'imported': self.imported,
+            'invalid': self.invalid,
+            'committed': self.committed,
+            'semesters_created': self.semesters_created,
+            'errors': [e.to_dict() for e in self.errors],
+        }
+
+
+def stored_grade(grade_type, grade, letter):
+    """(numeric grade, letter) as a grade entered through the form is stored."""
+    if grade_type == 'letter':
+        return LETTER_TO_NUM.get(letter, 0), letter
+    grade = float(grade)
+    if grade >= 90:
+        letter = 'A'
+    elif grade >= 80:
+        letter = 'B'
+    elif grade >= 70:
+        letter = 'C'
+    elif grade >= 60:
+        letter = 'D'
+    else:
+        letter = 'F'
+    return grade, letter
+
+
+def detect_format(filename, first_char=None):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if extension in FORMATS:
+        return extension
+    if extension == 'jsonl':
+        return 'ndjson'
+    if first_char == '[':
+        return 'json'
+    if first_char == '{':
+        return 'ndjson'
+    return 'csv'
+
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        raise ImportFileError("The file is empty.")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    if 'subject' not in reader.fieldnames:
+        raise ImportFileError("The CSV header has no 'subject' column.")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _ndjson_rows(text):
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def _json_rows(text, read_size=64 * 1024, max_item=MAX_JSON_ITEM):
+    """Objects of a top-level JSON array, decoded one at a time from a bounded window."""
+    decoder = json.JSONDecoder()
+    buffer = text.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ImportFileError("A JSON import must be an array of objects.")
+    position = 1
+    index = 0
+    while True:
+        # Skip separators, reading more when the window runs out
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                break
+            buffer, position = text.read(read_size), 0
+            if not buffer:
+                raise ImportFileError("The JSON array is not closed.")
+        if buffer[position] == ']':
+            return
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buffer, position)
+                break
+            except ValueError:
+                # Either the item runs past the window or it is invalid; only a small item gets more text
+                if len(buffer) - position > max_item:
+                    raise ImportFileError(f"Item {index + 1} is not valid JSON or is over {max_item} characters.")
+                more = text.read(read_size)
+                if not more:
+                    raise ImportFileError(f"Invalid JSON in item {index + 1}.")
+                buffer, position = buffer[position:] + more, 0
+        index += 1
+        yield index, obj
+        position = end
+
+
+def read_rows(stream, filename=None, fmt=None):
+    """(line or item number, row dict or None if unparseable) for every row of an uploaded binary stream."""
+    if fmt is None:
+        head = stream.read(64)
+        stream.seek(0)
+        fmt = detect_format(filename, head.lstrip(codecs.BOM_UTF8 + b' \t\r\n')[:1].decode('ascii', 'replace'))
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            yield from _csv_rows(text)
+        elif fmt == 'json':
+            yield from _json_rows(text)
+        elif fmt == 'ndjson':
+            yield from _ndjson_rows(text)
+        else:
+            raise ImportFileError(f"Unknown format {fmt!r}.")
+    except UnicodeDecodeError:
+        raise ImportFileError("The file is not UTF-8 text.")
+    except csv.Error as exc:
+        raise ImportFileError(f"Malformed CSV: {exc}")
+    finally:
+        # Leave the caller's stream open
+        text.detach()
+
+
+def _formdata(row):
+    """A row dict as the form data the add-grade form would receive."""
+    data = MultiDict()
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        key = str(key).strip().lower()
+        value = str(value).strip()
+        if value:
+            data[key] = value
+    if 'grade_type' not in data:
+        data['grade_type'] = 'letter' if 'letter' in data and 'grade' not in data else 'number'
+    return data
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+class _Semesters:
+    """The user's semesters by lower-cased name, creating missing ones on first use."""
+
+    def __init__(self, user, result, dry_run, versions):
+        self.user = user
+        self.result = result
+        self.dry_run = dry_run
+        self.versions = versions
+        self.created_ids = []
+        self.by_name = {
+            name.lower(): (semester_id, start)
+            for semester_id, name, start in db.session.query(Semester.id, Semester.name, Semester.start_date)
+            .filter(Semester.user_id == user.id)
+        }
+
+    def resolve(self, name, start):
+        key = name.lower()
+        if key in self.by_name:
+            return self.by_name[key]
+        semester_id = None
+        if not self.dry_run:
+            self.versions()
+            table = Semester.__table__
+            semester_id = db.session.execute(
+                insert(table).values(name=name, start_date=start, user_id=self.user.id).returning(table.c.id)
+            ).scalar_one()
+            self.created_ids.append(semester_id)
+        self.by_name[key] = (semester_id, start)
+        self.result.semesters_created.append(name)
+        return semester_id, start
+
+
+def import_grades(user, stream, filename=None, fmt=None, dry_run=False, skip_invalid=False):
+    """Validate and import every row of an uploaded file for `user`; returns an ImportResult.
+
+    Raises ImportFileError if the file cannot be read at all.
+    """
+    config = current_app.config
+    chunk_size = config.get('IMPORT_CHUNK_SIZE', 500)
+    max_rows = config.get('IMPORT_MAX_ROWS', 10000)
+
+    result = ImportResult(dry_run)
+    form = GradeForm(meta={'csrf': False})
+    form.semester_id.choices = [(0, 'No Semester')]
+    bumped = {}
+    batch = []
+
+    def versions():
+        if not bumped:
+            # One new data_version for the whole import, taken before its first insert
+            bumped.update(versioning.bump(user.id))
+        return bumped
+
+    semesters = _Semesters(user, result, dry_run, versions)
+
+    def write(batch):
+        table = Grade.__table__
+        ids = db.session.execute(insert(table).returning(table.c.id), batch).scalars().all()
+        sync.journal([(user.id, 'grade', grade_id, 'upsert') for grade_id in ids], versions())
+
+    try:
+        for line, row in read_rows(stream, filename, fmt):
+            kind = row.get('type', 'grade') if isinstance(row, dict) else 'grade'
+            if kind == 'semester':
+                if not _semester(line, row, semesters, result):
+                    result.invalid += 1
+                continue
+            if kind != 'grade':
+                # Other records of an export (app/grade_export.py)
+                continue
+            result.rows += 1
+            if result.rows > max_rows:
+                raise ImportFileError(f"Imports are limited to {max_rows} rows.")
+            values = _validate(user, line, row, form, semesters, result)
+            if values is None:
+                result.invalid += 1
+                continue
+            result.valid += 1
+            if dry_run:
+                continue
+            batch.append(values)
+            if len(batch) >= chunk_size:
+                write(batch)
+                batch = []
+        if batch and not dry_run:
+            write(batch)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if dry_run or (result.invalid and not skip_invalid) or not (result.valid or result.semesters_created):
+        db.session.rollback()
+        return result
+
+    # Created semesters are journalled together, in one statement however many there are
+    sync.journal([(user.id, 'semester', semester_id, 'upsert') for semester_id in semesters.created_ids],
+                 versions())
+    summary.rebuild_summary(user)
+    db.session.commit()
+    # Core inserts bypass the counter cache's flush hook
+    counters.adjust('grades', result.valid)
+    counters.adjust('semesters', len(result.semesters_created))
+    result.imported = result.valid
+    result.committed = True
+    return result
+
+
+def _semester(line, row, semesters, result):
+    """Resolve a semester record of an export, so semesters without grades come back too."""
+    name = str(row.get('name') or '').strip()
+    start_date = _parse_date(row.get('start_date'))
+    if not name or len(name) > SEMESTER_NAME_LENGTH:
+        result.error(line, 'name', "Not a valid semester name.")
+        return False
+    if start_date is None:
+        result.error(line, 'start_date', "Not a valid date value.")
+        return False
+    semesters.resolve(name, start_date)
+    return True
+
+
+def _validate(user, line, row, form, semesters, result):
+    """The Grade column values for a row, or None after reporting its errors."""
+    if not isinstance(row, dict):
+        result.error(line, None, "Not a valid row.")
+        return None
+
+    data = _formdata(row)
+    form.process(formdata=data)
+    if not form.validate():
+        for field, messages in form.errors.items():
+            for message in messages:
+                result.error(line, field, message)
+        return None
+
+    # Kept as given even for users without credit hours (their GPA ignores them), so an
+    # export from an account that uses them imports back unchanged
+    credit_hours = form.credit_hours.data or 1.0
+
+    grade, letter = stored_grade(form.grade_type.data, form.grade.data, form.letter.data)
+    grade_date = form.date.data
+    semester_id = None
+    name = data.get('semester')
+    if name:
+        if len(name) > SEMESTER_NAME_LENGTH:
+            result.error(line, 'semester', f"Semester names are at most {SEMESTER_NAME_LENGTH} characters.")
+            return None
+        start = data.get('semester_start')
+        start_date = _parse_date(start) if start else None
+        if start and start_date is None:
+            result.error(line, 'semester_start', "Not a valid date value.")
+            return None
+        semester_id, semester_start = semesters.resolve(name, start_date or grade_date or date.today())
+        grade_date = grade_date or semester_start
+
+    return {
+        'subject': form.subject.data,
+        'grade': grade,
+        'letter': letter,
+        'course_type': form.course_type.data or 'Regular',
+        'date': grade_date,
+        'semester_id': semester_id,
+        'credit_hours': credit_hours,
+        'user_id': user.id,
+    }
@@ -0,0 +1,100 @@
+"""Keyset-paginated grade listing for the dashboard table.
+
+grade_page() returns one page of a user's grades (with their semesters, in the
+same query) sorted by date, subject or grade, with the grade id as
+tie-breaker. The dashboard renders the first page; the table then fetches
+further pages from /grades/page as JSON using next_cursor.
+
+Every sort is served by an index on (user_id, sort key), whose implicit rowid
+is the tie-breaker, so the page query seeks to the cursor and reads `limit`
+rows without sorting the user's grades. Grades without a date are a separate
+range of ix_grade_user_date (see app/keyset.py): they sort last when
+descending and first when ascending, by id. A page that crosses from one
+range to the other takes a second query.
+"""
+from collections import namedtuple
+from datetime import date
+
+from flask import url_for
+from sqlalchemy import func, select
+
+from app import db
+from app.gpa import get_letter_grade
+from app.keyset import decode_cursor, encode_cursor, range_query, ranges
+from app.models import Grade
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+SORTS = ('date', 'subject', 'grade')
+
+GradePage = namedtuple('GradePage', 'grades next_cursor sort direction')
+
+
+def _date(value):
+    return None if value is None else date.fromisoformat(value)
+
+
+def _sort_key(sort):
+    """(SQL expression, cursor value parser, nullable) for a sort name.
+
+    Each expression must match an index on grade (see app/models.py).
+    """
+    if sort == 'subject':
+        return func.lower(Grade.subject), str, False
+    if sort == 'grade':
+        return Grade.grade, float, False
+    return Grade.date, _date, True
+
+
+def page_statement(user, sort='date', direction='desc', position=None, undated=False, limit=PAGE_SIZE):
+    """The query for one range of a page: rows after position, dated or (undated=True) not."""
+    key, _, nullable = _sort_key(sort)
+    stmt = (
+        select(Grade, key)
+        .outerjoin(Grade.semester)
+        .options(db.contains_eager(Grade.semester))
+        .where(Grade.user_id == user.id)
+    )
+    return range_query(stmt, key, Grade.id, direction, undated, position, nullable).limit(limit)
+
+
+def grade_page(user, sort='date', direction='desc', cursor=None, limit=PAGE_SIZE):
+    if sort not in SORTS:
+        sort = 'date'
+    direction = 'asc' if direction == 'asc' else 'desc'
+    limit = max(1, min(int(limit or PAGE_SIZE), MAX_PAGE_SIZE))
+
+    _, parse, nullable = _sort_key(sort)
+    position = decode_cursor(cursor, parse)
+
+    # One extra row tells us whether there is a next page
+    results = []
+    for undated, start in ranges(direction, position, nullable):
+        results += db.session.execute(
+            page_statement(user, sort, direction, start, undated, limit + 1 - len(results))
+        ).all()
+        if len(results) > limit:
+            break
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_grade, last_key = results[-1]
+        next_cursor = encode_cursor(last_key, last_grade.id)
+    return GradePage([grade for grade, _ in results], next_cursor, sort, direction)
+
+
+def grade_json(grade, grade_format):
+    """A grade as the dashboard table's JSON row."""
+    return {
+        'id': grade.id,
+        'subject': grade.subject,
+        'grade': grade.grade,
+        'letter': get_letter_grade(grade.grade, grade_format),
+        'course_type': grade.course_type,
+        'date': grade.date.strftime('%Y-%m-%d') if grade.date else None,
+        'date_display': grade.date.strftime('%b %d %Y') if grade.date else None,
+        'semester': grade.semester.name if grade.semester else None,
+        'semester_start': grade.semester.start_date.strftime('%Y-%m-%d') if grade.semester and grade.semester.start_date else None,
+        'edit_url': url_for('main.edit_grade', grade_id=grade.id),
+        'delete_url': url_for('main.delete_grade', grade_id=grade.id)
+    }
@@ -0,0 +1,81 @@
+"""Opaque cursors for keyset pagination.
+
+A cursor is the (sort value, id) of the last row on a page, JSON-encoded and
+base64'd so it can travel in a query string. The next page is the rows that
+sort strictly after it.
+
+Sort keys are bare columns (or indexed expressions), so an index on
+(..., key) serves both the ORDER BY and the seek to the cursor. A nullable
+key is read as two ranges, rows with a value and rows without, in SQLite's
+order: NULL sorts first ascending and last descending, by id. range_query()
+builds the query for one range and ranges() says which to read.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, tuple_
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, parse):
+    """(value, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        return parse(value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def after(key, id_column, position, direction):
+    """WHERE clause for rows that sort after position ((value, id)) in direction."""
+    current = tuple_(key, id_column)
+    # The bound on key alone lets SQLite seek an index on an expression key, which
+    # it does not do for the row-value comparison
+    if direction == 'desc':
+        return and_(key <= position[0], current < tuple_(*position))
+    return and_(key >= position[0], current > tuple_(*position))
+
+
+def order(key, id_column, direction):
+    if direction == 'desc':
+        return key.desc(), id_column.desc()
+    return key, id_column
+
+
+def ranges(direction, position, nullable):
+    """(null, position) for each range to read in order, starting at the cursor's range.
+
+    The position applies only to the range the cursor is in; later ranges are
+    read from their start.
+    """
+    if not nullable:
+        return [(False, position)]
+    nulls = [False, True] if direction == 'desc' else [True, False]
+    if position is None:
+        return [(null, None) for null in nulls]
+    start = nulls.index(position[0] is None)
+    return [(null, position if null == nulls[start] else None) for null in nulls[start:]]
+
+
+def range_query(stmt, key, id_column, direction, null=False, position=None, nullable=False):
+    """stmt limited to one range of a key, after position, in sort order."""
+    if null:
+        stmt = stmt.where(key.is_(None))
+        if position is not None:
+            stmt = stmt.where(id_column < position[1] if direction == 'desc' else id_column > position[1])
+        return stmt.order_by(id_column.desc() if direction == 'desc' else id_column)
+    if nullable:
+        stmt = stmt.where(key.is_not(None))
+    if position is not None:
+        stmt = stmt.where(after(key, id_column, position, direction))
+    return stmt.order_by(*order(key, id_column, direction))
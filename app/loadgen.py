@@ -0,0 +1,393 @@
+"""Closed-loop load generator replaying student and admin sessions.
+
+Each virtual user is a thread with its own cookie jar. It logs in as one of
+the seeded accounts (`flask seed`: <prefix>0, <prefix>1, ... sharing one
+password), then repeats until the run ends:
+1. pick an action from the weighted mix
+2. run its requests
+3. think for an exponentially distributed pause
+
+Closed loop means a virtual user sends its next request only after the
+previous one has been answered. Concurrency is the number of virtual users,
+and throughput is whatever the server sustains at that concurrency.
+
+Actions are built from the pages a student uses:
+- dashboard, semesters, trends
+- add grade, edit semester, change settings
+- log out and back in
+
+Admin virtual users (--admins) log in as the admin account and browse the
+admin dashboard, user details and timing pages instead. Every POST carries
+the CSRF token from the form it submits, as a browser would, so the run
+works with WTF_CSRF_ENABLED on.
+
+Requests go over real HTTP, to a running gunicorn (--url) or to an
+in-process threaded server on the configured app. Redirects are not
+followed: a POST is timed on its own, and its page view is a separate
+request.
+
+For each endpoint the report has requests, throughput, latency percentiles
+and errors. Errors are 5xx responses, unexpected statuses and connection
+failures. Requests that failed with SQLite's "database is locked" are read
+from the server's /metrics (gradepilot_db_locked_errors_total) before and
+after the run. This needs METRICS_ENABLED on the server, and METRICS_TOKEN in
+the environment if the server has one. With several gunicorn workers it also
+needs METRICS_DIR.
+"""
+import http.client
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from app.bench import percentile
+from app.gpa import COURSE_TYPES
+from app.seed import ADMIN_USERNAME, GPA_SCALES, GRADE_FORMATS, SUBJECTS
+
+CSRF_INPUT = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+ADMIN_USER_LINK = re.compile(r'viewUserDetails\((\d+)\)')
+LOCKED_METRIC = re.compile(r'^gradepilot_db_locked_errors_total\{endpoint="([^"]*)"\} (\S+)$', re.M)
+
+STUDENT_MIX = {
+    'dashboard': 40,
+    'semesters': 10,
+    'trends': 15,
+    'add_grade': 15,
+    'edit_semester': 8,
+    'settings': 5,
+    'login': 5,
+}
+ADMIN_MIX = {
+    'admin_dashboard': 60,
+    'admin_user': 30,
+    'admin_timing': 10,
+}
+
+
+def parse_mix(value, default):
+    """A mix as {action: weight}, from a dict or a "action=weight,..." string."""
+    if not value:
+        return dict(default)
+    if isinstance(value, dict):
+        mix = dict(value)
+    else:
+        mix = {}
+        for item in value.split(','):
+            name, _, weight = item.partition('=')
+            if name.strip():
+                mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(default)
+    if unknown:
+        raise ValueError(f"Unknown actions {', '.join(sorted(unknown))}; choose from {', '.join(default)}")
+    return mix
+
+
+class Recorder:
+    """Latencies and outcomes per endpoint, shared by every virtual user."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds, status, error):
+        with self._lock:
+            self.latencies[key].append(seconds)
+            self.statuses[key][status] += 1
+            if error:
+                self.errors[key] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        with self._lock:
+            for key, seconds in self.latencies.items():
+                times = [s * 1000 for s in seconds]
+                rows[key] = {
+                    'requests': len(times),
+                    'rps': round(len(times) / elapsed, 2) if elapsed else 0.0,
+                    'p50_ms': round(percentile(times, 50), 2),
+                    'p95_ms': round(percentile(times, 95), 2),
+                    'p99_ms': round(percentile(times, 99), 2),
+                    'max_ms': round(max(times), 2),
+                    'errors': self.errors[key],
+                    'error_rate': round(self.errors[key] / len(times), 4),
+                    'statuses': {str(status): count for status, count in sorted(self.statuses[key].items())},
+                }
+        return dict(sorted(rows.items()))
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, base_url, username, password, mix, think, recorder, rng, deadline):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.username = username
+        self.password = password
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.think = think
+        self.recorder = recorder
+        self.rng = rng
+        self.deadline = deadline
+        self.cookies = {}
+        self.csrf_token = None
+        self.semesters = []
+        self.user_ids = []
+        self.connection = None
+
+    # HTTP
+
+    def request(self, method, path, endpoint, data=None, expect=(200, 302)):
+        """One request; returns (status, body text) and records it under 'METHOD endpoint'."""
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if data is not None:
+            if self.csrf_token:
+                data = dict(data, csrf_token=self.csrf_token)
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = self.connection_class(self.netloc, timeout=60)
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            text = response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self.recorder.add(f'{method} {endpoint}', time.perf_counter() - started, 0, True)
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            return 0, ''
+        elapsed = time.perf_counter() - started
+
+        self._store_cookies(response.headers.get_all('Set-Cookie') or [])
+        token = CSRF_INPUT.search(text)
+        if token:
+            self.csrf_token = token.group(1)
+        self.recorder.add(f'{method} {endpoint}', elapsed, response.status, response.status not in expect)
+        return response.status, text
+
+    def _store_cookies(self, headers):
+        for header in headers:
+            cookie = SimpleCookie()
+            cookie.load(header)
+            for name, morsel in cookie.items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+
+    def get(self, path, endpoint, **kwargs):
+        return self.request('GET', path, endpoint, **kwargs)
+
+    def post(self, path, endpoint, data, expect=(302,)):
+        # A form that fails validation (a bad CSRF token included) is re-rendered with 200
+        return self.request('POST', path, endpoint, data=data, expect=expect)
+
+    # Session
+
+    def login(self):
+        self.cookies.clear()
+        self.csrf_token = None
+        self.get('/login', 'main.login')
+        status, _ = self.post('/login', 'main.login', {'username': self.username, 'password': self.password})
+        if status != 302:
+            raise LoginFailed(f"{self.username} could not log in (status {status})")
+        if self.username != ADMIN_USERNAME:
+            status, text = self.get('/api/v1/semesters', 'api.semesters')
+            if status == 200:
+                self.semesters = json.loads(text)['semesters']
+
+    def run(self):
+        try:
+            self.login()
+        except LoginFailed:
+            return
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(self.actions, self.weights)[0]
+            getattr(self, f'do_{action}')()
+            if self.think:
+                pause = min(self.rng.expovariate(1 / self.think), self.deadline - time.monotonic())
+                if pause > 0:
+                    time.sleep(pause)
+        if self.connection is not None:
+            self.connection.close()
+
+    # Student actions
+
+    def do_dashboard(self):
+        self.get('/', 'main.index')
+
+    def do_semesters(self):
+        self.get('/semesters', 'main.semesters')
+
+    def do_trends(self):
+        self.get('/trends', 'main.trends')
+
+    def do_add_grade(self):
+        self.get('/add', 'main.add_grade')
+        semester = self.rng.choice(self.semesters)['id'] if self.semesters else 0
+        self.post('/add', 'main.add_grade', {
+            'subject': self.rng.choice(SUBJECTS),
+            'grade_type': 'number',
+            'grade': str(round(min(100.0, max(40.0, self.rng.gauss(85, 9))), 1)),
+            'course_type': self.rng.choice(COURSE_TYPES),
+            'semester_id': str(semester),
+            'credit_hours': self.rng.choice(['1', '3', '4']),
+        })
+
+    def do_edit_semester(self):
+        if not self.semesters:
+            return self.do_semesters()
+        semester = self.rng.choice(self.semesters)
+        path = f"/edit_semester/{semester['id']}"
+        self.get(path, 'main.edit_semester')
+        # Alternate between two names so every save is a real change
+        name = semester['name']
+        name = name[:-1] if name.endswith('*') else name[:31] + '*'
+        status, _ = self.post(path, 'main.edit_semester', {'name': name, 'start_date': semester['start_date']})
+        if status == 302:
+            semester['name'] = name
+
+    def do_settings(self):
+        self.get('/settings', 'main.settings')
+        data = {'gpa_scale': self.rng.choice(GPA_SCALES), 'grade_format': self.rng.choice(GRADE_FORMATS)}
+        if self.rng.random() < 0.3:
+            data['use_credit_hours'] = 'y'
+        self.post('/settings', 'main.settings', data)
+
+    def do_login(self):
+        self.get('/logout', 'main.logout')
+        try:
+            self.login()
+        except LoginFailed:
+            self.deadline = 0
+
+    # Admin actions
+
+    def do_admin_dashboard(self):
+        status, text = self.get('/admin', 'main.admin_dashboard')
+        if status == 200:
+            self.user_ids = ADMIN_USER_LINK.findall(text) or self.user_ids
+
+    def do_admin_user(self):
+        if not self.user_ids:
+            return self.do_admin_dashboard()
+        self.get(f'/admin/user/{self.rng.choice(self.user_ids)}', 'main.admin_user_details')
+
+    def do_admin_timing(self):
+        self.get('/admin/timing', 'main.admin_timing')
+
+
+def locked_counts(base_url):
+    """{endpoint: count} from the server's /metrics, or None if it has none."""
+    parts = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.netloc, timeout=30)
+    try:
+        token = os.environ.get('METRICS_TOKEN')
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        connection.request('GET', parts.path.rstrip('/') + '/metrics', headers=headers)
+        response = connection.getresponse()
+        text = response.read().decode('utf-8', 'replace')
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+    if response.status != 200:
+        return None
+    return {endpoint: float(value) for endpoint, value in LOCKED_METRIC.findall(text)}
+
+
+def run_load(base_url, users=20, duration=30.0, think=1.0, accounts=100, prefix='seed', password='password',
+             admins=0, student_mix=None, admin_mix=None, seed=0):
+    """Run the virtual users against base_url for `duration` seconds; returns the JSON-ready report."""
+    student_mix = parse_mix(student_mix, STUDENT_MIX)
+    admin_mix = parse_mix(admin_mix, ADMIN_MIX)
+    recorder = Recorder()
+    locked_before = locked_counts(base_url)
+
+    started = time.monotonic()
+    deadline = started + duration
+    threads = []
+    for i in range(users):
+        if i < admins:
+            username, mix = ADMIN_USERNAME, admin_mix
+        else:
+            username, mix = f'{prefix}{(i - admins) % accounts}', student_mix
+        user = VirtualUser(base_url, username, password, mix, think, recorder, random.Random(seed * 100003 + i),
+                           deadline)
+        threads.append(threading.Thread(target=user.run, name=f'vu-{i}', daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    locked = None
+    locked_after = locked_counts(base_url)
+    if locked_before is not None and locked_after is not None:
+        locked = {endpoint: int(count - locked_before.get(endpoint, 0.0))
+                  for endpoint, count in locked_after.items() if count > locked_before.get(endpoint, 0.0)}
+
+    endpoints = recorder.report(elapsed)
+    total = sum(row['requests'] for row in endpoints.values())
+    errors = sum(row['errors'] for row in endpoints.values())
+    all_times = [s * 1000 for seconds in recorder.latencies.values() for s in seconds]
+    return {
+        'params': {
+            'url': base_url, 'users': users, 'admins': admins, 'duration': duration, 'think': think,
+            'accounts': accounts, 'student_mix': student_mix, 'admin_mix': admin_mix, 'seed': seed,
+        },
+        'elapsed': round(elapsed, 2),
+        'total': {
+            'requests': total,
+            'rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(all_times, 50), 2),
+            'p95_ms': round(percentile(all_times, 95), 2),
+            'p99_ms': round(percentile(all_times, 99), 2),
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'locked': sum(locked.values()) if locked is not None else None,
+        },
+        'endpoints': endpoints,
+        'locked': locked,
+    }
+
+
+class LocalServer:
+    """The app on a threaded werkzeug server in this process, on a free port."""
+
+    def __init__(self, app, host='127.0.0.1', port=0):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server(host, port, app, threaded=True, request_handler=QuietHandler)
+        self.url = f'http://{host}:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, name='loadgen-server', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
@@ -0,0 +1,385 @@
+"""Prometheus metrics at /metrics.
+
+Exposes, in the Prometheus text format (0.0.4):
+
+- request latency histograms and request counts per endpoint
+- DB statements, rows and SQL time per endpoint
+- GPA engine and template render time per endpoint
+- requests that failed with SQLite's "database is locked", per endpoint
+- activity queue depth, plus events written and dropped
+- fragment cache hits, misses and size
+- users online
+
+Request numbers come from app/timing.py's per-request stats, so recording
+one request costs a handful of dict updates under one short lock. Queue and
+cache figures are read from their owners when a snapshot is taken. Users
+online is counted in the database at most once per PRESENCE_WRITE_INTERVAL,
+the interval it is written at.
+
+The endpoint is off unless METRICS_ENABLED is set. It shows traffic, errors
+and users online, so a scrape must send "Authorization: Bearer
+<METRICS_TOKEN>"; without a token configured, only clients on this machine
+(loopback addresses) may scrape. Behind a reverse proxy on the same machine
+every client looks local, so set a token there. Other clients get a 404.
+
+Gunicorn runs several worker processes, each with its own in-memory values.
+With METRICS_DIR set, every worker writes its values to
+METRICS_DIR/metrics_<pid>.json, at most every METRICS_FLUSH_INTERVAL
+seconds and at exit. The file is written to a temporary name and renamed
+into place. A scrape merges the other workers' files with the scraped
+worker's in-memory values, without writing its own file:
+- Counters and histograms are summed, including those of exited workers,
+  so totals never go backwards.
+- Gauges are summed over live workers only.
+
+Clear the directory when the server (not a worker) starts. Without
+METRICS_DIR, the scraped worker reports only its own values.
+"""
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+
+from flask import Response, abort, current_app, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LOOPBACK = ('127.0.0.1', '::1')
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def values(self):
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_total(self, value, *labels):
+        """Take a running total kept elsewhere in this process (for collectors)."""
+        with self._lock:
+            self._values[labels] = float(value)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), local=False):
+        super().__init__(name, help, labels)
+        # A local gauge is computed by the worker answering the scrape, never merged
+        self.local = local
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket (not cumulative), then sum and count
+                counts = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+
+class MetricsRegistry:
+    def __init__(self, app=None):
+        self.metrics = {}
+        self.collectors = []
+        self.directory = None
+        self.flush_interval = 1.0
+        self._last_flush = 0.0
+        self._registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', False)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 1.0)
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        if not self._registered:
+            atexit.register(self.flush)
+            # A forked worker starts from zero instead of repeating the parent's counts
+            os.register_at_fork(after_in_child=self.reset)
+            self._registered = True
+
+    def add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), local=False):
+        return self.add(Gauge(name, help, labels, local))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        """Call collector(local) before each snapshot; local is True only when scraping."""
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+        self._last_flush = 0.0
+
+    def collect(self, local=False):
+        for collector in self.collectors:
+            collector(local)
+
+    def snapshot(self):
+        """This process's values of every shared (non-local) metric."""
+        self.collect()
+        return {
+            name: [[list(labels), value] for labels, value in metric.values().items()]
+            for name, metric in self.metrics.items()
+            if not getattr(metric, 'local', False)
+        }
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR."""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        temp = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'pid': os.getpid(), 'metrics': self.snapshot()}, f)
+        os.replace(temp, path)
+
+    def merged(self):
+        """{name: {labels: value}} over every worker's file (or this process alone)."""
+        snapshots = [(True, self.snapshot())]
+        if self.directory:
+            own = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+            for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+                if path == own:
+                    continue  # this worker's values are the in-memory ones
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue  # removed or replaced while listing
+                snapshots.append((_alive(data['pid']), data['metrics']))
+
+        merged = {name: {} for name in self.metrics}
+        for alive, snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                totals = merged[name]
+                for labels, value in values:
+                    labels = tuple(labels)
+                    if isinstance(value, list):
+                        current = totals.get(labels)
+                        totals[labels] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        totals[labels] = totals.get(labels, 0.0) + value
+
+        self.collect(local=True)
+        for name, metric in self.metrics.items():
+            if getattr(metric, 'local', False):
+                merged[name] = metric.values()
+        return merged
+
+    def render(self):
+        lines = []
+        merged = self.merged()
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in sorted(merged.get(name, {}).items()):
+                pairs = list(zip(metric.labels, labels))
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(pairs + [("le", _number(bound))])} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(pairs + [("le", "+Inf")])} {value[-1]}')
+                    lines.append(f'{name}_sum{_labels(pairs)} {_number(value[-2])}')
+                    lines.append(f'{name}_count{_labels(pairs)} {value[-1]}')
+                else:
+                    lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        if not allowed():
+            abort(404)
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+def allowed():
+    """Whether the current request may scrape: the right bearer token, or a local client if none is set."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        sent = request.headers.get('Authorization', '')
+        return hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode())
+    return request.remote_addr in LOOPBACK
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    'gradepilot_request_duration_seconds', 'Request wall time by endpoint.', ('endpoint',))
+REQUESTS = metrics.counter(
+    'gradepilot_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'status'))
+DB_STATEMENTS = metrics.counter(
+    'gradepilot_db_statements_total', 'SQL statements executed by endpoint.', ('endpoint',))
+DB_ROWS = metrics.counter(
+    'gradepilot_db_rows_total', 'Rows fetched by endpoint.', ('endpoint',))
+DB_SECONDS = metrics.counter(
+    'gradepilot_db_seconds_total', 'Time spent executing SQL by endpoint.', ('endpoint',))
+GPA_SECONDS = metrics.counter(
+    'gradepilot_gpa_seconds_total', 'Time spent in the GPA engine by endpoint.', ('endpoint',))
+RENDER_SECONDS = metrics.counter(
+    'gradepilot_render_seconds_total', 'Time spent rendering templates by endpoint.', ('endpoint',))
+DB_LOCKED = metrics.counter(
+    'gradepilot_db_locked_errors_total', 'Requests that failed with "database is locked", by endpoint.', ('endpoint',))
+ACTIVITY_QUEUE_DEPTH = metrics.gauge(
+    'gradepilot_activity_queue_depth', 'Activity events queued and not yet written.')
+ACTIVITY_WRITTEN = metrics.counter(
+    'gradepilot_activity_events_written_total', 'Activity events written by the activity sink.')
+ACTIVITY_DROPPED = metrics.counter(
+    'gradepilot_activity_events_dropped_total', 'Activity events dropped because the queue was full.')
+FRAGMENT_HITS = metrics.counter(
+    'gradepilot_fragment_cache_hits_total', 'Rendered-fragment cache hits.')
+FRAGMENT_MISSES = metrics.counter(
+    'gradepilot_fragment_cache_misses_total', 'Rendered-fragment cache misses.')
+FRAGMENT_ENTRIES = metrics.gauge(
+    'gradepilot_fragment_cache_entries', 'Fragments held in the in-process cache.')
+USERS_ONLINE = metrics.gauge(
+    'gradepilot_users_online', 'Users seen within PRESENCE_TTL, as last written to the database.', local=True)
+
+
+def observe_request(endpoint, status, wall, stats):
+    """request_timing observer: record one finished request."""
+    REQUEST_LATENCY.observe(wall, endpoint)
+    REQUESTS.inc(1, endpoint, str(status))
+    DB_STATEMENTS.inc(stats.statements, endpoint)
+    DB_ROWS.inc(stats.rows, endpoint)
+    DB_SECONDS.inc(stats.sql_time, endpoint)
+    if 'gpa' in stats.spans:
+        GPA_SECONDS.inc(stats.spans['gpa'], endpoint)
+    if 'render' in stats.spans:
+        RENDER_SECONDS.inc(stats.spans['render'], endpoint)
+    metrics.maybe_flush()
+
+
+def observe_exception(sender, exception, **extra):
+    """got_request_exception receiver: count requests lost to SQLite write locks."""
+    from flask import request
+    from sqlalchemy.exc import OperationalError
+
+    if isinstance(exception, OperationalError) and 'database is locked' in str(exception.orig):
+        DB_LOCKED.inc(1, request.endpoint or 'unmatched')
+
+
+def collect_app_metrics(local):
+    """Read queue, cache and presence figures from their owners."""
+    from app.activity import activity_sink
+    from app.fragments import fragment_cache
+
+    ACTIVITY_QUEUE_DEPTH.set(activity_sink.depth)
+    ACTIVITY_WRITTEN.set_total(activity_sink.written)
+    ACTIVITY_DROPPED.set_total(activity_sink.dropped)
+    FRAGMENT_HITS.set_total(fragment_cache.hits)
+    FRAGMENT_MISSES.set_total(fragment_cache.misses)
+    if hasattr(fragment_cache.backend, '__len__'):
+        FRAGMENT_ENTRIES.set(len(fragment_cache.backend))
+    if local:
+        USERS_ONLINE.set(_users_online())
+
+
+# (count, time.monotonic() it was taken at) of the last users online count
+_online = (0, None)
+
+
+def _users_online():
+    from datetime import datetime, timedelta
+
+    from app.models import User
+
+    global _online
+    # Workers each track their own users; the database has the union, PRESENCE_WRITE_INTERVAL behind,
+    # so counting it more often than that gives the same answer
+    count, counted_at = _online
+    now = time.monotonic()
+    if counted_at is None or now - counted_at >= current_app.config.get('PRESENCE_WRITE_INTERVAL', 60):
+        cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('PRESENCE_TTL', 300))
+        count = User.query.filter(User.is_online.is_(True), User.last_seen >= cutoff).count()
+        _online = (count, now)
+    return count
@@ -1,7 +1,10 @@
 from flask_login import UserMixin
 from app import db
+from app.tracing import get_logger
 from datetime import datetime
 
+log = get_logger(__name__)
+
 # ----------------------------
 # Custom GPA Configuration Model
 # ----------------------------
@@ -49,6 +52,11 @@ class UserSettings(db.Model):
 # User Model
 # ----------------------------
 class User(db.Model, UserMixin):
+    __table_args__ = (
+        # Admin user table's last_seen sort (app/admin_users.py)
+        db.Index('ix_user_last_seen', 'last_seen'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
@@ -85,6 +93,9 @@ class User(db.Model, UserMixin):
 
     # Relationships
     settings = db.relationship('UserSettings', uselist=False, backref='user', cascade="all, delete")
+    grades = db.relationship('Grade', backref='user', lazy=True, cascade="all, delete")
+    semesters = db.relationship('Semester', backref='user', lazy=True, cascade="all, delete")
+    custom_gpas = db.relationship('CustomGPA', lazy=True, cascade="all, delete")
 
     # New field to track first login
     first_login = db.Column(db.Boolean, default=True)
@@ -93,7 +104,18 @@ class User(db.Model, UserMixin):
     is_admin = db.Column(db.Boolean, default=False)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     is_online = db.Column(db.Boolean, default=False)
+
+    # Bumped on every change to the user's data (see app/versioning.py)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Oldest data_version the change journal can still sync from (see app/sync.py)
+    journal_floor = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    change_journal = db.relationship('ChangeJournal', lazy=True, cascade="all, delete")
     activities = db.relationship('UserActivity', backref='user', lazy=True)
+    activity_rollups = db.relationship('UserActivityDaily', lazy=True)
+
+    # Materialized GPA totals (see app/summary.py)
+    gpa_summary = db.relationship('GpaSummary', uselist=False, cascade="all, delete")
+    semester_summaries = db.relationship('SemesterGpaSummary', lazy=True, cascade="all, delete")
 
     # Helper methods
     def get_custom_gpa_value(self, letter):
@@ -118,7 +140,7 @@ class User(db.Model, UserMixin):
         try:
             return float(val)
         except (ValueError, TypeError):
-            print(f"[DEBUG] Invalid custom GPA value for '{letter}': {val}")
+            log.debug("Invalid custom GPA value for %r: %r", letter, val, sample=0.01)
             return None
 
     def get_course_weight(self, course_type):
@@ -151,8 +173,9 @@ class User(db.Model, UserMixin):
 
     def get_activity_stats(self):
         """Get statistics about user's activity"""
+        from app.retention import activity_total
         return {
-            'total_actions': UserActivity.query.filter_by(user_id=self.id).count(),
+            'total_actions': activity_total(self.id),
             'last_action': UserActivity.query.filter_by(user_id=self.id)
                 .order_by(UserActivity.timestamp.desc()).first(),
             'total_grades': Grade.query.filter_by(user_id=self.id).count(),
@@ -164,11 +187,16 @@ class User(db.Model, UserMixin):
 # Semester Model (NEW)
 # ----------------------------
 class Semester(db.Model):
+    __table_args__ = (
+        db.Index('ix_semester_user_start_date', 'user_id', 'start_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(32), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     grades = db.relationship('Grade', backref='semester', lazy=True)
+    summary = db.relationship('SemesterGpaSummary', uselist=False, backref='semester', cascade="all, delete")
 
     def to_dict(self):
         return {
@@ -184,6 +212,14 @@ class Semester(db.Model):
 # Grade Model
 # ----------------------------
 class Grade(db.Model):
+    __table_args__ = (
+        db.Index('ix_grade_user_date', 'user_id', 'date'),
+        # Dashboard table sorts (app/grade_list.py)
+        db.Index('ix_grade_user_subject', 'user_id', db.text('lower(subject)')),
+        db.Index('ix_grade_user_grade', 'user_id', 'grade'),
+        db.Index('ix_grade_semester_id', 'semester_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     subject = db.Column(db.String(100), nullable=False)
     grade = db.Column(db.Float, nullable=False)  # Numeric grade (optional)
@@ -222,6 +258,11 @@ class Grade(db.Model):
 # UserActivity Model
 # ----------------------------
 class UserActivity(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_activity_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_user_activity_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Nullable for guest users
     action = db.Column(db.String(100), nullable=False)  # e.g., 'login', 'add_grade', 'delete_grade'
@@ -240,3 +281,80 @@ class UserActivity(db.Model):
             'user_agent': self.user_agent,
             'details': self.details
         }
+
+
+class UserActivityDaily(db.Model):
+    """Per-user, per-action, per-day counts of compacted UserActivity rows (see app/retention.py)."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'action', 'day', name='uq_user_activity_daily_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    action = db.Column(db.String(100), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChangeJournal(db.Model):
+    """One change to a user's grades, semesters or settings, stamped with the data_version it produced."""
+    __table_args__ = (
+        db.Index('ix_change_journal_user_version', 'user_id', 'version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # 'grade', 'semester' or 'settings'
+    entity_id = db.Column(db.Integer, nullable=False)  # the user's id for 'settings'
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+# ----------------------------
+# GPA Summary Models
+# ----------------------------
+class GpaSummary(db.Model):
+    """Running GPA totals for one user, kept up to date by the grade routes."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    policy_key = db.Column(db.String(40), nullable=False)  # GpaPolicy.key the totals were computed with
+    total_points = db.Column(db.Float, nullable=False, default=0.0)  # sum of weighted points x credits
+    total_credits = db.Column(db.Float, nullable=False, default=0.0)
+    grade_count = db.Column(db.Integer, nullable=False, default=0)
+    numeric_sum = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def gpa(self):
+        return round(self.total_points / self.total_credits, 2) if self.total_credits else 0.0
+
+    @property
+    def average(self):
+        return round(self.numeric_sum / self.grade_count, 2) if self.grade_count else None
+
+
+class SemesterGpaSummary(db.Model):
+    """GPA totals for the grades in one semester, plus running totals up to and including it."""
+    __table_args__ = (
+        db.Index('ix_semester_gpa_summary_user_order', 'user_id', 'start_date', 'semester_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=False, unique=True)
+    start_date = db.Column(db.Date, nullable=True)  # copy of Semester.start_date, for ordering
+    total_points = db.Column(db.Float, nullable=False, default=0.0)
+    total_credits = db.Column(db.Float, nullable=False, default=0.0)
+    grade_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Prefix sums over the user's semesters ordered by (start_date, semester_id)
+    cum_points = db.Column(db.Float, nullable=False, default=0.0)
+    cum_credits = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def gpa(self):
+        return round(self.total_points / self.total_credits, 2) if self.total_credits else 0.0
+
+    @property
+    def cumulative_gpa(self):
+        return round(self.cum_points / self.cum_credits, 2) if self.cum_credits else 0.0
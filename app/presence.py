@@ -0,0 +1,120 @@
+"""Coalesced presence tracking.
+
+Every authenticated request calls presence.heartbeat(), which only updates an
+in-memory {user_id: last heartbeat} map. A user counts as online while their
+last heartbeat is younger than PRESENCE_TTL seconds. The database is written
+from the activity sink's flush (see app/activity.py): last_seen at most once
+per PRESENCE_WRITE_INTERVAL seconds per user, and is_online=False once a user
+expires from the map or logs out.
+
+The map is per process, so with several workers each one counts the users it
+has served; User.last_seen is the shared (coarser) record.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, update
+
+
+class PresenceTracker:
+    def __init__(self, app=None):
+        self.ttl = timedelta(seconds=300)
+        self.write_interval = timedelta(seconds=60)
+        self._seen = {}
+        self._written = {}
+        self._left = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PRESENCE_TTL', 300)
+        app.config.setdefault('PRESENCE_WRITE_INTERVAL', 60)
+        self.ttl = timedelta(seconds=app.config['PRESENCE_TTL'])
+        self.write_interval = timedelta(seconds=app.config['PRESENCE_WRITE_INTERVAL'])
+
+    def heartbeat(self, user_id, now=None):
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._seen[user_id] = now
+            self._left.pop(user_id, None)
+
+    def leave(self, user_id, now=None):
+        """Mark a user offline right away (e.g. on logout)."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._seen.pop(user_id, None)
+            self._written.pop(user_id, None)
+            self._left[user_id] = now
+
+    def last_seen(self, user):
+        """The most recent of the in-memory heartbeat and the stored last_seen."""
+        seen = self._seen.get(user.id)
+        if seen is None or (user.last_seen is not None and user.last_seen > seen):
+            return user.last_seen
+        return seen
+
+    def is_online(self, user, now=None):
+        """Online if heartbeated within the TTL here, or (for users served by
+        another worker) stored as online with a recent enough last_seen."""
+        now = now or datetime.utcnow()
+        if user.id in self._left:
+            return False
+        seen = self._seen.get(user.id)
+        if seen is None:
+            if not user.is_online or user.last_seen is None:
+                return False
+            # The stored value can lag by up to one write interval
+            return now - user.last_seen <= self.ttl + self.write_interval
+        return now - seen <= self.ttl
+
+    def online_ids(self, now=None):
+        cutoff = (now or datetime.utcnow()) - self.ttl
+        with self._lock:
+            return {user_id for user_id, seen in self._seen.items() if seen >= cutoff}
+
+    def online_count(self, now=None):
+        return len(self.online_ids(now))
+
+    def pending_writes(self, now=None):
+        """Rows to write for User: due last_seen updates, then users gone offline.
+
+        Expired users are dropped from the map, so it only ever holds users seen
+        within the TTL.
+        """
+        now = now or datetime.utcnow()
+        rows = []
+        with self._lock:
+            for user_id, seen in list(self._seen.items()):
+                if now - seen > self.ttl:
+                    del self._seen[user_id]
+                    self._written.pop(user_id, None)
+                    rows.append({'id': user_id, 'last_seen': seen, 'is_online': False})
+                    continue
+                written = self._written.get(user_id)
+                if written is None or seen - written >= self.write_interval:
+                    self._written[user_id] = seen
+                    rows.append({'id': user_id, 'last_seen': seen, 'is_online': True})
+            for user_id, left_at in self._left.items():
+                rows.append({'id': user_id, 'last_seen': left_at, 'is_online': False})
+            self._left.clear()
+        return rows
+
+    def flush(self):
+        """Write pending presence rows; runs inside the activity sink's flush."""
+        from app import db
+        from app.models import User
+
+        rows = self.pending_writes()
+        if rows:
+            # Core executemany: a user deleted since their heartbeat just matches no row
+            table = User.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('user_id'))
+                .values(last_seen=bindparam('seen'), is_online=bindparam('online')),
+                [{'user_id': row['id'], 'seen': row['last_seen'], 'online': row['is_online']} for row in rows]
+            )
+
+
+presence = PresenceTracker()
@@ -0,0 +1,239 @@
+"""Query budgets: the most SQL statements a route may run per request.
+
+Every route in `main` declares its budget with @query_budget(n), placed
+directly under @main.route. The number covers the whole request, including
+the Flask-Login user load, and must not depend on how many grades or
+semesters the user has. A page that starts running one query per row (an
+N+1, such as reading semester.grades for each semester) goes over budget as
+soon as the data grows.
+
+Statements are counted by app/timing.py, so a budget counts exactly what
+Server-Timing reports. Budgets are checked in three places:
+
+- assert_query_budget(client, method, path) runs one request through a Flask
+  test client and raises QueryBudgetExceeded, with the statements, if the
+  route went over. It is the assertion to use in tests.
+- `flask check-query-budgets` (check_query_budgets()) seeds a throwaway
+  database, walks every budgeted route at two data sizes and exits non-zero
+  on any violation.
+- With QUERY_BUDGET = 'warn' or 'raise', every live request is checked: over
+  budget logs a warning, or fails the request (for development and CI).
+"""
+import io
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+
+from app.tracing import get_logger
+from app.timing import _current
+
+log = get_logger(__name__)
+
+MODES = ('off', 'warn', 'raise')
+
+
+class QueryBudgetExceeded(AssertionError):
+    def __init__(self, endpoint, budget, count, statements=()):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.count = count
+        self.statements = list(statements)
+        message = f"{endpoint} ran {count} SQL statements, budget is {budget}"
+        if self.statements:
+            message += ':\n' + '\n'.join(f'  {i}. {sql}' for i, sql in enumerate(self.statements, 1))
+        super().__init__(message)
+
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may run per request."""
+    def decorate(view):
+        view.query_budget = limit
+        return view
+    return decorate
+
+
+def budget_for(endpoint, app=None):
+    """The declared budget of an endpoint, or None."""
+    app = app or current_app
+    view = app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', None)
+
+
+def init_app(app):
+    app.config.setdefault('QUERY_BUDGET', 'off')
+    if app.config['QUERY_BUDGET'] not in MODES:
+        raise ValueError(f"Unknown QUERY_BUDGET {app.config['QUERY_BUDGET']!r}")
+
+
+def check_request(endpoint, status, wall, stats):
+    """request_timing observer: warn about or fail a request over its budget."""
+    mode = current_app.config.get('QUERY_BUDGET', 'off')
+    if mode == 'off':
+        return
+    budget = budget_for(endpoint)
+    if budget is None or stats.statements <= budget:
+        return
+    if mode == 'raise':
+        raise QueryBudgetExceeded(endpoint, budget, stats.statements)
+    log.warning("%s ran %d SQL statements, budget is %d", endpoint, stats.statements, budget)
+
+
+class _Recorder:
+    """Collects the SQL text of statements counted for the current request."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'after_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'after_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # Same rule as app/timing.py: only statements run while handling the request
+        if _current.get() is not None:
+            self.statements.append(' '.join(statement.split()))
+
+
+def measure(client, method, path, **kwargs):
+    """Make one request; returns (response, endpoint, SQL of each statement it ran)."""
+    from app import db
+
+    app = client.application
+    with app.app_context():
+        engine = db.engine
+    endpoint, _ = app.url_map.bind('localhost').match(path.split('?')[0], method=method)
+    with _Recorder(engine) as recorder:
+        response = client.open(path, method=method, **kwargs)
+        # Streamed bodies run their queries as they are read
+        response.get_data()
+    return response, endpoint, recorder.statements
+
+
+def assert_query_budget(client, method, path, budget=None, **kwargs):
+    """Make one request and raise QueryBudgetExceeded if it ran more statements than allowed.
+
+    budget defaults to the route's declared budget. Returns the response.
+    """
+    response, endpoint, statements = measure(client, method, path, **kwargs)
+    if budget is None:
+        budget = budget_for(endpoint, client.application)
+        if budget is None:
+            raise LookupError(f"{endpoint} has no @query_budget")
+    if len(statements) > budget:
+        raise QueryBudgetExceeded(endpoint, budget, len(statements), statements)
+    return response
+
+
+def _seed(grade_count, semester_count=4):
+    """An admin with grade_count grades over semester_count semesters (plus an empty one), and one other user."""
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from app.models import Grade, Semester, User, UserSettings
+
+    # A first login takes the longer path through the login view
+    admin = User(username='jaydenokoeguale', password_hash=generate_password_hash('budget'), is_admin=True)
+    other = User(username='budget-other', password_hash=generate_password_hash('budget'), first_login=False)
+    db.session.add_all([admin, other, UserSettings(user=admin)])
+    semesters = [
+        Semester(name=f'Term {i + 1}', start_date=date(2022, 1, 1) + timedelta(days=120 * i), user=admin)
+        for i in range(semester_count)
+    ]
+    empty = Semester(name='Empty', start_date=date(2030, 1, 1), user=admin)
+    db.session.add_all(semesters + [empty])
+    db.session.flush()
+    letters = ['A', 'A-', 'B+', 'B', 'C']
+    db.session.add_all([
+        Grade(subject=f'Course {i}', grade=95 - i % 25, letter=letters[i % len(letters)],
+              course_type=['Regular', 'Honors', 'AP'][i % 3], date=date(2022, 1, 15) + timedelta(days=7 * i),
+              semester_id=semesters[i % semester_count].id, user_id=admin.id)
+        for i in range(grade_count)
+    ])
+    db.session.add(Grade(subject='Other', grade=88, letter='B+', user_id=other.id))
+    db.session.commit()
+    return admin.id, other.id, semesters[0].id, empty.id
+
+
+def _scenario(other_id, semester_id, empty_semester_id):
+    """(method, path, form data) for every budgeted route, in an order that keeps the data usable."""
+    grade = {'subject': 'Budget', 'grade_type': 'number', 'grade': '91', 'course_type': 'AP',
+             'semester_id': str(semester_id), 'credit_hours': '1'}
+    upload = (b'subject,grade,letter,grade_type,semester,date\n'
+              + b''.join(b'Import %d,%d,,number,Term 2,2022-05-10\n' % (i, 70 + i) for i in range(20))
+              + b'Import letter,,B+,letter,Imported term,2031-01-10\n')
+    return [
+        ('GET', '/sitemap.xml', None),
+        ('GET', '/signup', None),
+        ('POST', '/signup', {'username': 'budget-new', 'password': 'budget1', 'confirm_password': 'budget1'}),
+        ('POST', '/delete-guest/0', None),
+        ('GET', '/login', None),
+        ('POST', '/login', {'username': 'jaydenokoeguale', 'password': 'budget'}),
+        ('GET', '/', None),
+        ('GET', '/', None),
+        ('GET', '/grades/page', None),
+        ('GET', '/add', None),
+        ('POST', '/add', grade),
+        ('GET', '/edit/1', None),
+        ('POST', '/edit/1', dict(grade, subject='Budget edit')),
+        ('GET', '/trends', None),
+        ('GET', '/semesters', None),
+        ('GET', '/add_semester', None),
+        ('POST', '/add_semester', {'name': 'Budget term', 'start_date': '2030-01-01'}),
+        ('GET', f'/edit_semester/{semester_id}', None),
+        ('POST', f'/edit_semester/{semester_id}', {'name': 'Budget renamed', 'start_date': '2022-01-01'}),
+        ('GET', '/simulate', None),
+        ('GET', '/export', None),
+        ('GET', '/export/json', None),
+        ('GET', '/export/ndjson', None),
+        ('GET', '/export/csv?table=grades', None),
+        ('GET', '/export/csv?table=gpa', None),
+        ('GET', '/profile', None),
+        ('GET', '/settings', None),
+        ('POST', '/settings', {'gpa_scale': 'weighted_5', 'grade_format': 'plus_minus'}),
+        ('GET', '/admin', None),
+        ('POST', '/admin/refresh-counters', None),
+        ('GET', '/admin/timing', None),
+        ('POST', '/admin/timing/reset', None),
+        ('GET', f'/admin/user/{other_id}', None),
+        ('POST', f'/admin/toggle-admin/{other_id}', None),
+        ('POST', '/delete/2', None),
+        ('POST', f'/delete_semester/{empty_semester_id}', None),
+        ('POST', f'/admin/delete-user/{other_id}', None),
+        ('GET', '/fix_gpa', None),
+        ('GET', '/import', None),
+        ('POST', '/import', {'file': (io.BytesIO(upload), 'grades.csv'), 'dry_run': 'y'}),
+        ('POST', '/import', {'file': (io.BytesIO(upload), 'grades.csv')}),
+        ('GET', '/logout', None),
+    ]
+
+
+def check_query_budgets(sizes=(5, 200)):
+    """Walk every budgeted route against a throwaway database at each data size.
+
+    Yields (grades seeded, method, path, endpoint, status, statements, budget);
+    statements above budget is a violation. Budgeted endpoints the scenario
+    never reached are yielded last, with None for everything but the budget.
+    """
+    from app.seed import temporary_app
+
+    reached = set()
+    app = None
+    for size in sizes:
+        with temporary_app({'QUERY_BUDGET': 'off'}) as app:
+            with app.app_context():
+                _, other_id, semester_id, empty_semester_id = _seed(size)
+            client = app.test_client()
+            for method, url, data in _scenario(other_id, semester_id, empty_semester_id):
+                response, endpoint, statements = measure(client, method, url, data=data)
+                reached.add(endpoint)
+                yield (size, method, url, endpoint, response.status_code, len(statements),
+                       budget_for(endpoint, app))
+
+    budgeted = {endpoint for endpoint in app.view_functions if budget_for(endpoint, app) is not None}
+    for endpoint in sorted(budgeted - reached):
+        yield None, None, None, endpoint, None, None, budget_for(endpoint, app)
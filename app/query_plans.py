@@ -0,0 +1,120 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries.
+
+hot_queries() mirrors the queries the dashboard, semester, trend and admin pages
+run on every request. The paginated ones (the dashboard grade table and the
+admin user table) come from the pages' own statement builders, for every
+sort, direction and range, on the first page and after a cursor.
+
+check_query_plans() asks SQLite how it would execute each one. It reports
+any query that would read a whole table (a plain "SCAN <table>" with no
+index), which is what happens when an index is missing or a query is changed
+so it can no longer use one. For a paginated query it also reports "USE TEMP
+B-TREE FOR ORDER BY": sorting means every page reads all the rows rather
+than seeking to the cursor. Its outer table may be scanned when nothing is
+sorted: the scan then walks the primary key in page order and stops at the
+LIMIT. `flask check-query-plans` runs it and exits non-zero on a regression.
+"""
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from sqlalchemy import func, select
+
+from app import admin_users, db, grade_list
+from app.keyset import ranges
+from app.models import Grade, Semester, SemesterGpaSummary, UserActivity, UserActivityDaily
+
+# Placeholder values; the plan does not depend on them
+USER_ID = 1
+SEMESTER_ID = 1
+SINCE = datetime(2000, 1, 1)
+GRADE_POSITIONS = {'date': (date(2000, 1, 1), 1), 'subject': ('a', 1), 'grade': (0.0, 1)}
+USER_POSITIONS = {'username': ('a', 1), 'last_seen': (SINCE, 1), 'id': (1, 1)}
+
+
+def _pages(sorts, positions, nullable, build):
+    """name -> statement for every sort, direction and range, from the start and after a cursor."""
+    statements = {}
+    for sort in sorts:
+        for direction in ('asc', 'desc'):
+            for position in (None, positions[sort], (None, 1) if nullable(sort) else None):
+                for null, start in ranges(direction, position, nullable(sort)):
+                    name = f"{sort} {direction}{' null' if null else ''}{' after cursor' if start else ''}"
+                    statements.setdefault(name, build(sort, direction, start, null))
+    return statements
+
+
+def paginated_queries():
+    """The keyset-paginated page queries, which must also not sort."""
+    user = SimpleNamespace(id=USER_ID)
+    grade_pages = _pages(
+        grade_list.SORTS, GRADE_POSITIONS, lambda sort: grade_list._sort_key(sort)[2],
+        lambda sort, direction, start, null: grade_list.page_statement(user, sort, direction, start, null),
+    )
+    user_pages = _pages(
+        admin_users.SORTS, USER_POSITIONS, lambda sort: admin_users._sort_key(sort)[2],
+        lambda sort, direction, start, null: admin_users.page_statement(sort, direction, None, start, null),
+    )
+    queries = {f'dashboard grades by {name}': statement for name, statement in grade_pages.items()}
+    queries.update((f'admin users by {name}', statement) for name, statement in user_pages.items())
+    return queries
+
+
+def hot_queries():
+    return {
+        'grades in semester': select(Grade).where(Grade.semester_id == SEMESTER_ID),
+        'user semesters': select(Semester).where(Semester.user_id == USER_ID).order_by(Semester.start_date.desc()),
+        'semester summary rows': (
+            select(SemesterGpaSummary)
+            .where(SemesterGpaSummary.user_id == USER_ID)
+            .order_by(SemesterGpaSummary.start_date, SemesterGpaSummary.semester_id)
+        ),
+        'user recent activity': (
+            select(UserActivity)
+            .where(UserActivity.user_id == USER_ID)
+            .order_by(UserActivity.timestamp.desc())
+            .limit(10)
+        ),
+        'admin recent activity': select(UserActivity).order_by(UserActivity.timestamp.desc()).limit(50),
+        'user activity count': select(func.count(UserActivity.id)).where(UserActivity.user_id == USER_ID),
+        'user activity rollups': (
+            select(func.sum(UserActivityDaily.count)).where(UserActivityDaily.user_id == USER_ID)
+        ),
+        'recent activity by day': (
+            select(func.date(UserActivity.timestamp), func.count())
+            .where(UserActivity.timestamp >= SINCE)
+            .group_by(func.date(UserActivity.timestamp))
+        ),
+    }
+
+
+def explain(statement):
+    """The EXPLAIN QUERY PLAN detail lines for a statement."""
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Plan lines that read a whole table rather than an index."""
+    return [line for line in plan if line.startswith('SCAN ') and ' USING ' not in line]
+
+
+def temp_sorts(plan):
+    """Plan lines that sort the rows read rather than reading them in index order."""
+    return [line for line in plan if line.startswith('USE TEMP B-TREE FOR ORDER BY')]
+
+
+def check_query_plans():
+    """[(name, plan lines, problem lines)] for every hot query.
+
+    Problems are full scans, and for paginated queries temp B-tree sorts too.
+    """
+    results = []
+    for name, statement in hot_queries().items():
+        plan = explain(statement)
+        results.append((name, plan, full_scans(plan)))
+    for name, statement in paginated_queries().items():
+        plan = explain(statement)
+        sorts = temp_sorts(plan)
+        results.append((name, plan, full_scans(plan if sorts else plan[1:]) + sorts))
+    return results
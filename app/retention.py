@@ -0,0 +1,111 @@
+"""UserActivity retention and daily rollups.
+
+Raw UserActivity rows are kept for ACTIVITY_RETENTION_DAYS days.
+compact_activity() (`flask compact-activity`, meant to run daily from cron)
+folds older rows into per-user, per-action, per-day UserActivityDaily counts
+and deletes them, ACTIVITY_COMPACT_CHUNK rows at a time with a commit after
+each chunk, so the hot table stays small and writers are never held up long.
+
+Activity statistics are the rollup counts plus whatever raw rows have not been
+compacted yet.
+"""
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import UserActivity, UserActivityDaily
+
+
+def retention_cutoff(days=None, now=None):
+    """Raw rows older than this are compacted; cut at midnight so no day is split."""
+    if days is None:
+        days = current_app.config.get('ACTIVITY_RETENTION_DAYS', 30)
+    now = now or datetime.utcnow()
+    return datetime.combine(now.date() - timedelta(days=days), datetime.min.time())
+
+
+def compact_activity(days=None, chunk_size=None):
+    """Roll raw activity older than the retention window into UserActivityDaily.
+
+    Returns (rows compacted, chunks committed).
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config.get('ACTIVITY_COMPACT_CHUNK', 5000)
+    cutoff = retention_cutoff(days)
+    day = func.date(UserActivity.timestamp)
+
+    table = UserActivityDaily.__table__
+    upsert = insert(table)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.action, table.c.day],
+        set_={'count': table.c.count + upsert.excluded['count']}
+    )
+
+    total = 0
+    chunks = 0
+    while True:
+        # Old rows sit at the low end of the id range; take the next chunk by id
+        oldest = (
+            select(UserActivity.id)
+            .where(UserActivity.timestamp < cutoff)
+            .order_by(UserActivity.id)
+            .limit(chunk_size)
+            .subquery()
+        )
+        last_id = db.session.execute(select(func.max(oldest.c.id))).scalar()
+        if last_id is None:
+            break
+        in_chunk = (UserActivity.id <= last_id, UserActivity.timestamp < cutoff)
+
+        counts = db.session.execute(
+            select(UserActivity.user_id, UserActivity.action, day, func.count())
+            .where(*in_chunk)
+            .group_by(UserActivity.user_id, UserActivity.action, day)
+        ).all()
+        # Guest rows (user_id NULL) never conflict, so they may take several rows; sums stay correct
+        db.session.execute(upsert, [
+            {'user_id': user_id, 'action': action, 'day': date.fromisoformat(on), 'count': count}
+            for user_id, action, on, count in counts
+        ])
+        deleted = db.session.execute(
+            UserActivity.__table__.delete().where(*in_chunk)
+        ).rowcount
+        db.session.commit()
+        total += deleted
+        chunks += 1
+    return total, chunks
+
+
+def activity_total(user_id=None):
+    """Number of recorded actions (all users, or one), compacted or not."""
+    rolled = select(func.coalesce(func.sum(UserActivityDaily.count), 0))
+    raw = select(func.count(UserActivity.id))
+    if user_id is not None:
+        rolled = rolled.where(UserActivityDaily.user_id == user_id)
+        raw = raw.where(UserActivity.user_id == user_id)
+    return db.session.execute(rolled).scalar() + db.session.execute(raw).scalar()
+
+
+def daily_activity(days=14, now=None):
+    """[(day, actions)] for the last `days` days, newest first."""
+    since = (now or datetime.utcnow()).date() - timedelta(days=days - 1)
+    totals = {}
+    for on, count in db.session.execute(
+        select(UserActivityDaily.day, func.sum(UserActivityDaily.count))
+        .where(UserActivityDaily.day >= since)
+        .group_by(UserActivityDaily.day)
+    ):
+        totals[on] = totals.get(on, 0) + count
+
+    day = func.date(UserActivity.timestamp)
+    for on, count in db.session.execute(
+        select(day, func.count())
+        .where(UserActivity.timestamp >= datetime.combine(since, datetime.min.time()))
+        .group_by(day)
+    ):
+        on = date.fromisoformat(on)
+        totals[on] = totals.get(on, 0) + count
+    return sorted(totals.items(), reverse=True)
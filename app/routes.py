@@ -1,13 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_from_directory
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_from_directory, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db, csrf, is_admin
-from app.models import User, Grade, CustomGPA, UserSettings, Semester, UserActivity
+from app.models import User, Grade, CustomGPA, UserSettings, Semester, UserActivity, SemesterGpaSummary
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date
-from app.forms import GradeForm, DeleteForm, LoginForm, SignupForm, GpaScaleForm, SettingsForm, SemesterForm
+from app.forms import GradeForm, DeleteForm, LoginForm, SignupForm, GpaScaleForm, SettingsForm, SemesterForm, ImportForm
+from app.gpa import current_policy, get_letter_grade
+from app import summary
+from app.activity import activity_sink
+from app.presence import presence
+from app.counters import counters
+from app.fragments import fragment_cache
+from app.timing import request_timing
+from app.query_budget import query_budget
+from app import admin_users, grade_list, retention
+from app.grade_import import ImportFileError, import_grades, stored_grade
+from app.grade_export import CSV_TABLES, EXPORT_FORMATS, export_response
+from app.tracing import get_logger, lazy
 from flask_wtf.csrf import CSRFProtect
 
 main = Blueprint('main', __name__)
+log = get_logger(__name__)
 """
 def log_event(action):
     event = Event(
@@ -18,298 +31,16 @@ def log_event(action):
     db.session.commit()
 """
 
-LETTER_TO_NUM = {
-    'A+': 98, 'A': 95, 'A-': 91,
-    'B+': 88, 'B': 85, 'B-': 81,
-    'C+': 78, 'C': 75, 'C-': 71,
-    'D': 65, 'F': 50
-}
-
-# GPA scales mapping with numeric cutoff and GPA points for unweighted and weighted (Honors/AP)
-GPA_SCALES = {
-    'standard': {  # 4.0 unweighted, no weighting here (weighting is done separately)
-        'cutoffs': [(90, 4.0), (80, 3.0), (70, 2.0), (60, 1.0)],
-        'weight': {'Regular': 0.0, 'Honors': 0.5, 'AP': 1.0},
-        'max': 5.0
-    },
-    'weighted_5': {
-        'cutoffs': [(90, 5.0), (80, 4.0), (70, 3.0), (60, 2.0)],
-        'weight': {'Regular': 0.0, 'Honors': 0.0, 'AP': 0.0},  # weights incorporated in scale directly
-        'max': 5.0
-    },
-    'weighted_4.5': {
-        'cutoffs': [(90, 4.5), (80, 3.5), (70, 2.5), (60, 1.5)],
-        'weight': {'Regular': 0.0, 'Honors': 0.25, 'AP': 0.5},
-        'max': 5.0
-    },
-    'college_plus_minus': {  # Similar to precise 4.33 scale with +/- plus no weighting
-        'cutoffs': [
-            (93, 4.0), (90, 3.7), (87, 3.3), (83, 3.0),
-            (80, 2.7), (77, 2.3), (73, 2.0), (70, 1.7),
-            (67, 1.3), (65, 1.0)
-        ],
-        'weight': {'Regular': 0.0, 'Honors': 0.0, 'AP': 0.0},
-        'max': 4.0
-    }
-}
-
-def grade_to_gpa_points(grade_numeric, course_type, scale_key):
-    # Ensure grade_numeric is a float
-    try:
-        grade_numeric = float(grade_numeric)
-    except (ValueError, TypeError):
-        # Could not convert; return None or 0 GPA points
-        return 0.0
-
-    scale = GPA_SCALES.get(scale_key, GPA_SCALES['standard'])
-    cutoffs = scale['cutoffs']
-    weight_map = scale['weight']
-    max_gpa = scale['max']
-
-    # Find base GPA points based on cutoffs
-    points = 0.0
-    for cutoff, gpa_value in cutoffs:
-        if grade_numeric >= cutoff:
-            points = gpa_value
-            break
-
-    # Add weighting if scale supports it
-    weight = weight_map.get(course_type, 0.0)
-    weighted_points = points + weight
-
-    # Cap GPA at max scale value
-    return min(weighted_points, max_gpa)
-
 def calculate_gpa(grades):
-    if current_user.is_authenticated:
-        scale_key = current_user.gpa_scale or 'standard'
-        grade_format = current_user.grade_format or 'plus_minus'
-        gpa_cap = current_user.get_gpa_cap()
-        get_weight = current_user.get_course_weight
-        use_credit_hours = current_user.use_credit_hours
-
-        def get_custom_value(letter):
-            val = current_user.get_custom_gpa_value(letter)
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                print(f"[DEBUG] Invalid custom GPA value for '{letter}': {val}")
-                return None
-    else:
-        scale_key = session.get('gpa_scale', 'standard')
-        grade_format = session.get('grade_format', 'plus_minus')
-        gpa_cap = session.get('gpa_cap', None)
-        use_credit_hours = False
-
-        def get_weight(course_type):
-            weights = session.get('weights', {
-                'Regular': 0.0, 'Honors': 0.5, 'AP': 1.0, 'IB': 1.0, 'DE': 1.0
-            })
-            return weights.get(course_type, 0.0)
-
-        def get_custom_value(letter):
-            custom = session.get('custom_gpa_values', {})
-            val = custom.get(letter.upper())
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                print(f"[DEBUG] Invalid or missing custom GPA value for '{letter}': {val}")
-                return None
-
-    total_points = 0
-    total_credits = 0
-    skipped = 0
-
-    for grade in grades:
-        if not grade.letter:
-            print(f"[DEBUG] Skipped grade with missing letter: {grade}")
-            skipped += 1
-            continue
-
-        g_letter = grade.letter.strip().upper()
-        ctype = getattr(grade, 'course_type', 'Regular') or 'Regular'
-        points = None
-
-        if scale_key == 'custom':
-            points = get_custom_value(g_letter)
-        elif grade_format == 'plus_minus':
-            points = {
-                'A+': 4.0, 'A': 4.0, 'A-': 3.7,
-                'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-                'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-                'D+': 1.3, 'D': 1.0, 'D-': 0.7,
-                'F': 0.0
-            }.get(g_letter)
-        elif grade_format == 'simple':
-            points = {
-                'A': 4.0, 'B': 3.0, 'C': 2.0, 'D': 1.0, 'F': 0.0
-            }.get(g_letter[0], 0.0)
-        else:
-            # fallback to numeric
-            grade_numeric = LETTER_TO_NUM.get(g_letter)
-            if grade_numeric is not None:
-                points = grade_to_gpa_points(grade_numeric, ctype, scale_key)
-            else:
-                print(f"[DEBUG] LETTER_TO_NUM missing for '{g_letter}'")
-                skipped += 1
-                continue
-
-        if points is None:
-            print(f"[DEBUG] Skipped grade '{g_letter}' — points is None")
-            skipped += 1
-            continue
-
-        if not isinstance(points, (int, float)):
-            print(f"[DEBUG] Skipped grade '{g_letter}' — points is not a number: {points}")
-            skipped += 1
-            continue
-
-        weight = get_weight(ctype)
-        weighted_points = points + weight
-        if gpa_cap is not None:
-            weighted_points = min(weighted_points, gpa_cap)
-
-        # Get credit hours for the grade
-        credit_hours = getattr(grade, 'credit_hours', 1.0)
-        try:
-            credit_hours = float(credit_hours)
-            if not credit_hours:
-                credit_hours = 1.0
-        except (TypeError, ValueError):
-            credit_hours = 1.0
-        if not use_credit_hours:
-            credit_hours = 1.0
-
-        print(f"[DEBUG] Grade: {g_letter}, Base Points: {points}, Type: {ctype}, Weight: {weight}, Weighted: {weighted_points}, Credits: {credit_hours}")
-
-        total_points += weighted_points * credit_hours
-        total_credits += credit_hours
-
-    if total_credits == 0:
-        print(f"[DEBUG] All grades skipped. Total skipped: {skipped}")
-        return 0.0
-
-    gpa = round(total_points / total_credits, 2)
-    print(f"[DEBUG] Final GPA: {gpa} from {total_credits} credits (Skipped: {skipped})")
-    return gpa
-
-def get_letter_grade(grade_numeric, grade_format='plus_minus'):
-    if grade_numeric is None:
-        return ''
-
-    try:
-        grade_numeric = float(grade_numeric)
-    except (ValueError, TypeError):
-        return ''
-
-    if grade_format == 'simple':
-        # Simple letter grades (no plus/minus)
-        if grade_numeric >= 90:
-            return 'A'
-        elif grade_numeric >= 80:
-            return 'B'
-        elif grade_numeric >= 70:
-            return 'C'
-        elif grade_numeric >= 60:
-            return 'D'
-        else:
-            return 'F'
-    else:
-        # Plus/Minus letter grades
-        if grade_numeric >= 97:
-            return 'A+'
-        elif grade_numeric >= 93:
-            return 'A'
-        elif grade_numeric >= 90:
-            return 'A-'
-        elif grade_numeric >= 87:
-            return 'B+'
-        elif grade_numeric >= 83:
-            return 'B'
-        elif grade_numeric >= 80:
-            return 'B-'
-        elif grade_numeric >= 77:
-            return 'C+'
-        elif grade_numeric >= 73:
-            return 'C'
-        elif grade_numeric >= 70:
-            return 'C-'
-        elif grade_numeric >= 67:
-            return 'D+'
-        elif grade_numeric >= 63:
-            return 'D'
-        elif grade_numeric >= 60:
-            return 'D-'
-        else:
-            return 'F'
+    return current_policy().evaluate(grades).gpa
 
 def calculate_cumulative_gpa(semesters, grades):
     """Calculate cumulative GPA for each semester."""
-    cumulative_points = 0
-    cumulative_count = 0
-    semester_gpas = []
-    
-    # Sort semesters by start date
-    sorted_semesters = sorted(semesters, key=lambda x: x.start_date)
-    
-    for semester in sorted_semesters:
-        # Get grades for this semester
-        semester_grades = [g for g in grades if g.semester_id == semester.id]
-        
-        # Calculate points for this semester's grades
-        for grade in semester_grades:
-            if not grade.letter:
-                continue
-                
-            g_letter = grade.letter.strip().upper()
-            ctype = getattr(grade, 'course_type', 'Regular') or 'Regular'
-            
-            # Get points based on letter grade
-            if current_user.gpa_scale == 'custom':
-                points = current_user.get_custom_gpa_value(g_letter)
-            elif current_user.grade_format == 'plus_minus':
-                points = {
-                    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
-                    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-                    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-                    'D+': 1.3, 'D': 1.0, 'D-': 0.7,
-                    'F': 0.0
-                }.get(g_letter)
-            elif current_user.grade_format == 'simple':
-                points = {
-                    'A': 4.0, 'B': 3.0, 'C': 2.0, 'D': 1.0, 'F': 0.0
-                }.get(g_letter[0], 0.0)
-            else:
-                grade_numeric = LETTER_TO_NUM.get(g_letter)
-                if grade_numeric is not None:
-                    points = grade_to_gpa_points(grade_numeric, ctype, current_user.gpa_scale or 'standard')
-                else:
-                    continue
-            
-            if points is None or not isinstance(points, (int, float)):
-                continue
-                
-            # Add course weight
-            weight = current_user.get_course_weight(ctype)
-            weighted_points = points + weight
-            
-            # Apply GPA cap if set
-            gpa_cap = current_user.get_gpa_cap()
-            if gpa_cap is not None:
-                weighted_points = min(weighted_points, gpa_cap)
-            
-            cumulative_points += weighted_points
-            cumulative_count += 1
-        
-        # Calculate cumulative GPA for this point
-        if cumulative_count > 0:
-            semester_gpas.append(round(cumulative_points / cumulative_count, 2))
-        else:
-            semester_gpas.append(0.0)
-    
-    return semester_gpas
+    policy = current_policy()
+    return policy.cumulative(semesters, policy.evaluate(grades))
 
 @main.route('/', methods=['GET', 'POST'])
+@query_budget(18)
 def index():
     from app.forms import SettingsForm
     settings_form = SettingsForm()
@@ -319,34 +50,27 @@ def index():
         return ('', 204)
 
     if current_user.is_authenticated:
-        # Eager load the semester relationship and order by date
-        grades = Grade.query.options(
-            db.joinedload(Grade.semester)
-        ).filter_by(
-            user_id=current_user.id
-        ).order_by(
-            Grade.date.desc()
-        ).all()
-
-        # Ensure dates are properly formatted
-        for grade in grades:
-            if isinstance(grade.date, str):
-                try:
-                    grade.date = datetime.strptime(grade.date, "%Y-%m-%d").date()
-                except ValueError:
-                    grade.date = date.today()
-            elif grade.date is None:
-                grade.date = date.today()
-
-        # Get all semesters for the user
-        semesters = Semester.query.filter_by(user_id=current_user.id).all()
-        
-        # Calculate cumulative GPA for each semester
-        semester_labels = [s.name for s in sorted(semesters, key=lambda x: x.start_date)]
-        semester_gpa_values = calculate_cumulative_gpa(semesters, grades)
-
+        sort = request.args.get('sort', 'date')
+        direction = request.args.get('dir', 'desc')
+        cursor = request.args.get('after')
         gpa_scale = current_user.gpa_scale or 'standard'
         grade_format = current_user.grade_format or 'plus_minus'
+
+        def table_context():
+            # First page of the grade table; further pages are fetched from /grades/page
+            grade_page = grade_list.grade_page(current_user, sort=sort, direction=direction, cursor=cursor)
+            return dict(grades=display_grades(grade_page.grades, grade_format), grade_page=grade_page,
+                        delete_form=DeleteForm())
+
+        def header_context():
+            # Header and chart come from the materialized summary, not a pass over the grades
+            user_summary = summary.get_summary(current_user)
+            return dict(gpa=user_summary.gpa if user_summary.grade_count else None,
+                        gpa_scale=gpa_scale, grade_format=grade_format)
+
+        def trend_context():
+            labels, values = summary.trend_series(current_user)
+            return dict(labels=labels, values=values)
     else:
         guest_grades = session.get('guest_grades', [])
 
@@ -372,37 +96,74 @@ def index():
 
         gpa_scale = session.get('gpa_scale', 'standard')
         grade_format = session.get('grade_format', 'plus_minus')
-        semester_labels = []
-        semester_gpa_values = []
+        result = current_policy().evaluate(grades)
+        gpa = result.gpa if grades else None
 
-    # Update letter grades from numeric grades BEFORE calculating GPA
-    for g in grades:
-        g.letter = get_letter_grade(g.grade, grade_format)
+        def table_context():
+            return dict(grades=display_grades(grades, grade_format), grade_page=None, delete_form=DeleteForm())
 
-    # Calculate average numeric grade
-    average = round(sum(g.grade for g in grades) / len(grades), 2) if grades else None
+        def header_context():
+            return dict(gpa=gpa, gpa_scale=gpa_scale, grade_format=grade_format)
 
-    # Calculate current GPA (uses updated letter grades)
-    gpa = calculate_gpa(grades) if grades else None
+        def trend_context():
+            return dict(labels=[], values=[])
+        sort = direction = cursor = None
 
-    delete_form = DeleteForm()
+    # Cached per user and data version (see app/fragments.py); guests always render.
+    # The grade table goes last: display_grades() edits the loaded rows, and no
+    # query may autoflush those edits afterwards.
+    gpa_header = fragment_cache.render('gpa_header', 'fragments/gpa_header.html', header_context)
+    trend_data = fragment_cache.render('trend_data', 'fragments/trend_data.html', trend_context)
+    grade_table = fragment_cache.render('grade_table', 'fragments/grade_table.html', table_context,
+                                        (sort, direction, cursor))
 
     return render_template(
         'index.html',
-        grades=grades,
-        average=average,
-        gpa=gpa,
-        delete_form=delete_form,
-        labels=semester_labels,
-        values=semester_gpa_values,
-        gpa_scale=gpa_scale,
-        grade_format=grade_format,
+        gpa_header=gpa_header,
+        grade_table=grade_table,
+        trend_data=trend_data,
         settings_form=settings_form,
         request=request
     )
 
 
+def display_grades(grades, grade_format):
+    """Fill in missing dates and show letters in the user's grade format."""
+    for grade in grades:
+        if isinstance(grade.date, str):
+            try:
+                grade.date = datetime.strptime(grade.date, "%Y-%m-%d").date()
+            except ValueError:
+                grade.date = date.today()
+        elif grade.date is None:
+            grade.date = date.today()
+        grade.letter = get_letter_grade(grade.grade, grade_format)
+    return grades
+
+
+@main.route('/grades/page')
+@query_budget(3)
+@login_required
+def grades_page():
+    """One page of the dashboard grade table as JSON, for incremental loading."""
+    page = grade_list.grade_page(
+        current_user,
+        sort=request.args.get('sort', 'date'),
+        direction=request.args.get('dir', 'desc'),
+        cursor=request.args.get('after'),
+        limit=request.args.get('limit', type=int)
+    )
+    grade_format = current_user.grade_format or 'plus_minus'
+    return jsonify({
+        'grades': [grade_list.grade_json(grade, grade_format) for grade in page.grades],
+        'next_cursor': page.next_cursor,
+        'sort': page.sort,
+        'dir': page.direction
+    })
+
+
 @main.route('/add', methods=['GET', 'POST'])
+@query_budget(13)
 def add_grade():
     form = GradeForm()
     # Populate semester choices
@@ -416,41 +177,25 @@ def add_grade():
         form.semester_id.choices = [(0, 'No Semester')]
 
     if form.validate_on_submit():
-        print("[DEBUG] Add Grade Form Data:", form.data)
-        print("[DEBUG] Selected Semester ID:", form.semester_id.data)
+        log.debug("Add grade form data: %s", lazy(lambda: form.data))
         
         subject = form.subject.data
         grade_type = form.grade_type.data
         course_type = form.course_type.data or 'Regular'
         semester_id = form.semester_id.data if form.semester_id.data else None
 
-        if grade_type == 'letter':
-            letter = form.letter.data
-            grade = LETTER_TO_NUM.get(letter, 0)
-        else:
-            grade = float(form.grade.data)
-            if grade >= 90:
-                letter = 'A'
-            elif grade >= 80:
-                letter = 'B'
-            elif grade >= 70:
-                letter = 'C'
-            elif grade >= 60:
-                letter = 'D'
-            else:
-                letter = 'F'
+        grade, letter = stored_grade(grade_type, form.grade.data, form.letter.data)
 
         # Handle date and semester assignment
         date_obj = None
         if semester_id and semester_id != 0:
-            print(f"[DEBUG] Adding grade to semester {semester_id}")
             semester = Semester.query.get(semester_id)
             if semester and semester.start_date:
                 date_obj = semester.start_date
-                print(f"[DEBUG] Using semester start date: {date_obj}")
+            log.debug("Adding grade to semester %s, dated %s", semester_id, date_obj)
         else:
-            print("[DEBUG] No semester selected, using form date")
             date_obj = form.date.data
+            log.debug("No semester selected, using form date %s", date_obj)
 
         if current_user.is_authenticated:
             if current_user.use_credit_hours and (form.credit_hours.data is None or form.credit_hours.data == ''):
@@ -478,12 +223,13 @@ def add_grade():
             )
             try:
                 db.session.add(new_grade)
+                summary.grade_added(current_user, new_grade)
                 db.session.commit()
-                print("[DEBUG] Successfully added grade to database")
+                log.debug("Added grade %s", new_grade.id)
                 flash('Grade added successfully!', 'success')
             except Exception as e:
                 db.session.rollback()
-                print(f"[DEBUG] Error adding grade: {str(e)}")
+                log.exception("Error adding grade")
                 flash(f'Error adding grade: {str(e)}', 'danger')
                 return render_template('add_grade.html', form=form, request=request)
         else:
@@ -491,12 +237,13 @@ def add_grade():
             return redirect(url_for('main.login'))
 
         return redirect(url_for('main.index'))
-    else:
-        print("[DEBUG] Form validation failed:", form.errors)
+    elif request.method == 'POST':
+        log.debug("Add grade form did not validate: %s", form.errors)
 
     return render_template('add_grade.html', form=form, request=request)
 
 @main.route('/edit/<int:grade_id>', methods=['GET', 'POST'])
+@query_budget(23)
 @login_required
 def edit_grade(grade_id):
     grade = Grade.query.get_or_404(grade_id)
@@ -526,37 +273,20 @@ def edit_grade(grade_id):
         form.course_type.data = grade.course_type
         form.credit_hours.data = grade.credit_hours
 
-    print("[DEBUG] Initial form data:", form.data)
-    print("[DEBUG] Current grade semester_id:", grade.semester_id)
-    print("[DEBUG] Current grade date:", grade.date)
+    log.debug("Editing grade %s (semester %s, date %s)", grade.id, grade.semester_id, grade.date)
 
     if form.validate_on_submit():
-        print("[DEBUG] Form submitted data:", form.data)
-        print("[DEBUG] Selected semester_id:", form.semester_id.data)
-        print("[DEBUG] Form date data:", form.date.data)
-        
+        log.debug("Edit grade form data: %s", lazy(lambda: form.data))
+
         subject = form.subject.data
         grade_type = form.grade_type.data
         course_type = form.course_type.data or 'Regular'
         semester_id = form.semester_id.data if form.semester_id.data else None
         date_str = request.form.get('date')
 
-        if grade_type == 'letter':
-            letter = form.letter.data
-            numeric = LETTER_TO_NUM.get(letter, 0)
-        else:
-            numeric = float(form.grade.data)
-            if numeric >= 90:
-                letter = 'A'
-            elif numeric >= 80:
-                letter = 'B'
-            elif numeric >= 70:
-                letter = 'C'
-            elif numeric >= 60:
-                letter = 'D'
-            else:
-                letter = 'F'
+        numeric, letter = stored_grade(grade_type, form.grade.data, form.letter.data)
 
+        old_values = summary.snapshot(grade)
         grade.subject = subject
         grade.grade = numeric
         grade.letter = letter
@@ -567,16 +297,13 @@ def edit_grade(grade_id):
         
         # Handle date and semester assignment
         if semester_id and semester_id != 0:
-            print(f"[DEBUG] Setting semester_id to: {semester_id}")
             # Get the semester directly from the database
             semester = Semester.query.filter_by(id=semester_id, user_id=current_user.id).first()
-            print(f"[DEBUG] Found semester: {semester}")
             if semester:
                 grade.date = semester.start_date
                 grade.semester_id = semester.id
-                print(f"[DEBUG] Using semester start date: {grade.date}")
             else:
-                print("[DEBUG] Semester not found, using form date")
+                log.debug("Semester %s not found, using form date", semester_id)
                 if date_str:
                     try:
                         grade.date = datetime.strptime(date_str, '%Y-%m-%d').date()
@@ -586,7 +313,6 @@ def edit_grade(grade_id):
                     grade.date = date.today()
                 grade.semester_id = None
         else:
-            print("[DEBUG] No semester selected, using form date:", date_str)
             if date_str:
                 try:
                     grade.date = datetime.strptime(date_str, '%Y-%m-%d').date()
@@ -596,23 +322,23 @@ def edit_grade(grade_id):
                 grade.date = date.today()
             grade.semester_id = None
 
-        print(f"[DEBUG] Final grade state - semester_id:", grade.semester_id)
-        print(f"[DEBUG] Final grade state - date:", grade.date)
+        log.debug("Grade %s now in semester %s, dated %s", grade.id, grade.semester_id, grade.date)
 
         try:
+            summary.grade_changed(current_user, old_values, grade)
             db.session.commit()
-            print("[DEBUG] Successfully committed changes to database")
             flash('Grade updated successfully.', 'success')
             return redirect(url_for('main.index'))
         except Exception as e:
             db.session.rollback()
-            print(f"[DEBUG] Error updating grade: {str(e)}")
+            log.exception("Error updating grade %s", grade_id)
             flash(f'Error updating grade: {str(e)}', 'danger')
             return render_template('edit_grade.html', form=form, grade=grade, request=request)
 
     return render_template('edit_grade.html', form=form, grade=grade, request=request)
 
 @main.route('/delete/<int:grade_id>', methods=['POST'])
+@query_budget(12)
 @login_required
 def delete_grade(grade_id):
     grade = Grade.query.get_or_404(grade_id)
@@ -621,13 +347,16 @@ def delete_grade(grade_id):
         flash("Unauthorized access.")
         return redirect(url_for('main.index'))
 
+    old_values = summary.snapshot(grade)
     db.session.delete(grade)
+    summary.grade_removed(current_user, old_values)
     db.session.commit()
     flash("Grade deleted.")
     return redirect(url_for('main.index'))
 
 @csrf.exempt
 @main.route('/delete-guest/<int:index>', methods=['POST'])
+@query_budget(1)
 def delete_guest_grade(index):
     guest_grades = session.get('guest_grades', [])
     if 0 <= index < len(guest_grades):
@@ -639,39 +368,79 @@ def delete_guest_grade(index):
     return redirect(url_for('main.index'))
 
 @main.route('/trends')
+@query_budget(4)
 @login_required
 def trends():
-    # Query grades with semester information, properly joined
-    grades = Grade.query.join(Semester).filter_by(user_id=current_user.id).order_by(Semester.start_date).all()
+    def chart_context():
+        # Cumulative GPA per semester comes straight from the stored prefix sums
+        semester_labels, semester_gpa_values = summary.trend_series(current_user)
 
-    if not grades:
-        return render_template('trends.html', labels=[], values=[])
-
-    # Get all semesters for the user
-    semesters = Semester.query.filter_by(user_id=current_user.id).all()
-    
-    # Calculate cumulative GPA for each semester
-    semester_labels = [s.name for s in sorted(semesters, key=lambda x: x.start_date)]
-    semester_gpa_values = calculate_cumulative_gpa(semesters, grades)
+        # Nothing to chart until at least one grade belongs to a semester
+        if not SemesterGpaSummary.query.filter(
+            SemesterGpaSummary.user_id == current_user.id, SemesterGpaSummary.grade_count > 0
+        ).first():
+            return dict(labels=[], values=[])
+        return dict(labels=semester_labels, values=semester_gpa_values)
 
-    return render_template('trends.html', labels=semester_labels, values=semester_gpa_values)
+    trend_chart = fragment_cache.render('trend_chart', 'fragments/trend_chart.html', chart_context)
+    return render_template('trends.html', trend_chart=trend_chart)
 
 @main.route('/simulate')
+@query_budget(1)
 @login_required
 def simulate():
     return render_template('simulate.html')
 
 @main.route('/export')
+@query_budget(1)
 @login_required
 def export():
-    return render_template('export.html')
+    return render_template('export.html', tables=CSV_TABLES)
+
+@main.route('/export/<fmt>')
+@query_budget(7)
+@login_required
+def export_download(fmt):
+    if fmt not in EXPORT_FORMATS or request.args.get('table', 'grades') not in CSV_TABLES:
+        abort(404)
+    # Rebuilds and commits a stale GPA summary before the response starts streaming
+    summary.get_summary(current_user)
+    return export_response(current_user, fmt, request.args.get('table', 'grades'))
+
+@main.route('/import', methods=['GET', 'POST'])
+@query_budget(19)
+@login_required
+def import_grades_view():
+    form = ImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            result = import_grades(current_user, upload.stream, upload.filename,
+                                   dry_run=form.dry_run.data, skip_invalid=form.skip_invalid.data)
+        except ImportFileError as e:
+            flash(f'Could not import {upload.filename}: {e}', 'danger')
+        else:
+            log.info("Import of %s by user %s: %s", upload.filename, current_user.id,
+                     lazy(lambda: {k: v for k, v in result.to_dict().items() if k != 'errors'}))
+            if result.committed:
+                flash(f'Imported {result.imported} grades.', 'success')
+            elif result.dry_run:
+                flash(f'Dry run: {result.valid} of {result.rows} rows would be imported.', 'info')
+            elif result.invalid:
+                flash(f'Nothing was imported: {result.invalid} rows are invalid.', 'danger')
+            else:
+                flash('The file has no grades to import.', 'warning')
+    return render_template('import.html', form=form, result=result)
 
 @main.route('/profile')
+@query_budget(1)
 @login_required
 def profile():
     return render_template('profile.html')
 
 @main.route('/login', methods=['GET', 'POST'])
+@query_budget(2)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -698,6 +467,7 @@ def login():
 
 
 @main.route('/signup', methods=['GET', 'POST'])
+@query_budget(2)
 def signup():
     form = SignupForm()
     if form.validate_on_submit():
@@ -715,14 +485,17 @@ def signup():
     return render_template('signup.html', form=form)
 
 @main.route('/logout')
+@query_budget(1)
 @login_required
 def logout():
+    presence.leave(current_user.id)
     logout_user()
     flash("You have been logged out.", "info")
     return redirect(url_for('main.login'))
 
 
 @main.route('/settings', methods=['GET', 'POST'])
+@query_budget(16)
 @login_required
 def settings():
     form = SettingsForm()
@@ -734,7 +507,7 @@ def settings():
         db.session.commit()
 
     if form.validate_on_submit():
-        print("✅ Form validated successfully")
+        log.debug("Settings form validated for user %s", current_user.id)
         # GPA scale & grade format
         current_user.gpa_scale = form.gpa_scale.data or 'standard'
         current_user.grade_format = form.grade_format.data or 'plus_minus'
@@ -789,6 +562,7 @@ def settings():
             current_user.gpa_cap = form.gpa_cap.data or 4.0
 
         # Commit changes
+        summary.settings_changed(current_user)
         db.session.commit()
         session.pop('show_settings_popup', None)
         flash('Settings saved successfully. GPA calculations now reflect your chosen scale.', 'success')
@@ -823,13 +597,12 @@ def settings():
         form.gpa_cap.data = current_user.gpa_cap
 
     else:
-        print("❌ Form did not validate:")
-        for field_name, error_messages in form.errors.items():
-            print(f"{field_name}: {error_messages}")
+        log.debug("Settings form did not validate: %s", form.errors)
 
     return render_template('settings.html', form=form)
 
 @main.route('/fix_gpa')
+@query_budget(2)
 def fix_gpa():
     from app.models import User  # if needed
     users = User.query.all()
@@ -843,34 +616,82 @@ def fix_gpa():
 
 
 @main.route('/admin')
+@query_budget(11)
 @login_required
 def admin_dashboard():
     if current_user.username != "jaydenokoeguale":
         flash('You do not have permission to access the admin dashboard.', 'danger')
         return redirect(url_for('main.index'))
     
-    # Get basic statistics
-    user_count = User.query.count()
-    total_grades = Grade.query.count()
-    total_semesters = Semester.query.count()
-    online_users = User.query.filter_by(is_online=True).count()
+    # Totals come from the counter cache, not table counts
+    totals = counters.snapshot()
+    online_users = presence.online_count()
     
     # Get recent activities
-    recent_activities = UserActivity.query.order_by(UserActivity.timestamp.desc()).limit(50).all()
+    recent_activities = UserActivity.query.options(db.joinedload(UserActivity.user))\
+        .order_by(UserActivity.timestamp.desc()).limit(50).all()
+
+    activity_by_day = sorted(totals['actions_by_day'].items(), reverse=True)[:14]
     
-    # Get all users with their activity stats
-    users = User.query.all()
+    # One page of the user table, with counts and last activity from one query
+    user_page = admin_users.user_page(
+        sort=request.args.get('sort', 'username'),
+        direction=request.args.get('dir', 'asc'),
+        search=request.args.get('q', '').strip() or None,
+        cursor=request.args.get('after'),
+        limit=request.args.get('limit', type=int)
+    )
     
     return render_template('admin.html',
-        user_count=user_count,
-        total_grades=total_grades,
-        total_semesters=total_semesters,
+        user_count=totals['users'],
+        total_grades=totals['grades'],
+        total_semesters=totals['semesters'],
         online_users=online_users,
         recent_activities=recent_activities,
-        users=users
+        total_actions=totals['actions'],
+        activity_by_day=activity_by_day,
+        counters_as_of=counters.loaded_at,
+        user_page=user_page,
+        presence=presence
     )
 
+@main.route('/admin/refresh-counters', methods=['POST'])
+@query_budget(8)
+@login_required
+def admin_refresh_counters():
+    if current_user.username != "jaydenokoeguale":
+        flash('You do not have permission to access the admin dashboard.', 'danger')
+        return redirect(url_for('main.index'))
+
+    counters.refresh()
+    flash('Dashboard totals refreshed.', 'success')
+    return redirect(url_for('main.admin_dashboard'))
+
+@main.route('/admin/timing')
+@query_budget(1)
+@login_required
+def admin_timing():
+    if current_user.username != "jaydenokoeguale":
+        flash('You do not have permission to access the admin dashboard.', 'danger')
+        return redirect(url_for('main.index'))
+
+    return render_template('admin_timing.html', endpoints=request_timing.endpoints(),
+                           enabled=request_timing.enabled)
+
+@main.route('/admin/timing/reset', methods=['POST'])
+@query_budget(1)
+@login_required
+def admin_reset_timing():
+    if current_user.username != "jaydenokoeguale":
+        flash('You do not have permission to access the admin dashboard.', 'danger')
+        return redirect(url_for('main.index'))
+
+    request_timing.reset()
+    flash('Request timings reset.', 'success')
+    return redirect(url_for('main.admin_timing'))
+
 @main.route('/admin/user/<int:user_id>')
+@query_budget(7)
 @login_required
 def admin_user_details(user_id):
     if current_user.username != "jaydenokoeguale":
@@ -879,17 +700,20 @@ def admin_user_details(user_id):
     user = User.query.get_or_404(user_id)
     recent_activities = UserActivity.query.filter_by(user_id=user_id)\
         .order_by(UserActivity.timestamp.desc()).limit(10).all()
+    last_seen = presence.last_seen(user)
     
     return jsonify({
         'username': user.username,
-        'is_online': user.is_online,
-        'last_seen': user.last_seen.strftime('%Y-%m-%d %H:%M:%S') if user.last_seen else None,
-        'total_grades': len(user.grades),
-        'total_semesters': len(user.semesters),
+        'is_online': presence.is_online(user),
+        'last_seen': last_seen.strftime('%Y-%m-%d %H:%M:%S') if last_seen else None,
+        'total_grades': Grade.query.filter_by(user_id=user.id).count(),
+        'total_semesters': Semester.query.filter_by(user_id=user.id).count(),
+        'total_actions': retention.activity_total(user.id),
         'recent_activities': [activity.to_dict() for activity in recent_activities]
     })
 
 @main.route('/admin/toggle-admin/<int:user_id>', methods=['POST'])
+@query_budget(3)
 @login_required
 def admin_toggle_admin(user_id):
     if not current_user.is_admin:
@@ -902,6 +726,7 @@ def admin_toggle_admin(user_id):
     return jsonify({'success': True})
 
 @main.route('/admin/delete-user/<int:user_id>', methods=['POST'])
+@query_budget(15)
 @login_required
 def admin_delete_user(user_id):
     if not current_user.is_admin:
@@ -917,21 +742,43 @@ def admin_delete_user(user_id):
     return jsonify({'success': True})
 
 @main.route('/semesters')
+@query_budget(2)
 @login_required
 def semesters():
-    # Query all semesters for the current user, eager load grades
-    semesters = Semester.query.filter_by(user_id=current_user.id).order_by(Semester.start_date.desc()).all()
-    form = DeleteForm()
-    return render_template(
-        'semester.html',
-        semesters=semesters,
-        request=request,
-        calculate_gpa=calculate_gpa,  # Pass the calculate_gpa function to the template
-        form=form,  # Pass the form to the template
-        grade_format=current_user.grade_format  # Pass the user's grade format
-    )
+    def cards_context():
+        # One query for the semesters and their grades, one GPA pass over all of them
+        semesters = Semester.query.filter_by(user_id=current_user.id)\
+            .outerjoin(Semester.grades)\
+            .options(db.contains_eager(Semester.grades))\
+            .order_by(Semester.start_date.desc(), Grade.id)\
+            .all()
+        result = current_policy().evaluate([grade for semester in semesters for grade in semester.grades])
+
+        semester_gpas = {
+            semester.id: result.semesters[semester.id].gpa
+            for semester in semesters if semester.grades
+        }
+        max_gpa_ids = min_gpa_ids = []
+        if semester_gpas:
+            max_gpa = max(semester_gpas.values())
+            min_gpa = min(semester_gpas.values())
+            max_gpa_ids = [sid for sid, gpa in semester_gpas.items() if gpa == max_gpa]
+            min_gpa_ids = [sid for sid, gpa in semester_gpas.items() if gpa == min_gpa]
+
+        return dict(
+            semesters=semesters,
+            semester_gpas=semester_gpas,
+            max_gpa_ids=max_gpa_ids,
+            min_gpa_ids=min_gpa_ids,
+            form=DeleteForm(),  # Pass the form to the template
+            grade_format=current_user.grade_format  # Pass the user's grade format
+        )
+
+    semester_cards = fragment_cache.render('semester_cards', 'fragments/semester_cards.html', cards_context)
+    return render_template('semester.html', semester_cards=semester_cards, request=request)
 
 @main.route('/add_semester', methods=['GET', 'POST'])
+@query_budget(9)
 @login_required
 def add_semester():
     form = SemesterForm()
@@ -942,12 +789,15 @@ def add_semester():
             user_id=current_user.id
         )
         db.session.add(new_semester)
+        db.session.flush()
+        summary.semester_added(current_user, new_semester)
         db.session.commit()
         flash('Semester added successfully!', 'success')
         return redirect(url_for('main.semesters'))
     return render_template('add_semester.html', form=form)
 
 @main.route('/edit_semester/<int:semester_id>', methods=['GET', 'POST'])
+@query_budget(5)
 @login_required
 def edit_semester(semester_id):
     semester = Semester.query.get_or_404(semester_id)
@@ -969,6 +819,7 @@ def edit_semester(semester_id):
         if old_date != new_date:
             for grade in semester.grades:
                 grade.date = new_date
+            summary.semester_moved(current_user, semester, old_date)
         
         db.session.commit()
         flash('Semester and associated grades updated successfully!', 'success')
@@ -976,6 +827,7 @@ def edit_semester(semester_id):
     return render_template('edit_semester.html', form=form, semester=semester)
 
 @main.route('/delete_semester/<int:semester_id>', methods=['POST'])
+@query_budget(9)
 @login_required
 def delete_semester(semester_id):
     semester = Semester.query.get_or_404(semester_id)
@@ -983,8 +835,8 @@ def delete_semester(semester_id):
         flash("You don't have permission to delete this semester.", "danger")
         return redirect(url_for('main.semesters'))
     
-    # Check if semester has grades
-    if semester.grades:
+    # Check if semester has grades (without loading them)
+    if db.session.query(Grade.query.filter_by(semester_id=semester.id).exists()).scalar():
         flash("Cannot delete semester that contains grades. Please delete the grades first.", "danger")
         return redirect(url_for('main.semesters'))
     
@@ -997,7 +849,10 @@ def delete_semester(semester_id):
 @main.before_request
 def track_activity():
     if current_user.is_authenticated:
-        current_user.update_activity(
+        # Queued and written in batches by the activity sink, not committed per request
+        presence.heartbeat(current_user.id)
+        activity_sink.record(
+            current_user.id,
             action=request.endpoint,
             ip_address=request.remote_addr,
             user_agent=request.user_agent.string,
@@ -1005,5 +860,6 @@ def track_activity():
         )
 
 @main.route('/sitemap.xml')
+@query_budget(1)
 def sitemap():
     return send_from_directory('templates', 'sitemap.xml', mimetype='application/xml')
\ No newline at end of file
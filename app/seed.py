@@ -0,0 +1,173 @@
+"""Synthetic data for benchmarks and checks.
+
+seed_database() fills the database with users, semesters and grades shaped
+like real ones:
+- every GPA scale and grade format, some users with credit hours or a cap
+- grades across all course types, mostly inside a semester, dated within it
+
+It is seeded from a number, so the same arguments always produce the same
+data, and benchmark runs on different commits measure the same workload.
+
+Rows are written with Core executemany inserts in chunks, not through the
+ORM, so seeding thousands of users takes seconds. The ORM write hooks do
+not run: data_version stays 0 and no change journal entries are written,
+as for rows loaded by a migration. GPA summaries are rebuilt at the end
+unless asked not to. All seeded users share one password hash; hashing is
+deliberately slow.
+
+temporary_app() builds an app on a throwaway SQLite file, for the commands
+that benchmark or check the app without touching the configured database.
+"""
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app import db
+from app.gpa import COURSE_TYPES, get_letter_grade
+from app.models import Grade, Semester, User, UserSettings
+
+ADMIN_USERNAME = 'jaydenokoeguale'
+GPA_SCALES = ('standard', 'weighted_5', 'weighted_6', 'college_plus_minus', 'percentage', 'custom')
+GRADE_FORMATS = ('plus_minus', 'simple')
+TERMS = ('Fall', 'Spring', 'Summer')
+SUBJECTS = ('Algebra', 'Biology', 'Chemistry', 'English', 'History', 'Spanish', 'Physics',
+            'Economics', 'Art', 'Computer Science', 'Geometry', 'Music', 'Psychology', 'French')
+CREDIT_HOURS = (0.5, 1.0, 1.0, 3.0, 4.0)
+CHUNK_SIZE = 5000
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _user_row(user_id, username, password_hash, rng):
+    return {
+        'id': user_id,
+        'username': username,
+        'password_hash': password_hash,
+        'gpa_scale': rng.choice(GPA_SCALES),
+        'grade_format': rng.choice(GRADE_FORMATS),
+        'use_credit_hours': rng.random() < 0.3,
+        'gpa_cap': rng.choice([None, None, None, 4.0, 5.0]),
+        'first_login': False,
+    }
+
+
+def seed_database(users, semesters, grades, seed=0, prefix='seed', password='password',
+                  admin=False, summaries=True):
+    """Insert `users` users with `semesters` semesters and `grades` grades each.
+
+    With admin=True the admin dashboard's account is created too (if missing),
+    with the same amount of data. Returns {'users', 'semesters', 'grades'} counts.
+    """
+    from werkzeug.security import generate_password_hash
+
+    from app import summary
+
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(password)
+    user_id = _next_id(User)
+    usernames = [f'{prefix}{i}' for i in range(users)]
+    if admin and not User.query.filter_by(username=ADMIN_USERNAME).count():
+        usernames.insert(0, ADMIN_USERNAME)
+
+    user_rows = []
+    for username in usernames:
+        row = _user_row(user_id, username, password_hash, rng)
+        row['is_admin'] = username == ADMIN_USERNAME
+        user_rows.append(row)
+        user_id += 1
+    user_ids = [row['id'] for row in user_rows]
+
+    semester_id = _next_id(Semester)
+    semester_rows = []
+    # {user_id: [(semester_id, start_date), ...]}
+    terms = {}
+    for uid in user_ids:
+        start = date(2018, 8, 20) + timedelta(days=rng.randrange(0, 365 * 3))
+        terms[uid] = []
+        for i in range(semesters):
+            name = f'{TERMS[i % len(TERMS)]} {start.year}'
+            semester_rows.append({'id': semester_id, 'name': name, 'start_date': start, 'user_id': uid})
+            terms[uid].append((semester_id, start))
+            semester_id += 1
+            start += timedelta(days=rng.choice([120, 130, 140]))
+
+    grade_rows = []
+    formats = {row['id']: row['grade_format'] for row in user_rows}
+    for uid in user_ids:
+        for _ in range(grades):
+            # Roughly normal grades, with a tail of failing ones
+            score = round(min(100.0, max(40.0, rng.gauss(85, 9))), 1)
+            if terms[uid] and rng.random() < 0.9:
+                sid, start = rng.choice(terms[uid])
+                when = start + timedelta(days=rng.randrange(0, 110))
+            else:
+                sid, when = None, date(2018, 6, 1) + timedelta(days=rng.randrange(0, 365 * 5))
+            grade_rows.append({
+                'subject': rng.choice(SUBJECTS),
+                'grade': score,
+                'letter': get_letter_grade(score, formats[uid]),
+                'course_type': rng.choice(COURSE_TYPES),
+                'date': when,
+                'user_id': uid,
+                'semester_id': sid,
+                'credit_hours': rng.choice(CREDIT_HOURS),
+            })
+
+    settings_rows = [{'user_id': uid, 'default_course_type': rng.choice(COURSE_TYPES)} for uid in user_ids]
+    for model, rows in ((User, user_rows), (UserSettings, settings_rows),
+                        (Semester, semester_rows), (Grade, grade_rows)):
+        for chunk in _chunks(rows):
+            db.session.execute(insert(model), chunk)
+    db.session.commit()
+
+    if summaries:
+        for chunk in _chunks(user_ids, 500):
+            for user in User.query.filter(User.id.in_(chunk)).all():
+                summary.rebuild_summary(user)
+            db.session.commit()
+
+    return {'users': len(user_rows), 'semesters': len(semester_rows), 'grades': len(grade_rows)}
+
+
+@contextmanager
+def temporary_app(config=None):
+    """An app on an empty throwaway SQLite database, removed on exit.
+
+    Meant for CLI commands; the module-level extensions (activity sink,
+    caches) are re-bound to this app while it is in use.
+    """
+    from app import create_app
+    from app.activity import activity_sink
+    from app.counters import counters
+
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='gradepilot-')
+    os.close(fd)
+    try:
+        app = create_app(dict({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+            'WTF_CSRF_ENABLED': False,
+            'METRICS_DIR': None,
+        }, **(config or {})))
+        with app.app_context():
+            db.create_all()
+        counters.invalidate()
+        yield app
+        # Queued activity goes to this database, before it is removed
+        activity_sink.shutdown()
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,131 @@
+"""SQLite engine profiles.
+
+SQLITE_PROFILE selects how the SQLite engine is set up:
+
+* 'wal' (default): WAL journal, synchronous=NORMAL, a busy timeout instead of
+  immediate "database is locked" errors, mmap, a larger page cache and foreign
+  key enforcement on every connection, plus a small per-process pool that is
+  reset after a fork so gunicorn workers never share a connection.
+* 'default': SQLite/SQLAlchemy defaults (rollback journal, full fsync on every
+  commit), as before.
+
+The individual values can be overridden with SQLITE_BUSY_TIMEOUT (ms),
+SQLITE_MMAP_SIZE (bytes), SQLITE_CACHE_SIZE (KiB), SQLITE_POOL_SIZE and
+SQLITE_MAX_OVERFLOW.
+"""
+import os
+import weakref
+
+from sqlalchemy import event
+
+SQLITE_PROFILES = {
+    'default': None,
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': 20000,
+        'foreign_keys': 'ON',
+        'temp_store': 'MEMORY',
+        'pool_size': 5,
+        'max_overflow': 10,
+    },
+}
+
+CONFIG_OVERRIDES = {
+    'SQLITE_BUSY_TIMEOUT': 'busy_timeout',
+    'SQLITE_MMAP_SIZE': 'mmap_size',
+    'SQLITE_CACHE_SIZE': 'cache_size',
+    'SQLITE_POOL_SIZE': 'pool_size',
+    'SQLITE_MAX_OVERFLOW': 'max_overflow',
+}
+
+# Engines to reset in a forked child. Weak, so the throwaway apps' engines
+# (app.seed.temporary_app) are not kept alive by the fork hook.
+_engines = weakref.WeakSet()
+_fork_hook_registered = False
+
+
+def get_profile(name, config=None):
+    """The settings for a profile name, with any SQLITE_* config overrides applied."""
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {name!r}; expected one of {', '.join(SQLITE_PROFILES)}")
+    profile = SQLITE_PROFILES[name]
+    if profile is None:
+        return None
+    profile = dict(profile)
+    for key, setting in CONFIG_OVERRIDES.items():
+        if config and config.get(key) is not None:
+            profile[setting] = int(config[key])
+    return profile
+
+
+def engine_options(profile, in_memory=False):
+    """Keyword arguments for create_engine() (SQLALCHEMY_ENGINE_OPTIONS)."""
+    if profile is None:
+        return {}
+    options = {
+        'connect_args': {
+            # pysqlite's own lock wait, in seconds; matches PRAGMA busy_timeout
+            'timeout': profile['busy_timeout'] / 1000,
+            # Pooled connections are handed between request threads
+            'check_same_thread': False,
+        },
+    }
+    if not in_memory:
+        # In-memory databases keep SQLAlchemy's single-connection pool
+        options['pool_size'] = profile['pool_size']
+        options['max_overflow'] = profile['max_overflow']
+    return options
+
+
+def pragma_statements(profile):
+    return [
+        f"PRAGMA journal_mode={profile['journal_mode']}",
+        f"PRAGMA synchronous={profile['synchronous']}",
+        f"PRAGMA busy_timeout={int(profile['busy_timeout'])}",
+        f"PRAGMA mmap_size={int(profile['mmap_size'])}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(profile['cache_size'])}",
+        f"PRAGMA foreign_keys={profile['foreign_keys']}",
+        f"PRAGMA temp_store={profile['temp_store']}",
+    ]
+
+
+def install_profile(engine, profile):
+    """Run the profile's pragmas on every new connection of a SQLite engine."""
+    if profile is None or engine.dialect.name != 'sqlite':
+        return
+    statements = pragma_statements(profile)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    # A forked worker must not reuse the parent's pooled connections
+    global _fork_hook_registered
+    _engines.add(engine)
+    if not _fork_hook_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_dispose_after_fork)
+        _fork_hook_registered = True
+
+
+def _dispose_after_fork():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+def configure_app(app):
+    """Set SQLALCHEMY_ENGINE_OPTIONS from SQLITE_PROFILE; call before db.init_app()."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not uri.startswith('sqlite'):
+        return None
+    profile = get_profile(app.config.get('SQLITE_PROFILE', 'wal'), app.config)
+    options = engine_options(profile, in_memory=uri in ('sqlite://', 'sqlite:///:memory:'))
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    return profile
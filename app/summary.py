@@ -0,0 +1,302 @@
+"""Materialized per-user GPA totals.
+
+GpaSummary holds a user's total weighted points, credits, grade count and
+numeric sum, and SemesterGpaSummary the same per semester, so the dashboard
+header and the cumulative chart are a couple of row reads instead of a pass
+over every grade. The grade routes apply each change as a delta; a summary
+computed under different settings (policy_key mismatch) is rebuilt on demand.
+
+Semester rows also carry prefix sums (cum_points/cum_credits) in start-date
+order, so the cumulative GPA series is read straight from them. A change to
+one semester only rewrites the prefix sums from that semester onward.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import case, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.gpa import GpaPolicy, as_float
+from app.models import Grade, GpaSummary, Semester, SemesterGpaSummary
+
+# The fields of a grade that affect GPA totals, captured before an edit
+GradeSnapshot = namedtuple('GradeSnapshot', 'grade course_type credit_hours semester_id')
+
+TOLERANCE = 1e-6
+
+
+def snapshot(grade):
+    return GradeSnapshot(grade.grade, grade.course_type, grade.credit_hours, grade.semester_id)
+
+
+def contribution(policy, snap):
+    """(points x credits, credits) a grade adds to the totals under a policy."""
+    points = policy.points_for(snap.grade, snap.course_type)
+    if points is None:
+        return 0.0, 0.0
+    credits = policy.credits_for(snap.credit_hours)
+    return points * credits, credits
+
+
+def rebuild_summary(user, policy=None):
+    """Recompute a user's summary rows from their grades."""
+    policy = policy or GpaPolicy.from_user(user)
+    grades = Grade.query.filter_by(user_id=user.id).order_by(Grade.id).all()
+    result = policy.evaluate(grades)
+
+    summary = db.session.get(GpaSummary, user.id)
+    if summary is None:
+        summary = GpaSummary(user_id=user.id)
+        db.session.add(summary)
+    summary.policy_key = policy.key
+    summary.total_points = result.points
+    summary.total_credits = result.credits
+    summary.grade_count = result.count
+    summary.numeric_sum = result.numeric_sum
+    summary.updated_at = datetime.utcnow()
+
+    SemesterGpaSummary.query.filter_by(user_id=user.id).delete(synchronize_session='fetch')
+    cum_points = 0.0
+    cum_credits = 0.0
+    semesters = Semester.query.filter_by(user_id=user.id).order_by(Semester.start_date, Semester.id).all()
+    for semester in semesters:
+        totals = result.semesters.get(semester.id)
+        partial = SemesterGpaSummary(
+            user_id=user.id,
+            semester_id=semester.id,
+            start_date=semester.start_date,
+            total_points=0.0,
+            total_credits=0.0,
+            grade_count=0
+        )
+        if totals is not None:
+            partial.total_points = totals.points
+            partial.total_credits = totals.credits
+            partial.grade_count = totals.count
+            cum_points += totals.points
+            cum_credits += totals.credits
+        partial.cum_points = cum_points
+        partial.cum_credits = cum_credits
+        db.session.add(partial)
+    db.session.flush()
+    return summary
+
+
+def get_summary(user, policy=None):
+    """The user's summary, rebuilt first if it is missing or was computed under other settings."""
+    policy = policy or GpaPolicy.from_user(user)
+    summary = db.session.get(GpaSummary, user.id)
+    if summary is None or summary.policy_key != policy.key:
+        summary = rebuild_summary(user, policy)
+        # Keep the rebuild; otherwise every read would redo it until the next write
+        db.session.commit()
+    return summary
+
+
+def get_semester_summaries(user):
+    """{semester_id: SemesterGpaSummary} for the user; call get_summary() first."""
+    return {s.semester_id: s for s in SemesterGpaSummary.query.filter_by(user_id=user.id).all()}
+
+
+def trend_series(user):
+    """Semester names and the cumulative GPA after each, in start-date order.
+
+    Served from the stored prefix sums; no grade rows are read.
+    """
+    get_summary(user)
+    rows = db.session.execute(
+        select(Semester.name, SemesterGpaSummary.cum_points, SemesterGpaSummary.cum_credits)
+        .join(Semester, Semester.id == SemesterGpaSummary.semester_id)
+        .where(SemesterGpaSummary.user_id == user.id)
+        .order_by(SemesterGpaSummary.start_date, SemesterGpaSummary.semester_id)
+    ).all()
+    labels = [name for name, _, _ in rows]
+    values = [round(points / credits, 2) if credits else 0.0 for _, points, credits in rows]
+    return labels, values
+
+
+def refresh_cumulative(user_id, start_date=None, semester_id=None):
+    """Rewrite the prefix sums from the given semester position onward (default: all)."""
+    order = tuple_(SemesterGpaSummary.start_date, SemesterGpaSummary.semester_id)
+    query = SemesterGpaSummary.query.filter_by(user_id=user_id)
+    cum_points = 0.0
+    cum_credits = 0.0
+    if semester_id is not None:
+        previous = query.filter(order < tuple_(start_date, semester_id)).order_by(
+            SemesterGpaSummary.start_date.desc(), SemesterGpaSummary.semester_id.desc()
+        ).first()
+        if previous is not None:
+            cum_points = previous.cum_points
+            cum_credits = previous.cum_credits
+        query = query.filter(order >= tuple_(start_date, semester_id))
+
+    for partial in query.order_by(SemesterGpaSummary.start_date, SemesterGpaSummary.semester_id):
+        cum_points += partial.total_points
+        cum_credits += partial.total_credits
+        partial.cum_points = cum_points
+        partial.cum_credits = cum_credits
+    db.session.flush()
+
+
+def _is_current(user, policy):
+    """True if the stored summary can take deltas; otherwise rebuild it (including pending changes)."""
+    db.session.flush()
+    summary = db.session.get(GpaSummary, user.id)
+    if summary is not None and summary.policy_key == policy.key:
+        return True
+    rebuild_summary(user, policy)
+    return False
+
+
+def _apply(user_id, policy, snap, sign):
+    points, credits = contribution(policy, snap)
+    points *= sign
+    credits *= sign
+    numeric = (as_float(snap.grade) or 0.0) * sign
+    emptied = GpaSummary.grade_count + sign == 0
+
+    db.session.execute(
+        update(GpaSummary)
+        .where(GpaSummary.user_id == user_id)
+        .values(
+            # Reset to exact zeros once the last grade is gone so rounding error cannot linger
+            total_points=case((emptied, 0.0), else_=GpaSummary.total_points + points),
+            total_credits=case((emptied, 0.0), else_=GpaSummary.total_credits + credits),
+            numeric_sum=case((emptied, 0.0), else_=GpaSummary.numeric_sum + numeric),
+            grade_count=GpaSummary.grade_count + sign,
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    if snap.semester_id is not None:
+        start_date = select(Semester.start_date).where(Semester.id == snap.semester_id).scalar_subquery()
+        stmt = insert(SemesterGpaSummary).values(
+            user_id=user_id,
+            semester_id=snap.semester_id,
+            start_date=start_date,
+            total_points=points,
+            total_credits=credits,
+            grade_count=sign
+        )
+        table = SemesterGpaSummary.__table__
+        emptied = table.c.grade_count + sign == 0
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SemesterGpaSummary.semester_id],
+            set_={
+                'total_points': case((emptied, 0.0), else_=table.c.total_points + points),
+                'total_credits': case((emptied, 0.0), else_=table.c.total_credits + credits),
+                'grade_count': table.c.grade_count + sign
+            }
+        )
+        db.session.execute(stmt)
+
+    # The updates bypass the ORM, so drop any stale copies loaded in this session
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, (GpaSummary, SemesterGpaSummary)):
+            db.session.expire(obj)
+
+    if snap.semester_id is not None:
+        partial = SemesterGpaSummary.query.filter_by(semester_id=snap.semester_id).first()
+        refresh_cumulative(user_id, partial.start_date, partial.semester_id)
+
+
+def grade_added(user, grade):
+    policy = GpaPolicy.from_user(user)
+    if _is_current(user, policy):
+        _apply(user.id, policy, snapshot(grade), 1)
+
+
+def grade_changed(user, old, grade):
+    """Apply an edit; old is the snapshot() taken before the grade was modified."""
+    policy = GpaPolicy.from_user(user)
+    if _is_current(user, policy):
+        _apply(user.id, policy, old, -1)
+        _apply(user.id, policy, snapshot(grade), 1)
+
+
+def grade_removed(user, old):
+    """Apply a deletion; old is the snapshot() of the grade, taken before session.delete()."""
+    policy = GpaPolicy.from_user(user)
+    if _is_current(user, policy):
+        _apply(user.id, policy, old, -1)
+
+
+def settings_changed(user):
+    rebuild_summary(user)
+
+
+def semester_added(user, semester):
+    """Give a new semester its (empty) summary row so it shows up in the trend series."""
+    policy = GpaPolicy.from_user(user)
+    if _is_current(user, policy):
+        db.session.add(SemesterGpaSummary(
+            user_id=user.id,
+            semester_id=semester.id,
+            start_date=semester.start_date,
+            total_points=0.0,
+            total_credits=0.0,
+            grade_count=0
+        ))
+        db.session.flush()
+        refresh_cumulative(user.id, semester.start_date, semester.id)
+
+
+def semester_moved(user, semester, old_start_date):
+    """Re-sort a semester whose start date changed and rewrite the affected prefix sums."""
+    policy = GpaPolicy.from_user(user)
+    if not _is_current(user, policy):
+        return
+    partial = SemesterGpaSummary.query.filter_by(semester_id=semester.id).first()
+    if partial is None:
+        rebuild_summary(user, policy)
+        return
+    partial.start_date = semester.start_date
+    db.session.flush()
+    refresh_cumulative(user.id, min(old_start_date, semester.start_date), semester.id)
+
+
+def check_summary(user):
+    """Compare the stored summary with a full recompute; returns a list of differences."""
+    policy = GpaPolicy.from_user(user)
+    grades = Grade.query.filter_by(user_id=user.id).all()
+    expected = policy.evaluate(grades)
+    problems = []
+
+    summary = db.session.get(GpaSummary, user.id)
+    if summary is None:
+        return ['missing summary'] if grades else []
+    if summary.policy_key != policy.key:
+        problems.append('summary computed under old settings')
+
+    for field, want, have in (
+        ('total_points', expected.points, summary.total_points),
+        ('total_credits', expected.credits, summary.total_credits),
+        ('grade_count', expected.count, summary.grade_count),
+        ('numeric_sum', expected.numeric_sum, summary.numeric_sum),
+    ):
+        if abs(want - have) > TOLERANCE:
+            problems.append(f'{field}: stored {have}, expected {want}')
+
+    stored = get_semester_summaries(user)
+    cum_points = 0.0
+    cum_credits = 0.0
+    semesters = Semester.query.filter_by(user_id=user.id).order_by(Semester.start_date, Semester.id).all()
+    for semester in semesters:
+        want = expected.semesters.get(semester.id)
+        have = stored.pop(semester.id, None)
+        if want is not None:
+            cum_points += want.points
+            cum_credits += want.credits
+        if have is None:
+            problems.append(f'semester {semester.id}: missing summary row')
+            continue
+        want_values = (want.points, want.credits, want.count) if want else (0.0, 0.0, 0)
+        want_values += (cum_points, cum_credits)
+        have_values = (have.total_points, have.total_credits, have.grade_count, have.cum_points, have.cum_credits)
+        if any(abs(w - h) > TOLERANCE for w, h in zip(want_values, have_values)) or have.start_date != semester.start_date:
+            problems.append(f'semester {semester.id}: stored {have_values}, expected {want_values}')
+    for semester_id in stored:
+        problems.append(f'semester {semester_id}: summary row without a semester')
+    return problems
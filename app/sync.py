@@ -0,0 +1,135 @@
+"""Change journal for delta sync.
+
+Every flush that changes a user's grades, semesters or settings bumps their
+data_version (app/versioning.py) and writes one ChangeJournal row per changed
+record, stamped with the new version: which grade or semester was upserted or
+deleted, or that the settings changed. A client that last synced at version N
+asks for /api/v1/changes?since=N and gets only the records changed since,
+read from the (user_id, version) index, instead of the whole history.
+
+compact_journal() (`flask compact-journal`, meant to run daily from cron)
+drops entries superseded by a later change to the same record, and deletes
+entries older than JOURNAL_RETENTION_DAYS. It raises the user's journal_floor
+to the newest version it deleted; a client behind the floor has to resync in
+full, and the API answers it with 410 Gone.
+"""
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import bindparam, func, select, update
+
+from app import db
+from app.models import ChangeJournal, Grade, Semester, User
+from app.retention import retention_cutoff
+
+# ChangeJournal.entity for each versioned ORM class; settings live on several
+ENTITIES = {
+    'Grade': 'grade',
+    'Semester': 'semester',
+    'UserSettings': 'settings',
+    'CustomGPA': 'settings',
+    'User': 'settings',
+}
+
+Changes = namedtuple('Changes', 'grades deleted_grades semester_ids deleted_semesters settings')
+
+
+def entity_key(obj):
+    """(entity, entity_id) a changed row is journaled under."""
+    entity = ENTITIES[type(obj).__name__]
+    if entity == 'settings':
+        return entity, obj.id if isinstance(obj, User) else obj.user_id
+    return entity, obj.id
+
+
+def journal(entries, versions, session=None):
+    """Write (user_id, entity, entity_id, op) entries at each user's new version.
+
+    versions is bump()'s {user_id: data_version}; entries for users it does
+    not include (deleted in the same flush) are dropped.
+    """
+    session = session or db.session
+    rows = []
+    seen = set()
+    for user_id, entity, entity_id, op in entries:
+        version = versions.get(user_id)
+        if version is None or (user_id, entity, entity_id, op) in seen:
+            continue
+        seen.add((user_id, entity, entity_id, op))
+        rows.append({'user_id': user_id, 'version': version, 'entity': entity,
+                     'entity_id': entity_id, 'op': op})
+    if rows:
+        session.execute(ChangeJournal.__table__.insert(), rows)
+
+
+def can_sync(user, since):
+    """Whether the journal still holds every change after version `since`."""
+    return user.journal_floor <= since <= user.data_version
+
+
+def changes_since(user, since):
+    """The user's records changed after version `since`, latest state only."""
+    latest = {}
+    for entity, entity_id, op in db.session.execute(
+        select(ChangeJournal.entity, ChangeJournal.entity_id, ChangeJournal.op)
+        .where(ChangeJournal.user_id == user.id, ChangeJournal.version > since)
+        .order_by(ChangeJournal.version, ChangeJournal.id)
+    ):
+        latest[entity, entity_id] = op
+
+    def changed(entity, op):
+        return [entity_id for (kind, entity_id), last in latest.items() if kind == entity and last == op]
+
+    grades = []
+    grade_ids = changed('grade', 'upsert')
+    if grade_ids:
+        grades = (
+            Grade.query.options(db.joinedload(Grade.semester))
+            .filter(Grade.id.in_(grade_ids), Grade.user_id == user.id)
+            .order_by(Grade.id).all()
+        )
+    semester_ids = set(changed('semester', 'upsert'))
+    if semester_ids:
+        semester_ids = set(db.session.execute(
+            select(Semester.id).where(Semester.id.in_(semester_ids), Semester.user_id == user.id)
+        ).scalars())
+
+    # Upserted rows that no longer exist were removed outside the ORM, without an entry
+    deleted_grades = set(changed('grade', 'delete')) | (set(grade_ids) - {g.id for g in grades})
+    deleted_semesters = set(changed('semester', 'delete')) | (set(changed('semester', 'upsert')) - semester_ids)
+    return Changes(grades, sorted(deleted_grades), semester_ids, sorted(deleted_semesters),
+                   ('settings', user.id) in latest)
+
+
+def compact_journal(days=None):
+    """Drop superseded journal entries and those older than the retention window.
+
+    Returns (superseded entries deleted, expired entries deleted, users whose floor moved).
+    """
+    if days is None:
+        days = current_app.config.get('JOURNAL_RETENTION_DAYS', 90)
+    table = ChangeJournal.__table__
+
+    # Only the newest entry for a record decides what any client is sent
+    newest = select(func.max(table.c.id)).group_by(table.c.user_id, table.c.entity, table.c.entity_id)
+    superseded = db.session.execute(table.delete().where(table.c.id.not_in(newest))).rowcount
+    db.session.commit()
+
+    cutoff = retention_cutoff(days)
+    floors = db.session.execute(
+        select(table.c.user_id, func.max(table.c.version))
+        .where(table.c.created_at < cutoff)
+        .group_by(table.c.user_id)
+    ).all()
+    expired = 0
+    if floors:
+        users = User.__table__
+        db.session.execute(
+            update(users)
+            .where(users.c.id == bindparam('user_id'), users.c.journal_floor < bindparam('floor'))
+            .values(journal_floor=bindparam('floor')),
+            [{'user_id': user_id, 'floor': version} for user_id, version in floors]
+        )
+        expired = db.session.execute(table.delete().where(table.c.created_at < cutoff)).rowcount
+    db.session.commit()
+    return superseded, expired, len(floors)
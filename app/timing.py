@@ -0,0 +1,257 @@
+"""Per-request timing and SQL accounting.
+
+For every request RequestTiming records:
+
+- wall time, from before_request to after_request
+- SQL: time inside cursor execution, statements run, rows fetched
+- GPA computation: time in span('gpa') blocks (GpaPolicy.evaluate)
+- template rendering: time between Flask's before_render_template and
+  template_rendered signals
+
+The numbers go out in a Server-Timing header, so they show up in the
+browser's network panel. They are also added to per-endpoint aggregates
+(count, totals, max, recent wall-time percentiles), which admins see at
+/admin/timing.
+
+Rows are counted per fetch, not per row: during a timed request each
+statement's DBAPI cursor is wrapped so fetchall() and fetchmany() add the
+length of the batch they return. Statements run outside a request, such as
+the activity sink's thread or CLI commands, are not recorded and their
+cursors are not wrapped.
+"""
+import threading
+import time
+import weakref
+from collections import deque
+from contextvars import ContextVar
+
+from flask import request, template_rendered, before_render_template
+from sqlalchemy import event
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestStats:
+    __slots__ = ('started', 'sql_time', 'statements', 'rows', 'spans', '_open')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.spans = {}
+        self._open = {}
+
+    def enter(self, name):
+        depth, started = self._open.get(name, (0, None))
+        # Only the outermost block of a name is timed, so nesting is not double counted
+        self._open[name] = (depth + 1, started if depth else time.perf_counter())
+
+    def exit(self, name):
+        depth, started = self._open[name]
+        if depth == 1:
+            del self._open[name]
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - started
+        else:
+            self._open[name] = (depth - 1, started)
+
+
+class span:
+    """Time a block under `name` in the current request's stats; a no-op outside requests."""
+    __slots__ = ('name', 'stats')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.stats = _current.get()
+        if self.stats is not None:
+            self.stats.enter(self.name)
+
+    def __exit__(self, *exc):
+        if self.stats is not None:
+            self.stats.exit(self.name)
+
+
+class EndpointStats:
+    __slots__ = ('endpoint', 'count', 'wall', 'max_wall', 'sql_time', 'statements', 'rows',
+                 'gpa', 'render', 'recent')
+
+    def __init__(self, endpoint, samples):
+        self.endpoint = endpoint
+        self.count = 0
+        self.wall = 0.0
+        self.max_wall = 0.0
+        self.sql_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.gpa = 0.0
+        self.render = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def add(self, wall, stats):
+        self.count += 1
+        self.wall += wall
+        self.max_wall = max(self.max_wall, wall)
+        self.sql_time += stats.sql_time
+        self.statements += stats.statements
+        self.rows += stats.rows
+        self.gpa += stats.spans.get('gpa', 0.0)
+        self.render += stats.spans.get('render', 0.0)
+        self.recent.append(wall)
+
+    def percentile(self, pct):
+        """Wall time (seconds) at `pct` over the most recent requests."""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def mean(self, total):
+        return total / self.count if self.count else 0.0
+
+
+class RequestTiming:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.header = True
+        self.samples = 500
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._engines = weakref.WeakSet()  # instrumented engines; weak so throwaway apps can go
+        self.observers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REQUEST_TIMING', True)
+        app.config.setdefault('REQUEST_TIMING_HEADER', True)
+        app.config.setdefault('REQUEST_TIMING_SAMPLES', 500)
+        self.enabled = app.config['REQUEST_TIMING']
+        self.header = app.config['REQUEST_TIMING_HEADER']
+        self.samples = app.config['REQUEST_TIMING_SAMPLES']
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+    def instrument(self, engine):
+        """Count statements, rows and SQL time on an engine (call once per engine)."""
+        if not self.enabled or engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def add_observer(self, observer):
+        """Call observer(endpoint, status, wall, stats) after every timed request."""
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def endpoints(self):
+        """Per-endpoint aggregates, slowest total time first."""
+        with self._lock:
+            return sorted(self._endpoints.values(), key=lambda e: e.wall, reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def _before_request(self):
+        _current.set(RequestStats())
+
+    def _after_request(self, response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        wall = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            aggregate = self._endpoints.get(endpoint)
+            if aggregate is None:
+                aggregate = self._endpoints[endpoint] = EndpointStats(endpoint, self.samples)
+            aggregate.add(wall, stats)
+        for observer in self.observers:
+            observer(endpoint, response.status_code, wall, stats)
+        if self.header:
+            response.headers.add('Server-Timing', server_timing(wall, stats))
+        return response
+
+    def _teardown_request(self, exc):
+        _current.set(None)
+
+    def _before_render(self, app, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats.enter('render')
+
+    def _after_render(self, app, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats.exit('render')
+
+
+def server_timing(wall, stats):
+    """Server-Timing header value (durations in milliseconds)."""
+    parts = [
+        f'total;dur={wall * 1000:.1f}',
+        f'sql;dur={stats.sql_time * 1000:.1f};desc="{stats.statements} statements, {stats.rows} rows"',
+    ]
+    if 'gpa' in stats.spans:
+        parts.append(f'gpa;dur={stats.spans["gpa"] * 1000:.1f}')
+    if 'render' in stats.spans:
+        parts.append(f'render;dur={stats.spans["render"] * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get('query_started')
+    if started:
+        stats.sql_time += time.perf_counter() - started.pop()
+    stats.statements += 1
+    # The result fetches from context.cursor, which is set up after this event
+    if context is not None and cursor.description is not None and not isinstance(context.cursor, _CountingCursor):
+        context.cursor = _CountingCursor(context.cursor, stats)
+
+
+class _CountingCursor:
+    """A DBAPI cursor that adds the number of rows each fetch returns to a request's stats."""
+    __slots__ = ('_cursor', '_stats')
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *size):
+        rows = self._cursor.fetchmany(*size)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+request_timing = RequestTiming()
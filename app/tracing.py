@@ -0,0 +1,163 @@
+"""Leveled logging and tracing.
+
+Modules get a Tracer with get_logger(__name__) instead of calling print().
+Tracers are thin wrappers around the standard `logging` loggers under the
+app's 'app' logger, so levels are set per module:
+
+    LOG_LEVEL = 'INFO'                                  # the whole app
+    LOG_LEVELS = {'app.gpa': 'TRACE', 'app.routes': 'DEBUG'}
+
+(or LOG_LEVEL / LOG_LEVELS="app.gpa=TRACE,app.routes=DEBUG" in the environment).
+
+Messages use %-style arguments and are only formatted when a record is
+emitted. Arguments that are costly to build are wrapped in lazy(), which
+defers the call too. Hot loops check enabled() once before the loop, so a
+disabled trace costs one boolean test per iteration and no formatting.
+High-volume events pass sample=, or take TRACE_SAMPLE_RATE, and only that
+fraction of them is emitted.
+
+Every request gets a trace id: the incoming X-Request-ID header if it is a
+plausible id, otherwise a fresh one. It is added to every record logged
+while handling the request and echoed in the response's X-Request-ID.
+"""
+import logging
+import os
+import random
+import re
+import uuid
+
+from flask import g, has_request_context, request
+
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+LOG_FORMAT = '[%(asctime)s] %(levelname)s %(name)s [%(trace_id)s]: %(message)s'
+TRACE_ID_HEADER = 'X-Request-ID'
+VALID_TRACE_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_sample_rate = 1.0
+
+
+class lazy:
+    """A log argument computed only if the record is actually formatted."""
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+    def __repr__(self):
+        return repr(self.func())
+
+
+class Tracer:
+    """A module logger with cheap level checks and sampling."""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def enabled(self, level=TRACE):
+        # Logger.isEnabledFor caches its answer per level
+        return self.logger.isEnabledFor(level)
+
+    def sampled(self, rate=None):
+        rate = _sample_rate if rate is None else rate
+        return rate >= 1.0 or random.random() < rate
+
+    def log(self, level, msg, *args, sample=None, **kwargs):
+        if self.logger.isEnabledFor(level) and (sample is None or self.sampled(sample)):
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def trace(self, msg, *args, sample=None, **kwargs):
+        """A TRACE record, sampled at TRACE_SAMPLE_RATE unless sample= is given."""
+        if self.logger.isEnabledFor(TRACE) and self.sampled(sample):
+            self.logger.log(TRACE, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        self.logger.exception(msg, *args, **kwargs)
+
+
+def get_logger(name):
+    return Tracer(name)
+
+
+def current_trace_id():
+    return g.get('trace_id') if has_request_context() else None
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = current_trace_id() or '-'
+        return True
+
+
+def parse_levels(value):
+    """LOG_LEVELS as a dict, from a dict or a "module=LEVEL,..." string."""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return dict(value)
+    levels = {}
+    for item in value.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip()
+    return levels
+
+
+def _level(name):
+    level = logging.getLevelName(str(name).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level {name!r}")
+    return level
+
+
+def init_app(app):
+    global _sample_rate
+
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
+    app.config.setdefault('LOG_LEVELS', os.environ.get('LOG_LEVELS', ''))
+    app.config.setdefault('LOG_FORMAT', LOG_FORMAT)
+    app.config.setdefault('TRACE_SAMPLE_RATE', 1.0)
+    _sample_rate = float(app.config['TRACE_SAMPLE_RATE'])
+
+    # Module loggers (app.routes, app.gpa, ...) propagate to the app logger
+    root = logging.getLogger('app')
+    root.setLevel(_level(app.config['LOG_LEVEL']))
+    for name, level in parse_levels(app.config['LOG_LEVELS']).items():
+        logging.getLogger(name).setLevel(_level(level))
+
+    if not any(isinstance(f, TraceIdFilter) for handler in app.logger.handlers for f in handler.filters):
+        from flask.logging import default_handler
+
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(app.config['LOG_FORMAT']))
+        handler.addFilter(TraceIdFilter())
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(handler)
+
+    @app.before_request
+    def assign_trace_id():
+        incoming = request.headers.get(TRACE_ID_HEADER, '')
+        g.trace_id = incoming if VALID_TRACE_ID.match(incoming) else uuid.uuid4().hex[:16]
+
+    @app.after_request
+    def echo_trace_id(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers[TRACE_ID_HEADER] = trace_id
+        return response
@@ -0,0 +1,107 @@
+"""Per-user data versions.
+
+User.data_version goes up by one in every transaction that changes any of the
+user's grades, semesters, settings or GPA configuration. It is bumped
+automatically: after each flush, the users owning the Grade, Semester,
+UserSettings and CustomGPA rows added, changed or deleted (and any User whose
+own columns changed) get one UPDATE ... SET data_version = data_version + 1.
+Each of those changes is also written to the change journal in the same
+flush (see app/sync.py). Code that writes these tables with Core statements
+instead of the ORM (bulk imports, restores) calls bump() and sync.journal()
+itself.
+
+The JSON API (app/api.py) derives strong ETags from the version, so a client
+revalidating unchanged data gets a 304 without anything being recomputed.
+"""
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+
+# ORM classes whose rows belong to a user through user_id
+OWNED_MODELS = ('Grade', 'Semester', 'UserSettings', 'CustomGPA')
+
+# User columns that are bookkeeping rather than the user's data
+IGNORED_USER_COLUMNS = {'data_version', 'journal_floor', 'last_seen', 'is_online', 'first_login', 'is_admin'}
+
+_installed = False
+
+
+def _changes(session):
+    """(user_id, object, op) for every owned row (or User) the flush will write."""
+    from app.models import User
+
+    changes = []
+    for obj in session.new:
+        if type(obj).__name__ in OWNED_MODELS and obj.user_id is not None:
+            changes.append((obj.user_id, obj, 'upsert'))
+    for obj in session.deleted:
+        if type(obj).__name__ in OWNED_MODELS and obj.user_id is not None:
+            changes.append((obj.user_id, obj, 'delete'))
+    for obj in session.dirty:
+        name = type(obj).__name__
+        if name in OWNED_MODELS and session.is_modified(obj, include_collections=False):
+            changes.append((obj.user_id, obj, 'upsert'))
+            # A row moved to another user leaves the old user's data
+            history = inspect(obj).attrs.user_id.history
+            changes.extend((uid, obj, 'delete') for uid in history.deleted if uid is not None)
+        elif isinstance(obj, User) and _user_data_changed(obj):
+            changes.append((obj.id, obj, 'upsert'))
+    return changes
+
+
+def _user_data_changed(user):
+    state = inspect(user)
+    for attr in state.mapper.column_attrs:
+        if attr.key in IGNORED_USER_COLUMNS:
+            continue
+        if state.attrs[attr.key].history.has_changes():
+            return True
+    return False
+
+
+def _before_flush(session, flush_context, instances):
+    session.info.setdefault('versioned_changes', []).extend(_changes(session))
+
+
+def _after_flush_postexec(session, flush_context):
+    from app import sync
+
+    changes = session.info.pop('versioned_changes', None)
+    if changes:
+        versions = bump(*{user_id for user_id, _, _ in changes}, session=session)
+        # Ids of new rows are only known now, after the INSERTs
+        entries = [(user_id, *sync.entity_key(obj), op) for user_id, obj, op in changes]
+        sync.journal(entries, versions, session=session)
+
+
+def bump(*user_ids, session=None):
+    """Increment data_version for the given users in the current transaction.
+
+    Returns {user_id: new data_version}; users that no longer exist are left out.
+    """
+    from app import db
+    from app.models import User
+
+    session = session or db.session
+    user_ids = [uid for uid in user_ids if uid is not None]
+    if not user_ids:
+        return {}
+    versions = dict(session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(data_version=User.data_version + 1)
+        .returning(User.id, User.data_version)
+        .execution_options(synchronize_session=False)
+    ).all())
+    # Loaded users would otherwise keep showing the old version
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, User) and obj.id in user_ids:
+            session.expire(obj, ['data_version'])
+    return versions
+
+
+def install():
+    global _installed
+    if not _installed:
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush_postexec', _after_flush_postexec)
+        _installed = True
@@ -2,5 +2,67 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///instance/grades.db'
+    # Defaults to instance/grades_new.db (set in create_app)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite engine profile (see app/sqlite_profile.py): 'wal' or 'default'
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'wal')
+
+    # Logging (see app/tracing.py): app-wide level, per-module levels, share of TRACE records kept
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')  # e.g. "app.gpa=TRACE,app.routes=DEBUG"
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1.0'))
+
+    # Per-request timing and SQL accounting (see app/timing.py), shown at /admin/timing
+    REQUEST_TIMING = True
+    REQUEST_TIMING_HEADER = True  # send the Server-Timing header
+    REQUEST_TIMING_SAMPLES = 500  # recent requests kept per endpoint for percentiles
+
+    # Prometheus metrics at /metrics (see app/metrics.py), off unless METRICS_ENABLED=1.
+    # Scrapes send "Authorization: Bearer <METRICS_TOKEN>"; with no token set, only
+    # local clients may scrape. With several worker processes, point METRICS_DIR at a
+    # directory shared by them (cleared on start)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 1.0  # seconds between a worker's writes to METRICS_DIR
+
+    # Check each request against its route's @query_budget (see app/query_budget.py):
+    # 'off', 'warn' (log a warning) or 'raise' (fail the request)
+    QUERY_BUDGET = os.environ.get('QUERY_BUDGET', 'off')
+
+    # Activity logging: events are queued and bulk-inserted by a background thread
+    ACTIVITY_BATCH_SIZE = 200
+    ACTIVITY_FLUSH_INTERVAL = 2.0  # seconds
+    ACTIVITY_QUEUE_SIZE = 10000
+    ACTIVITY_OVERFLOW = 'drop'  # or 'block'
+
+    # Presence: online while seen within the TTL; last_seen written at most once per interval
+    PRESENCE_TTL = 300  # seconds
+    PRESENCE_WRITE_INTERVAL = 60  # seconds
+
+    # Raw UserActivity rows older than this are rolled up by `flask compact-activity`
+    ACTIVITY_RETENTION_DAYS = 30
+    ACTIVITY_COMPACT_CHUNK = 5000
+
+    # Delta-sync journal entries older than this are dropped by `flask compact-journal`
+    JOURNAL_RETENTION_DAYS = 90
+
+    # Rendered-fragment cache (see app/fragments.py): 'lru', 'null' or a backend object
+    FRAGMENT_CACHE_BACKEND = 'lru'
+    FRAGMENT_CACHE_MAX_ENTRIES = 2000
+    FRAGMENT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    FRAGMENT_CACHE_TTL = 600  # seconds; cached forms carry a CSRF token, so keep below WTF_CSRF_TIME_LIMIT
+
+    # Admin dashboard totals are re-counted at least this often (seconds)
+    ADMIN_COUNTERS_TTL = 60
+
+    # Grade import (see app/grade_import.py): rows per executemany batch, and the most rows per file
+    IMPORT_CHUNK_SIZE = 500
+    IMPORT_MAX_ROWS = 10000
+    # Largest request body; bounds uploads (a 10,000-row import is 1-2 MiB)
+    MAX_CONTENT_LENGTH = 8 * 1024 * 1024
+
+    # Grade export (see app/grade_export.py): rows read and written per chunk
+    EXPORT_CHUNK_SIZE = 500
@@ -0,0 +1,26 @@
+"""Add user last_seen index
+
+Revision ID: 4da58e7caf58
+Revises: 7a48bac16edc
+Create Date: 2026-10-18 16:31:07.845126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4da58e7caf58'
+down_revision = '7a48bac16edc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_last_seen', ['last_seen'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_last_seen')
@@ -0,0 +1,36 @@
+"""Add start date and cumulative totals to semester GPA summaries
+
+Revision ID: 719b3c9f9f4e
+Revises: 2d5534d24618
+Create Date: 2026-10-18 11:02:17.554391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '719b3c9f9f4e'
+down_revision = '2d5534d24618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('semester_gpa_summary', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start_date', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('cum_points', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('cum_credits', sa.Float(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_semester_gpa_summary_user_order', ['user_id', 'start_date', 'semester_id'], unique=False)
+
+    # Existing summaries have no prefix sums yet; clearing the policy key makes
+    # each one rebuild (with prefix sums) the next time it is read.
+    op.execute("UPDATE gpa_summary SET policy_key = ''")
+
+
+def downgrade():
+    with op.batch_alter_table('semester_gpa_summary', schema=None) as batch_op:
+        batch_op.drop_index('ix_semester_gpa_summary_user_order')
+        batch_op.drop_column('cum_credits')
+        batch_op.drop_column('cum_points')
+        batch_op.drop_column('start_date')
@@ -0,0 +1,28 @@
+"""Add grade table sort indexes
+
+Revision ID: 7a48bac16edc
+Revises: 810b710bda86
+Create Date: 2026-10-18 16:02:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a48bac16edc'
+down_revision = '810b710bda86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.create_index('ix_grade_user_subject', ['user_id', sa.text('lower(subject)')], unique=False)
+        batch_op.create_index('ix_grade_user_grade', ['user_id', 'grade'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.drop_index('ix_grade_user_grade')
+        batch_op.drop_index('ix_grade_user_subject')